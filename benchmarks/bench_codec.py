@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Compares the encode/decode throughput and the size of the saved
+values of ``codec.TypedCodec`` and ``codec.PickleCodec``.
+
+Usage (from the root of the repository):
+
+    python benchmarks/bench_codec.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from django.conf import settings
+if not settings.configured:
+    settings.configure()
+
+from dynamicsettings import codec
+
+VALUES = [
+    (None, 'NoneType'),
+    (True, 'bool'),
+    (300, 'int'),
+    (0.25, 'float'),
+    ('/accounts/login/', 'str'),
+    (u'Dynamic settings', 'unicode'),
+    (['django.contrib.auth', 'django.contrib.admin', 'dynamicsettings'], 'list'),
+    (('en', 'de', 'zh-cn'), 'tuple'),
+    ({'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'TIMEOUT': 300,
+      'OPTIONS': {'MAX_ENTRIES': 1000}}, 'dict'),
+]
+
+NUMBER = 10000
+
+
+def bench(codec_instance):
+    encoded_values = [(codec_instance.encode(value, value_type), value_type) for value, value_type in VALUES]
+    def encode():
+        for value, value_type in VALUES:
+            codec_instance.encode(value, value_type)
+    def decode():
+        for value, value_type in encoded_values:
+            codec_instance.decode(value, value_type)
+    return {
+        'encode_per_sec': NUMBER * len(VALUES) / timeit.timeit(encode, number=NUMBER),
+        'decode_per_sec': NUMBER * len(VALUES) / timeit.timeit(decode, number=NUMBER),
+        'size': sum(len(value) for value, value_type in encoded_values),
+    }
+
+
+def main():
+    print('%-12s %15s %15s %10s' % ('codec', 'encode/s', 'decode/s', 'bytes'))
+    for name, codec_instance in (('pickle', codec.PickleCodec()), ('typed', codec.TypedCodec())):
+        result = bench(codec_instance)
+        print('%-12s %15d %15d %10d' % (name, result['encode_per_sec'], result['decode_per_sec'], result['size']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""Measures the hot paths of reading and writing the settings: ``get``
+and attribute access, ``get_float``, ``dict(keys)``, ``is_enabled``, constructing
+``DynamicSettings`` (with an empty and a filled cache and with a snapshot
+file), ``set`` and ``reset``, combining the settings with a growing number
+of settings in the database and rendering the ``dynamicsettings_index``
+view. Runs offline with an in memory SQLite database and the local-memory
+cache.
+
+Usage (from the root of the repository):
+
+    python benchmarks/bench_settings.py
+    python benchmarks/bench_settings.py --output before.json
+    python benchmarks/bench_settings.py --compare before.json
+
+With ``--output`` the results are written as JSON (together with the
+current git commit), ``--compare`` prints the relative change of every
+result compared to such a file. Use ``--max-rows`` to limit the number
+of settings in the database (defaults to 100000).
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import platform
+import subprocess
+from optparse import OptionParser
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from django.conf import settings
+if not settings.configured:
+    settings.configure(
+        DEBUG=False,
+        DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                            'OPTIONS': {'MAX_ENTRIES': 1000000}}},
+        INSTALLED_APPS=('django.contrib.auth', 'django.contrib.contenttypes',
+                        'django.contrib.sessions', 'django.contrib.admin',
+                        'dynamicsettings'),
+        ROOT_URLCONF='dynamicsettings.urls',
+        SECRET_KEY='benchmark',
+    )
+
+import django
+from django.core.cache import cache
+from django.utils import simplejson
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction
+from django.contrib.auth.models import User
+from django.test.client import Client
+
+from dynamicsettings import app_settings
+from dynamicsettings import models
+from dynamicsettings import DynamicSettings
+
+ROW_COUNTS = [10, 100, 1000, 10000, 100000]
+READ_NUMBER = 100000
+WRITE_NUMBER = 200
+CONSTRUCT_NUMBER = 20
+INDEX_NUMBER = 20
+
+#the direction in which a result is better, used by --compare
+HIGHER_IS_BETTER = ('per_sec',)
+
+
+def timed(func, number):
+    #returns the seconds needed by every single call of ``func``
+    timings = []
+    for i in xrange(number):
+        started = time.time()
+        func()
+        timings.append(time.time() - started)
+    return timings
+
+
+def summary(prefix, timings):
+    timings = sorted(timings)
+    return {
+        prefix + '.median_ms': timings[len(timings) // 2] * 1000,
+        prefix + '.p95_ms': timings[int(len(timings) * 0.95)] * 1000,
+    }
+
+
+def throughput(func, number, repeat=3):
+    #calls per second of the fastest of ``repeat`` runs, like timeit
+    best = None
+    for run in xrange(repeat):
+        started = time.time()
+        for i in xrange(number):
+            func()
+        elapsed = time.time() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return number / best
+
+
+def insert_rows(first, last):
+    #raw inserts, bulk_create is not available in every Django version
+    sql = 'INSERT INTO %s (key, scope, value, type) VALUES (%%s, %%s, %%s, %%s)' % models.Settings._meta.db_table
+    cursor = connection.cursor()
+    cursor.executemany(sql, [('BENCH_SETTING_%d' % i, '', str(i), 'int') for i in xrange(first, last)])
+    transaction.commit_unless_managed()
+
+
+def bench_reads(worker, results):
+    keys = ['BENCH_SETTING_%d' % i for i in xrange(10)]
+    results['get.per_sec'] = throughput(lambda: worker.get('BENCH_SETTING_1'), READ_NUMBER)
+    results['getattr.per_sec'] = throughput(lambda: worker.BENCH_SETTING_1, READ_NUMBER)
+    results['get_float.per_sec'] = throughput(lambda: worker.get_float('BENCH_SETTING_1'), READ_NUMBER)
+    results['dict_keys_10.per_sec'] = throughput(lambda: worker.dict(keys), READ_NUMBER // 10)
+    worker.set('BENCH_FLAG', {'enabled': True, 'percentage': 50}, 'flag')
+    results['is_enabled.per_sec'] = throughput(lambda: worker.is_enabled('BENCH_FLAG', 42), READ_NUMBER)
+
+
+def bench_construct(results):
+    def cold():
+        cache.clear()
+        DynamicSettings()
+    results.update(summary('construct_cold', timed(cold, CONSTRUCT_NUMBER)))
+    DynamicSettings()
+    results.update(summary('construct_warm', timed(DynamicSettings, CONSTRUCT_NUMBER)))
+    #the settings are read from the snapshot file instead of the cache
+    tmp_dir = tempfile.mkdtemp()
+    app_settings.DYNAMICSETTINGS_SNAPSHOT_FILE = os.path.join(tmp_dir, 'snapshot')
+    try:
+        DynamicSettings().reload_static()
+        results.update(summary('construct_file', timed(DynamicSettings, CONSTRUCT_NUMBER)))
+    finally:
+        app_settings.DYNAMICSETTINGS_SNAPSHOT_FILE = None
+        shutil.rmtree(tmp_dir)
+
+
+def bench_writes(worker, results):
+    results.update(summary('set', timed(lambda: worker.set('BENCH_SETTING_1', 42, 'int'), WRITE_NUMBER)))
+    def set_and_reset():
+        worker.set('BENCH_NEW_SETTING', 42, 'int')
+        started = time.time()
+        worker.reset('BENCH_NEW_SETTING')
+        reset_timings.append(time.time() - started)
+    reset_timings = []
+    timed(set_and_reset, WRITE_NUMBER)
+    results.update(summary('reset', reset_timings))
+
+
+def bench_rows(results, max_rows, client):
+    #the version is checked on every request, so the views are using
+    #the new settings as soon as rows were added
+    app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL = None
+    worker = DynamicSettings()
+    inserted = 10
+    for row_count in [row_count for row_count in ROW_COUNTS if row_count <= max_rows]:
+        insert_rows(inserted, row_count)
+        inserted = row_count
+        worker._bump_version()
+        prefix = 'rows_%d.' % row_count
+        results.update(summary(prefix + 'combine', timed(worker._combine_settings, 3)))
+        #the first request is loading the new version of the settings
+        url = reverse('dynamicsettings_index')
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError('Rendering %s failed with status %d.' % (url, response.status_code))
+        results.update(summary(prefix + 'index', timed(lambda: client.get(url), INDEX_NUMBER)))
+
+
+def run(max_rows):
+    call_command('syncdb', interactive=False, verbosity=0)
+    app_settings.DYNAMICSETTINGS_INCLUDE_MODULES = []
+    app_settings.DYNAMICSETTINGS_INCLUDE_SETTINGS = ['BENCH_SETTING_1', 'BENCH_NEW_SETTING', 'BENCH_FLAG']
+    cache.clear()
+    insert_rows(0, 10)
+    User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+    client = Client()
+    client.login(username='admin', password='admin')
+    results = {}
+    worker = DynamicSettings()
+    bench_reads(worker, results)
+    bench_construct(results)
+    bench_writes(worker, results)
+    bench_rows(results, max_rows, client)
+    return results
+
+
+def git_commit():
+    try:
+        process = subprocess.Popen(['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output = process.communicate()[0]
+    except OSError:
+        return None
+    return output.strip() or None
+
+
+def compare(results, path):
+    previous = simplejson.load(open(path))['results']
+    print('%-30s %15s %15s %10s' % ('benchmark', 'before', 'after', 'change'))
+    for name in sorted(results):
+        if name not in previous:
+            continue
+        before, after = previous[name], results[name]
+        #a positive change is always an improvement
+        if not before:
+            change = 0
+        elif name.endswith(HIGHER_IS_BETTER):
+            change = (after - before) / before * 100
+        else:
+            change = (before - after) / before * 100
+        print('%-30s %15.3f %15.3f %9.1f%%' % (name, before, after, change))
+
+
+def main():
+    parser = OptionParser(usage='%prog [--output FILE] [--compare FILE] [--max-rows N]')
+    parser.add_option('--output', help='write the results as JSON to FILE')
+    parser.add_option('--compare', help='compare the results with the JSON results in FILE')
+    parser.add_option('--max-rows', type='int', default=ROW_COUNTS[-1],
+                      help='the maximum number of settings in the database')
+    options, args = parser.parse_args()
+    results = run(options.max_rows)
+    for name in sorted(results):
+        print('%-30s %15.3f' % (name, results[name]))
+    if options.output:
+        output = {
+            'commit': git_commit(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'results': results,
+        }
+        output_file = open(options.output, 'w')
+        try:
+            simplejson.dump(output, output_file, indent=2, sort_keys=True)
+        finally:
+            output_file.close()
+    if options.compare:
+        compare(results, options.compare)
+
+
+if __name__ == '__main__':
+    main()
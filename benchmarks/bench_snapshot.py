@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Compares the per request cost of copying the settings defensively
+(as needed when ``settings.dict()`` returned a mutable dict) with
+sharing one frozen snapshot.
+
+Usage (from the root of the repository):
+
+    python benchmarks/bench_snapshot.py
+"""
+
+import os
+import sys
+import copy
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from django.conf import settings
+if not settings.configured:
+    settings.configure()
+
+from django.conf import global_settings
+
+from dynamicsettings.datastructures import freeze
+
+NUMBER = 2000
+
+
+def deep_size(value):
+    #approximate number of bytes allocated for ``value`` and its items
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(key) + deep_size(item) for key, item in value.iteritems())
+    elif isinstance(value, (list, tuple)):
+        size += sum(deep_size(item) for item in value)
+    return size
+
+
+def main():
+    all_settings = dict((key, value) for key, value in global_settings.__dict__.iteritems() if key.isupper())
+    snapshot = freeze(all_settings)
+    def copied_request():
+        request_settings = copy.deepcopy(all_settings)
+        return request_settings['INSTALLED_APPS']
+    def shared_request():
+        return snapshot['INSTALLED_APPS']
+    copied = timeit.timeit(copied_request, number=NUMBER) / NUMBER
+    shared = timeit.timeit(shared_request, number=NUMBER) / NUMBER
+    print('%d settings' % len(all_settings))
+    print('%-8s %15s %20s' % ('mode', 'usec/request', 'bytes/request'))
+    print('%-8s %15.2f %20d' % ('copied', copied * 1e6, deep_size(copy.deepcopy(all_settings))))
+    print('%-8s %15.2f %20d' % ('shared', shared * 1e6, 0))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,198 @@
 # -*- coding: utf-8 -*-
 
-import pickle
-import base64
+import time
+import random
+import weakref
+import threading
+from contextlib import contextmanager
 
 from django.utils.functional import LazyObject
 from django.utils import importlib
 from django.core.cache import cache
+from django.core.signals import request_started
 from django.conf import settings as django_settings
+from django.db import transaction
+from django.db.models import F
 
 from dynamicsettings import app_settings
+from dynamicsettings import broadcast
+from dynamicsettings import codec
+from dynamicsettings import flags
+from dynamicsettings import history
+from dynamicsettings import localcache
 from dynamicsettings import models
+from dynamicsettings import schemas
+from dynamicsettings import signals
+from dynamicsettings import snapshotfile
+from dynamicsettings import stats
+from dynamicsettings.datastructures import FrozenDict, PatchedRows, Snapshot, NAMESPACE_SEPARATOR, freeze, type_name
 
 ALLOWED_TYPES = ['NoneType', 'bool', 'dict', 'list', 'tuple',
-                 'float', 'int', 'unicode', 'str', 'long']
+                 'float', 'int', 'unicode', 'str', 'long', 'Flag']
+_allowed_types = frozenset(ALLOWED_TYPES)
+
+#the global and module settings do not change while the process is
+#running, so they are only combined once per process (for every list
+#of DYNAMICSETTINGS_INCLUDE_MODULES), see _get_static_settings
+_static_settings = {}
+
+#the maximum number of seconds a process is combining the settings, before
+#another process is allowed to combine them again
+REBUILD_LOCK_TIMEOUT = 30
+
+#returned by ``get`` for missing settings
+_missing = object()
+
+#the rebuilds of the settings currently running in this process, threads
+#which want to rebuild the settings at the same time wait for them instead
+#(see DynamicSettings._get_settings)
+_rebuilds = {}
+_rebuilds_lock = threading.Lock()
+
+
+class _ScopeSettings(object):
+    """The settings saved in the database for one scope (``overrides``)
+    on top of the settings of ``snapshot``, ``version`` is the version
+    of the settings when the overrides were changed last.
+    """
+    __slots__ = ('snapshot', 'version', 'overrides', 'converted', '_settings')
+    
+    def __init__(self, snapshot, version, overrides):
+        self.snapshot = snapshot
+        self.version = version
+        self.overrides = overrides
+        #the overrides converted by the typed accessors (see ``Snapshot.converted``)
+        self.converted = {}
+        self._settings = None
+    
+    def settings(self):
+        #all settings of the scope, combined when they are used first
+        if self._settings is None:
+            all_settings = dict(self.snapshot.settings)
+            all_settings.update(self.overrides)
+            self._settings = FrozenDict(all_settings)
+        return self._settings
+
+
+class ScopedSettings(object):
+    """The settings of one scope (for example a site or a tenant),
+    returned by ``DynamicSettings.for_scope``. Settings saved in the
+    database for the scope are used instead of the other settings.
+    """
+    
+    def __init__(self, dynamic_settings, scope):
+        self._dynamic_settings = dynamic_settings
+        self.scope = scope
+    
+    def get(self, key, default=None):
+        return self._dynamic_settings.get(key, default, scope=self.scope)
+    
+    def get_int(self, key, default=None):
+        return self._dynamic_settings.get_int(key, default, scope=self.scope)
+    
+    def get_float(self, key, default=None):
+        return self._dynamic_settings.get_float(key, default, scope=self.scope)
+    
+    def get_bool(self, key, default=None):
+        return self._dynamic_settings.get_bool(key, default, scope=self.scope)
+    
+    def get_str(self, key, default=None):
+        return self._dynamic_settings.get_str(key, default, scope=self.scope)
+    
+    def get_list(self, key, default=None):
+        return self._dynamic_settings.get_list(key, default, scope=self.scope)
+    
+    def get_dict(self, key, default=None):
+        return self._dynamic_settings.get_dict(key, default, scope=self.scope)
+    
+    def set(self, key, value, value_type=None, user=None):
+        return self._dynamic_settings.set(key, value, value_type, scope=self.scope, user=user)
+    
+    def reset(self, key, user=None):
+        return self._dynamic_settings.reset(key, scope=self.scope, user=user)
+    
+    def is_enabled(self, key, user=None):
+        return self._dynamic_settings.is_enabled(key, user, scope=self.scope)
+    
+    def set_many(self, mapping, value_types=None, user=None):
+        return self._dynamic_settings.set_many(mapping, value_types, scope=self.scope, user=user)
+    
+    def reset_many(self, keys, user=None):
+        return self._dynamic_settings.reset_many(keys, scope=self.scope, user=user)
+    
+    def dict(self, keys=None):
+        return self._dynamic_settings.dict(keys, scope=self.scope)
+    
+    def source(self, key):
+        return self._dynamic_settings.source(key, scope=self.scope)
+    
+    def __getattr__(self, key):
+        if key.startswith('_'):
+            raise AttributeError('\'%s\' object has no attribute \'%s\'' % (self.__class__.__name__, key))
+        value = self.get(key, _missing)
+        if value is _missing:
+            raise AttributeError('\'%s\' object has no attribute \'%s\'' % (self.__class__.__name__, key))
+        return value
+
+
+class PinnedSettings(object):
+    """The settings pinned by ``DynamicSettings.pin``, a read-only
+    mapping. Like the other reads the settings which are not decoded yet
+    are decoded when they are used, so pinning the settings (for example
+    for every request) does not decode all of them.
+    """
+    
+    def __init__(self, dynamic_settings, snapshot):
+        self._dynamic_settings = dynamic_settings
+        self._snapshot = snapshot
+    
+    def __getitem__(self, key):
+        snapshot = self._snapshot
+        if key in snapshot.pending:
+            self._dynamic_settings._fetch_settings(snapshot, [key])
+        return snapshot.settings[key]
+    
+    def get(self, key, default=None):
+        if key not in self._snapshot.sources:
+            return default
+        return self[key]
+    
+    def __contains__(self, key):
+        return key in self._snapshot.sources
+    
+    def keys(self):
+        return list(self._snapshot.sources)
+    
+    def __iter__(self):
+        return iter(self._snapshot.sources)
+    
+    def __len__(self):
+        return len(self._snapshot.sources)
+    
+    def items(self):
+        return self.dict().items()
+    
+    def values(self):
+        return self.dict().values()
+    
+    def dict(self):
+        """Returns all pinned settings as (immutable) dict, decoding
+        the settings which are not decoded yet.
+        """
+        snapshot = self._snapshot
+        if snapshot.pending:
+            self._dynamic_settings._fetch_settings(snapshot, list(snapshot.pending))
+        return snapshot.settings
+
+
+class _Rebuild(object):
+    """A rebuild of the settings running in one thread, the other
+    threads of the process are waiting for its ``result``.
+    """
+    
+    def __init__(self):
+        self.finished = threading.Event()
+        self.result = None
 
 
 #using django's lazysettings approach to load the DynamcSettings lazily, so it
@@ -21,8 +201,17 @@ ALLOWED_TYPES = ['NoneType', 'bool', 'dict', 'list', 'tuple',
 class LazyDynamicSettings(LazyObject):
     """Lazy wrapper for DynamicSettings.
     """
+    _setup_lock = threading.Lock()
+    
     def _setup(self):
-        self._wrapped = DynamicSettings()
+        #several threads may use the settings for the first time at
+        #once, but only one of them is creating the DynamicSettings
+        self._setup_lock.acquire()
+        try:
+            if not isinstance(self._wrapped, DynamicSettings):
+                self._wrapped = DynamicSettings()
+        finally:
+            self._setup_lock.release()
     
     
 class DynamicSettings(object):
@@ -34,12 +223,41 @@ class DynamicSettings(object):
     """
     
     def __init__(self):
-        self._settings_cache_key = 'dynamicsettings.settings'
-        self._settings = cache.get(self._settings_cache_key)
-        if self._settings is None:
-            self._get_settings()
+        self._settings_cache_key = 'dynamicsettings.snapshot'
+        self._version_cache_key = 'dynamicsettings.version'
+        self._index_cache_key = 'dynamicsettings.index'
+        self._lock_cache_key = 'dynamicsettings.lock'
+        self._setting_cache_key_prefix = 'dynamicsettings.setting.'
+        self._scope_cache_key_prefix = 'dynamicsettings.scope.'
+        #the current settings, always replaced as a whole (see ``Snapshot``),
+        #so readers never see half updated settings and need no lock
+        self._snapshot = None
+        self._next_version_check = 0
+        #held while this process is loading or changing the settings,
+        #readers never wait for it but keep using the current snapshot
+        self._lock = threading.RLock()
+        self._stats = stats.Stats(self.__class__)
+        #the settings fetched one by one (DYNAMICSETTINGS_CACHE_MODE 'keys') and
+        #the settings of the scopes are kept in the memory of the process for
+        #DYNAMICSETTINGS_LOCAL_CACHE_TIMEOUT seconds, in front of the cache
+        #(only for the version of the settings they were fetched for)
+        local_cache = None
+        if app_settings.DYNAMICSETTINGS_LOCAL_CACHE_TIMEOUT:
+            local_cache = localcache.LocalCache(app_settings.DYNAMICSETTINGS_LOCAL_CACHE_TIMEOUT,
+                                                app_settings.DYNAMICSETTINGS_LOCAL_CACHE_MAX_ENTRIES)
+        self._cache = localcache.TieredCache(local_cache, cache, self._stats)
+        #the settings of every scope used by this process (see ``_get_scope``)
+        self._scopes = {}
+        #the settings pinned by the current thread (see ``pin``)
+        self._local = threading.local()
+        if app_settings.DYNAMICSETTINGS_BROADCAST:
+            #using a weak reference, so the subscription does not keep
+            #this instance alive
+            proxy = weakref.proxy(self)
+            self._get_broadcast().subscribe(lambda version: proxy._notify_version(version))
+        self._check_version()
     
-    def get(self, key, default=None):
+    def get(self, key, default=None, scope=None):
         """Get a setting value for a partcular key (setting name).
         Works similiar to a dict's ``get`` method.
         
@@ -47,14 +265,108 @@ class DynamicSettings(object):
             - ``key``: the name of setting
             - ``default`` (optional): a default value if the setting can not be
               retrieved, defaults to ``None``
+            - ``scope`` (optional): the scope (for example a site or a tenant)
+              to get the setting for, see ``for_scope``
               
         Returns:
             - the ``value`` of the setting if exists or the value
               specified in ``default``
         """
-        return self._settings.get(key, default)
+        self._stats.incr('reads')
+        if scope is not None:
+            overrides = self._get_scope(scope).overrides
+            if key in overrides:
+                return overrides[key]
+        snapshot = self._get_read_snapshot()
+        if key in snapshot.pending:
+            self._fetch_settings(snapshot, [key])
+        return snapshot.settings.get(key, default)
+    
+    def get_int(self, key, default=None, scope=None):
+        """Get a setting converted to an ``int``, see ``get_typed``.
+        """
+        return self.get_typed(key, 'int', default, scope)
+    
+    def get_float(self, key, default=None, scope=None):
+        """Get a setting converted to a ``float``, see ``get_typed``.
+        """
+        return self.get_typed(key, 'float', default, scope)
+    
+    def get_bool(self, key, default=None, scope=None):
+        """Get a setting converted to a ``bool``, see ``get_typed``.
+        """
+        return self.get_typed(key, 'bool', default, scope)
     
-    def set(self, key, value, value_type=None):
+    def get_str(self, key, default=None, scope=None):
+        """Get a setting converted to a ``str``, see ``get_typed``.
+        """
+        return self.get_typed(key, 'str', default, scope)
+    
+    def get_list(self, key, default=None, scope=None):
+        """Get a setting converted to a ``list``, see ``get_typed``.
+        """
+        return self.get_typed(key, 'list', default, scope)
+    
+    def get_dict(self, key, default=None, scope=None):
+        """Get a setting converted to a ``dict``, see ``get_typed``.
+        """
+        return self.get_typed(key, 'dict', default, scope)
+    
+    def get_typed(self, key, value_type, default=None, scope=None):
+        """Get a setting converted to ``value_type`` and checked against
+        its schema (see ``DYNAMICSETTINGS_SCHEMAS``). Strings are parsed like
+        in the form of the admin (for example ``'True'`` for a ``bool``),
+        other values are only converted without losing anything (see
+        ``dynamicsettings.schemas.convert``). The converted value is kept
+        with the settings of the current version, so reading it again needs
+        no conversion.
+        
+        Params:
+            - ``key``: the name of setting
+            - ``value_type``: the (Python) type as string, for example ``'int'``
+            - ``default`` (optional): returned if the setting does not exist,
+              not converted
+            - ``scope`` (optional): the scope to get the setting for
+        
+        Returns:
+            - the converted value of the setting or ``default``
+        
+        Raises:
+            - ``ValueError`` if the setting can not be converted or does not
+              match its schema
+        """
+        self._stats.incr('reads')
+        #the converted values are kept by the settings they were read from
+        #(a snapshot or the settings of a scope), which are replaced when
+        #the settings are changed
+        settings_holder = None
+        if scope is not None:
+            scope_settings = self._get_scope(scope)
+            if key in scope_settings.overrides:
+                settings_holder = scope_settings
+                all_settings = scope_settings.overrides
+        if settings_holder is None:
+            settings_holder = self._get_read_snapshot()
+            if key in settings_holder.pending:
+                self._fetch_settings(settings_holder, [key])
+            all_settings = settings_holder.settings
+        converted_key = (key, value_type)
+        value = settings_holder.converted.get(converted_key, _missing)
+        if value is _missing:
+            value = all_settings.get(key, _missing)
+            if value is _missing:
+                return default
+            #the value is converted before it is checked, to the type of its
+            #schema if it has one (for example a number saved as string)
+            schema = schemas.get_schema(key)
+            schema_type = schema is not None and schema.type or value_type
+            value = schemas.validate(key, schemas.convert(value, schema_type))
+            value = freeze(schemas.convert(value, value_type))
+            self._stats.incr('conversions')
+            settings_holder.converted[converted_key] = value
+        return value
+    
+    def set(self, key, value, value_type=None, scope=None, user=None):
         """Set a new value for a setting in the database. This
         is only possible for settings defined in 
         ``app_settings.DYNAMICSETTINGS_INCLUDE_SETTINGS``.
@@ -68,6 +380,10 @@ class DynamicSettings(object):
               try to resolve the type from the value, should be a string
               representing the (Python) type of the setting (for examome
               'int', 'str', 'list' ...)
+            - ``scope`` (optional): only set the setting for this scope
+              (for example a site or a tenant), see ``for_scope``
+            - ``user`` (optional): the user who is changing the setting,
+              saved in the history of the settings
               
         Returns:
             - the new value of the setting
@@ -75,26 +391,44 @@ class DynamicSettings(object):
         Raises:
             - ``KeyError`` if the setting can not be set or is not allowed
               to set
+            - ``ValueError`` if the value does not match the schema of the
+              setting (see ``DYNAMICSETTINGS_SCHEMAS``)
         """
         if not value_type:
-            value_type = type(value).__name__
+            value_type = type_name(value)
         if self.can_change(key):
-            dynamic_setting, is_new = models.Settings.objects.get_or_create(key=key)
-            dynamic_setting.value = base64.b64encode(pickle.dumps(value))
-            dynamic_setting.type = value_type
-            dynamic_setting.save()
-            #refresh the cache
-            self._get_settings()
+            value = self._compile_value(key, value, value_type)
+            #encoded before anything is saved, it fails for values which
+            #can not be saved
+            encoded_value = self._encode_value(value, value_type)
+            started = time.time()
+            with self._lock:
+                with transaction.commit_on_success():
+                    dynamic_setting, is_new = models.Settings.objects.get_or_create(key=key, scope=scope or '')
+                    if is_new:
+                        old_value = old_type = None
+                    else:
+                        old_value, old_type = dynamic_setting.value, dynamic_setting.type
+                    dynamic_setting.value = encoded_value
+                    dynamic_setting.type = value_type
+                    dynamic_setting.save()
+                    changes = [(key, old_value, old_type, encoded_value, value_type)]
+                    version = self._save_version(scope, changes, user)
+                #refresh the cache
+                self._update_settings(version, {key: value}, scope=scope, changes=changes)
+            self._stats.timing('write', time.time() - started)
             return True
         raise KeyError('Setting "%s" can not be set in the database. If you want to change the setting add it to DYNAMICSETTINGS_INCLUDE_SETTINGS.' % key)
         
-    def reset(self, key):
+    def reset(self, key, scope=None, user=None):
         """Reset the value of a setting saved in the database.
         Does not work for settings which are not saved in the database
         of course.
         
         Params:
             - ``key``: the name of the setting
+            - ``scope`` (optional): only reset the setting saved for this scope
+            - ``user`` (optional): the user who is resetting the setting
             
         Returns:
             - a boolean: ``True`` on success, ``False`` if the setting
@@ -102,15 +436,111 @@ class DynamicSettings(object):
             in the database)
         """
         if self.can_change(key):
-            try:
-                dynamic_setting = models.Settings.objects.get(key=key)
-                dynamic_setting.delete()
-                self._get_settings()
+            started = time.time()
+            with self._lock:
+                with transaction.commit_on_success():
+                    try:
+                        dynamic_setting = models.Settings.objects.get(key=key, scope=scope or '')
+                    except models.Settings.DoesNotExist:
+                        return False
+                    dynamic_setting.delete()
+                    changes = [(key, dynamic_setting.value, dynamic_setting.type, None, None)]
+                    version = self._save_version(scope, changes, user)
+                self._update_settings(version, {}, [key], scope, changes=changes)
+                self._stats.timing('write', time.time() - started)
                 return True
-            except models.Settings.DoesNotExist:
-                return False
     
-    def dict(self, keys=None):
+    def set_many(self, mapping, value_types=None, scope=None, user=None):
+        """Set new values for several settings in the database at once.
+        All settings are saved within one transaction and the cache
+        is refreshed only once afterwards.
+        
+        Params:
+            - ``mapping``: a dict where the key is the name of the setting
+              and the value is the new value of the setting
+            - ``value_types`` (optional): a dict where the key is the name
+              of the setting and the value its new type (as string), for
+              settings which are omitted it will try to resolve the type
+              from the value
+            - ``scope`` (optional): only set the settings for this scope
+            - ``user`` (optional): the user who is changing the settings
+              
+        Returns:
+            - ``True`` if the settings were saved (nothing is saved and
+              the version is not increased if ``mapping`` is empty)
+            
+        Raises:
+            - ``KeyError`` if one of the settings can not be set or is not allowed
+              to set, in this case none of the settings is saved
+            - ``ValueError`` if one of the values does not match the schema of
+              its setting, in this case none of the settings is saved
+        """
+        if not mapping:
+            return True
+        if value_types is None:
+            value_types = {}
+        not_allowed = [key for key in mapping if not self.can_change(key)]
+        if not_allowed:
+            raise KeyError('Settings "%s" can not be set in the database. If you want to change the settings add them to DYNAMICSETTINGS_INCLUDE_SETTINGS.' % '", "'.join(sorted(not_allowed)))
+        started = time.time()
+        rows = {}
+        values = {}
+        for key, value in mapping.iteritems():
+            value_type = value_types.get(key) or type_name(value)
+            values[key] = value = self._compile_value(key, value, value_type)
+            rows[key] = (self._encode_value(value, value_type), value_type)
+        db_scope = scope or ''
+        with self._lock:
+            with transaction.commit_on_success():
+                scope_settings = models.Settings.objects.filter(scope=db_scope)
+                existing_rows = {}
+                for key, value, value_type in scope_settings.filter(key__in=rows.keys()).values_list('key', 'value', 'type'):
+                    existing_rows[key] = (value, value_type)
+                existing_keys = set(existing_rows)
+                models.bulk_update_settings([(db_scope, key) + rows[key] for key in existing_keys])
+                new_settings = [models.Settings(key=key, scope=db_scope, value=value, type=value_type)
+                                for key, (value, value_type) in rows.iteritems()
+                                if key not in existing_keys]
+                models.bulk_create(models.Settings, new_settings)
+                changes = [(key, ) + existing_rows.get(key, (None, None)) + rows[key] for key in sorted(rows)]
+                version = self._save_version(scope, changes, user)
+            #refresh the cache
+            self._update_settings(version, values, scope=scope, changes=changes)
+        self._stats.timing('write', time.time() - started)
+        return True
+    
+    def reset_many(self, keys, scope=None, user=None):
+        """Reset the values of several settings saved in the database
+        at once. The settings are deleted within one transaction and the
+        cache is refreshed only once afterwards. Settings which are not
+        allowed to reset or are not saved in the database are ignored.
+        
+        Params:
+            - ``keys``: a list of setting names (as strings)
+            - ``scope`` (optional): only reset the settings saved for this scope
+            - ``user`` (optional): the user who is resetting the settings
+            
+        Returns:
+            - a list with the names of the settings which were reset
+        """
+        started = time.time()
+        keys = [key for key in keys if self.can_change(key)]
+        with self._lock:
+            with transaction.commit_on_success():
+                db_settings = models.Settings.objects.filter(key__in=keys, scope=scope or '')
+                changes = [(key, value, value_type, None, None)
+                           for key, value, value_type in db_settings.values_list('key', 'value', 'type')]
+                reset_keys = [change[0] for change in changes]
+                if reset_keys:
+                    db_settings.delete()
+                    version = self._save_version(scope, changes, user)
+            if reset_keys:
+                #refresh the cache
+                self._update_settings(version, {}, reset_keys, scope, changes=changes)
+        self._stats.timing('write', time.time() - started)
+        return reset_keys
+    
+    def dict(self, keys=None, scope=None):
         """Returns a dict representation of the settings
         where the key is the name of the setting and the value
         is its value.
@@ -119,19 +549,397 @@ class DynamicSettings(object):
             - ``keys`` (optional):  a list of setting names (as strings)
               which should be included in the dict. If ommitted will show
               all settings.
+            - ``scope`` (optional): the scope to get the settings for
         
         Returns:
-            - a dict representing the settings
+            - a dict representing the settings, without ``keys`` the
+              returned dict is shared and can not be changed (as well as
+              the dicts and lists within the settings)
         """
+        self._stats.incr('reads')
+        if scope is not None:
+            scope_settings = self._get_scope(scope)
+            snapshot = scope_settings.snapshot
+            if snapshot.pending:
+                self._fetch_settings(snapshot, list(snapshot.pending))
+            all_settings = scope_settings.settings()
+            if keys is None:
+                return all_settings
+            return dict((key, all_settings.get(key)) for key in keys)
+        snapshot = self._get_read_snapshot()
         if keys is None:
-            return self._settings
+            if snapshot.pending:
+                self._fetch_settings(snapshot, list(snapshot.pending))
+            return snapshot.settings
+        pending = snapshot.pending.intersection(keys)
+        if pending:
+            self._fetch_settings(snapshot, pending)
         new_dict = {}
         for key in keys:
-            new_dict[key] = self.get(key)
+            new_dict[key] = snapshot.settings.get(key)
         return new_dict
     
+    def as_of(self, version=None, when=None, scope=None):
+        """Returns the settings as they were at ``version`` or at the time
+        ``when``, reconstructed from the history of the settings saved in
+        the database (the global and module settings are the current ones).
+        
+        Params:
+            - ``version`` (optional): the version of the settings
+            - ``when`` (optional): a ``datetime``, used if ``version`` is omitted
+            - ``scope`` (optional): the scope to get the settings for
+        
+        Returns:
+            - a dict where the key is the name of the setting and the
+              value is its value
+        
+        Raises:
+            - ``ValueError`` if the history does not contain the version
+        """
+        version, rows = history.rows_as_of(version, when)
+        all_settings = dict(_get_static_settings()[0])
+        scopes = ['']
+        if scope is not None:
+            scopes.append(scope)
+        for current_scope in scopes:
+            for (row_scope, key), (value, value_type) in rows.iteritems():
+                if row_scope == current_scope:
+                    all_settings[key] = freeze(self._decode_value(value, value_type))
+        return all_settings
+    
+    def restore(self, version=None, when=None, user=None):
+        """Restore the settings saved in the database (of all scopes) as
+        they were at ``version`` or at the time ``when``, for example to undo
+        changes which caused an incident. All changed settings are saved
+        within one transaction and the version is only increased once. The
+        restore is added to the history as well, so it can be undone.
+        
+        Params:
+            - ``version`` (optional): the version of the settings to restore
+            - ``when`` (optional): a ``datetime``, used if ``version`` is omitted
+            - ``user`` (optional): the user who is restoring the settings
+        
+        Returns:
+            - the new version of the settings
+        
+        Raises:
+            - ``ValueError`` if the history does not contain the version
+        """
+        started = time.time()
+        with self._lock:
+            version, rows = history.rows_as_of(version, when)
+            #the changes of every scope (see ``history.record``)
+            changes = {}
+            with transaction.commit_on_success():
+                current_rows = history.get_rows()
+                for (scope, key), current_row in current_rows.iteritems():
+                    if (scope, key) not in rows:
+                        changes.setdefault(scope, []).append((key, ) + current_row + (None, None))
+                for (scope, key), row in rows.iteritems():
+                    current_row = current_rows.get((scope, key))
+                    if current_row != row:
+                        changes.setdefault(scope, []).append((key, ) + (current_row or (None, None)) + row)
+                new_settings = []
+                updated_rows = []
+                for scope, scope_changes in changes.iteritems():
+                    removed_keys = [key for key, old_value, old_type, value, value_type in scope_changes
+                                    if value_type is None]
+                    if removed_keys:
+                        models.Settings.objects.filter(scope=scope, key__in=removed_keys).delete()
+                    for key, old_value, old_type, value, value_type in scope_changes:
+                        if old_type is None:
+                            new_settings.append(models.Settings(key=key, scope=scope, value=value, type=value_type))
+                        elif value_type is not None:
+                            updated_rows.append((scope, key, value, value_type))
+                models.bulk_update_settings(updated_rows)
+                models.bulk_create(models.Settings, new_settings)
+                if changes:
+                    new_version = self._bump_version()
+                    if app_settings.DYNAMICSETTINGS_HISTORY:
+                        history.record(new_version, changes, user)
+            if not changes:
+                return self.version()
+            changed_keys = {}
+            removed_keys = {}
+            for scope, scope_changes in changes.iteritems():
+                for key, old_value, old_type, value, value_type in scope_changes:
+                    if value_type is None:
+                        removed_keys.setdefault(scope, []).append(key)
+                    else:
+                        changed_keys.setdefault(scope, []).append(key)
+            self._publish_changes(new_version, changed_keys, removed_keys)
+        self._stats.timing('write', time.time() - started)
+        return new_version
+    
+    def load(self, records, user=None, dry_run=False, batch_size=1000, callback=None):
+        """Save many settings (of any scope) in the database at once, for
+        example the settings exported by the ``dumpdynamicsettings`` command.
+        The settings are read from ``records`` and saved in batches (so
+        ``records`` can be a generator which is reading a file) within one
+        transaction, the version is only increased once. Like ``set_many``
+        only settings which can be changed (see ``can_change``) are saved
+        and the type of a setting can not be changed (unless its value is
+        ``None``), otherwise nothing is saved.
+        
+        Params:
+            - ``records``: an iterable of tuples ``(scope, key, value, type)``,
+              the scope is ``''`` for the settings used everywhere
+            - ``user`` (optional): the user who is changing the settings
+            - ``dry_run`` (optional): if ``True`` nothing is saved, only
+              ``callback`` is called for every change
+            - ``batch_size`` (optional): the number of settings saved at once
+            - ``callback`` (optional): called for every changed setting with
+              ``scope``, ``key``, ``old_value``, ``old_type``, ``new_value``
+              and ``new_type`` (encoded values, the old ones are ``None`` for
+              new settings)
+        
+        Returns:
+            - the number of changed settings
+        
+        Raises:
+            - ``KeyError`` if one of the settings can not be set or is not
+              allowed to set
+            - ``ValueError`` if the type of one of the settings would be
+              changed or one of the values does not match the schema of its
+              setting
+        """
+        started = time.time()
+        count = 0
+        version = None
+        changed_keys = {}
+        with self._lock:
+            with transaction.commit_on_success():
+                for batch in _batches(records, batch_size):
+                    changes = self._load_batch(batch, dry_run, callback)
+                    if not changes:
+                        continue
+                    count += sum(len(scope_changes) for scope_changes in changes.itervalues())
+                    if dry_run:
+                        continue
+                    first_batch = version is None
+                    if first_batch:
+                        version = self._bump_version()
+                    #the changes of all scopes of the batch at once (see
+                    #``history.record``)
+                    if app_settings.DYNAMICSETTINGS_HISTORY:
+                        history.record(version, changes, user, checkpoint=False, first=first_batch)
+                    for scope, scope_changes in changes.iteritems():
+                        changed_keys.setdefault(scope, []).extend(change[0] for change in scope_changes)
+                if version is not None and app_settings.DYNAMICSETTINGS_HISTORY:
+                    history.save_checkpoint(version)
+            if version is not None:
+                self._publish_changes(version, changed_keys, {})
+        if version is not None:
+            self._stats.timing('write', time.time() - started)
+        return count
+    
+    def _load_batch(self, batch, dry_run, callback):
+        #save one batch of ``load``, returns the changes of every scope
+        self._check_load_batch(batch)
+        rows = {}
+        for scope, key, value, value_type in batch:
+            value = self._compile_value(key, value, value_type)
+            rows[(scope, key)] = (self._encode_value(value, value_type), value_type)
+        existing_rows = {}
+        for scope in set(scope for scope, key in rows):
+            keys = [key for row_scope, key in rows if row_scope == scope]
+            db_settings = models.Settings.objects.filter(scope=scope, key__in=keys)
+            for key, value, value_type in db_settings.values_list('key', 'value', 'type'):
+                existing_rows[(scope, key)] = (value, value_type)
+        changes = {}
+        new_settings = []
+        updated_rows = []
+        for (scope, key), row in sorted(rows.iteritems()):
+            existing_row = existing_rows.get((scope, key))
+            if existing_row == row:
+                continue
+            change = (key, ) + (existing_row or (None, None)) + row
+            changes.setdefault(scope, []).append(change)
+            if callback is not None:
+                callback(scope, *change)
+            if dry_run:
+                continue
+            if existing_row is None:
+                new_settings.append(models.Settings(key=key, scope=scope, value=row[0], type=row[1]))
+            else:
+                updated_rows.append((scope, key) + row)
+        models.bulk_update_settings(updated_rows)
+        models.bulk_create(models.Settings, new_settings)
+        return changes
+    
+    def _check_load_batch(self, batch):
+        #the settings of a batch of ``load`` are checked before anything of
+        #the batch is saved: the settings have to be allowed to change (like
+        #in ``set_many``) and keep their type (like in the form of the admin)
+        keys = set(key for scope, key, value, value_type in batch)
+        not_allowed = [key for key in keys if not self.can_change(key)]
+        if not_allowed:
+            raise KeyError('Settings "%s" can not be set in the database. If you want to change the settings add them to DYNAMICSETTINGS_INCLUDE_SETTINGS.' % '", "'.join(sorted(not_allowed)))
+        snapshot = self._get_snapshot()
+        pending = snapshot.pending.intersection(keys)
+        if pending:
+            self._fetch_settings(snapshot, pending)
+        changed_types = set()
+        for scope, key, value, value_type in batch:
+            if key in snapshot.settings:
+                original_type = type_name(snapshot.settings[key])
+                if original_type != 'NoneType' and original_type != value_type:
+                    changed_types.add(key)
+        if changed_types:
+            raise ValueError('The type of the settings "%s" can not be changed.' % '", "'.join(sorted(changed_types)))
+    
+    def is_enabled(self, key, user=None, scope=None):
+        """Check if a feature flag is enabled for a user. The flag is a
+        setting of the type ``flag`` (see ``dynamicsettings.flags.Flag``),
+        its rules are compiled when the settings are loaded, so no database
+        query is needed (except for one query per user object to get its
+        groups, only if the flag has rules for groups). Other settings are
+        used as boolean.
+        
+        Params:
+            - ``key``: the name of the flag
+            - ``user`` (optional): a ``django.contrib.auth`` user or the id
+              of a user
+            - ``scope`` (optional): the scope to get the flag for
+        
+        Returns:
+            - a boolean: ``True`` if the flag is enabled for the user,
+              ``False`` otherwise (also if the flag does not exist)
+        """
+        flag = self.get(key, None, scope)
+        if isinstance(flag, flags.Flag):
+            return flag.is_enabled(key, user)
+        return bool(flag)
+    
+    def for_scope(self, scope):
+        """Returns the settings of a scope, for example a site or a tenant.
+        The settings saved in the database for the scope are used instead
+        of the other settings (the order is: global settings, settings from
+        DYNAMICSETTINGS_INCLUDE_MODULES, settings saved in the database and
+        settings saved in the database for the scope). Example:
+        
+            site_settings = settings.for_scope('site-%d' % site.pk)
+            site_settings.set('MY_SETTING', 42)
+            my_setting = site_settings.MY_SETTING
+        
+        Params:
+            - ``scope``: the name of the scope (as string)
+        
+        Returns:
+            - a ``ScopedSettings`` instance supporting ``get``, the typed
+              accessors (like ``get_int``), ``set``,
+              ``reset``, ``set_many``, ``reset_many``, ``dict``, ``source``,
+              ``is_enabled`` and attribute access
+        """
+        return ScopedSettings(self, scope)
+    
+    def prefix(self, prefix):
+        """Returns the settings whose names start with ``prefix``. The
+        names of the settings are kept sorted, so only the matching
+        settings are looked at.
+        
+        Params:
+            - ``prefix``: the beginning of the names of the settings,
+              for example ``'FEATURE_'``
+        
+        Returns:
+            - a dict where the key is the name of the setting and the
+              value is its value
+        """
+        self._stats.incr('reads')
+        snapshot = self._get_read_snapshot()
+        keys = snapshot.keys_with_prefix(prefix)
+        pending = snapshot.pending.intersection(keys)
+        if pending:
+            self._fetch_settings(snapshot, pending)
+        all_settings = snapshot.settings
+        return dict((key, all_settings[key]) for key in keys if key in all_settings)
+    
+    def namespace(self, name):
+        """Returns the settings of a namespace: all settings whose names
+        start with ``name`` followed by an underscore, without this prefix.
+        For example ``settings.namespace('FEATURE')['SEARCH']`` is the
+        value of the setting ``FEATURE_SEARCH``.
+        
+        Params:
+            - ``name``: the name of the namespace
+        
+        Returns:
+            - a dict where the key is the name of the setting without the
+              namespace and the value is the value of the setting
+        """
+        prefix = name + NAMESPACE_SEPARATOR
+        return dict((key[len(prefix):], value) for key, value in self.prefix(prefix).iteritems())
+    
+    def keys(self, prefix=''):
+        """Returns the sorted names of all settings (or of the settings
+        whose names start with ``prefix``), without decoding their values.
+        """
+        return list(self._get_read_snapshot().keys_with_prefix(prefix))
+    
+    def namespaces(self):
+        """Returns a sorted list with the names of all namespaces (the
+        part of the names of the settings before the first underscore).
+        """
+        return self._get_read_snapshot().namespaces()
+    
+    def pin(self):
+        """Pin the current settings for the current thread: until 
+        ``unpin`` is called all reads of the current thread (via ``get``,
+        ``dict`` or attribute access) are using these settings, even if
+        the settings are changed meanwhile (only the settings changed by
+        the thread itself are used right away). Used by the
+        ``dynamicsettings.middleware.DynamicSettingsMiddleware`` to
+        use consistent settings during a whole request. Can be nested.
+        
+        Returns:
+            - the pinned settings as read-only mapping (see ``PinnedSettings``),
+              the settings are only decoded when they are used
+        """
+        snapshot = self._get_snapshot()
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(snapshot)
+        self._local.snapshot = snapshot
+        return PinnedSettings(self, snapshot)
+    
+    def unpin(self):
+        """Unpin the settings pinned last by the current thread via ``pin``.
+        """
+        stack = getattr(self._local, 'stack', None)
+        if stack:
+            stack.pop()
+        if stack:
+            self._local.snapshot = stack[-1]
+        else:
+            self._local.snapshot = None
+    
+    def unpin_all(self):
+        """Unpin all settings pinned by the current thread.
+        """
+        self._local.stack = []
+        self._local.snapshot = None
+    
+    @contextmanager
+    def pinned(self):
+        """A context manager pinning the settings (see ``pin``) within
+        a ``with`` block, for example within a celery task. The pinned
+        settings are a read-only mapping (see ``PinnedSettings``). Example:
+        
+            with settings.pinned() as pinned_settings:
+                ...
+        """
+        pinned_settings = self.pin()
+        try:
+            yield pinned_settings
+        finally:
+            self.unpin()
+    
     def is_in_db(self, key):
-        """Check if a setting for a given key is saved in the Database
+        """Check if a setting for a given key is saved in the Database.
+        Uses the source of the setting (see ``source``), so no database
+        query is needed.
         
         Params:
             - ``key``: the name of the setting
@@ -140,11 +948,28 @@ class DynamicSettings(object):
             - a boolean: ``True`` if setting is saved in the database,
               ``False`` otherwise
         """
-        try:
-            models.Settings.objects.get(key=key)
-        except models.Settings.DoesNotExist:
-            return False
-        return True
+        return self.source(key) == 'db'
+    
+    def source(self, key, scope=None):
+        """Returns where the current value of a setting for a given key
+        is coming from. The source of every setting is kept together with
+        the settings, so no database query is needed.
+        
+        Params:
+            - ``key``: the name of the setting
+            - ``scope`` (optional): the scope to get the source for
+            
+        Returns:
+            - ``'scope'`` if the setting is saved in the database for
+              ``scope``, ``'db'`` if the setting is saved in the database, the name
+              of the module (from DYNAMICSETTINGS_INCLUDE_MODULES) if the setting
+              is defined in a settings module, ``'global'`` if the setting is
+              defined in the global settings or ``None`` if the setting does
+              not exist
+        """
+        if scope is not None and key in self._get_scope(scope).overrides:
+            return 'scope'
+        return self._get_snapshot().sources.get(key)
 
     def can_change(self, key):
         """Check if a setting for a given key can be changed in the Database
@@ -163,61 +988,628 @@ class DynamicSettings(object):
             - a boolean: ``True`` if setting can be changed in the database,
               ``False`` otherwise
         """
-        try:
-            setting_value = self.__getattr__(key)
-            if key in app_settings.DYNAMICSETTINGS_INCLUDE_SETTINGS:
-                return True
-        except AttributeError:
+        if key not in self._get_snapshot().sources:
             return True
-        return False
+        return key in app_settings.DYNAMICSETTINGS_INCLUDE_SETTINGS
             
-    def _get_settings(self):
-        self._settings = self._combine_settings()
-        cache.set(self._settings_cache_key , self._settings, app_settings.DYNAMICSETTINGS_CACHE_TIMEOUT)
+    def reload_static(self):
+        """Combine the global settings and the settings from the 
+        modules in DYNAMICSETTINGS_INCLUDE_MODULES again. They are
+        only combined once per process, so this is only needed if the
+        settings in these modules were changed while the process is
+        running.
+        """
+        reload_static()
+        with self._lock:
+            self._get_settings()
     
-    def _combine_settings(self):
-        all_settings = {}
-        external_modules = []
-        #first get from global settings
-        global_settings = django_settings._wrapped
-        global_settings_dict = self._filter_settings(global_settings)
-        all_settings.update(global_settings_dict)
-        #second use app specific settings
-        for module_name in app_settings.DYNAMICSETTINGS_INCLUDE_MODULES:
-            settings_module = self._load_settings_module(module_name)
-            if settings_module is not None:
-                settings_dict = self._filter_settings(settings_module)
-                all_settings.update(settings_dict)
-        #and finally check within the db
-        db_settings_dict = {}
-        db_settings = models.Settings.objects.all()
-        for db_setting in db_settings:
-            db_settings_dict[db_setting.key] = pickle.loads(base64.b64decode(db_setting.value.strip()))
-        all_settings.update(db_settings_dict)
-        return all_settings
+    def stats(self):
+        """Returns the statistics of this instance as a dict which can be
+        serialized as JSON, with the following keys:
+        
+            - ``version``: the version of the settings currently used
+            - ``counters``: a dict with the number of reads (``reads``),
+              settings loaded from the cache (``cache_hits``) or from the
+              snapshot file (``file_hits``), missing (``cache_misses``) or
+              expired (``cache_stale``) in the cache, settings combined from
+              the database (``rebuilds``), decoded rows (``rows_decoded``),
+              values converted by the typed accessors (``conversions``),
+              version checks (``version_checks``) and the hits and misses
+              of the local cache (``l1_hits``, ``l1_misses``) and the Django
+              cache (``l2_hits``, ``l2_misses``)
+            - ``hit_rates``: the fraction of the entries found in the local
+              cache (``l1``) and the Django cache (``l2``), ``None`` if
+              the cache was not used yet
+            - ``timings``: histograms of the time needed to combine the
+              settings (``rebuild``) and to set or reset settings (``write``)
+        
+        Every value is also sent with the ``stats_recorded`` signal.
+        """
+        stats_dict = self._stats.as_dict()
+        stats_dict['version'] = self._snapshot and self._snapshot.version
+        counters = stats_dict['counters']
+        stats_dict['hit_rates'] = {}
+        for tier in ('l1', 'l2'):
+            hits = counters.get(tier + '_hits', 0)
+            total = hits + counters.get(tier + '_misses', 0)
+            if total:
+                stats_dict['hit_rates'][tier] = float(hits) / total
+            else:
+                stats_dict['hit_rates'][tier] = None
+        return stats_dict
     
-    def _load_settings_module(self, settings_module_string):
-        settings_module = None
+    def version(self):
+        """Returns the version of the settings currently used by
+        this process. The version is increased in the database
+        every time a setting is set or reset.
+        
+        Returns:
+            - an integer representing the version of the settings
+        """
+        return self._get_snapshot().version
+    
+    def _get_snapshot(self):
+        self._check_version()
+        return self._snapshot
+    
+    def _get_read_snapshot(self):
+        #the snapshot pinned by the current thread or the current snapshot
+        snapshot = getattr(self._local, 'snapshot', None)
+        if snapshot is None:
+            snapshot = self._get_snapshot()
+        return snapshot
+    
+    def _get_scope(self, scope):
+        #the settings of a scope are loaded once and checked again (with one
+        #request to the cache) only after the version of the settings changed,
+        #so scopes which were not changed meanwhile are not loaded again
+        snapshot = self._get_read_snapshot()
+        scope_settings = self._scopes.get(scope)
+        if scope_settings is not None and scope_settings.snapshot is snapshot:
+            return scope_settings
+        cached = self._cache.get(self._scope_cache_key_prefix + scope, snapshot.version)
+        if cached is None:
+            self._stats.incr('cache_misses')
+            overrides = self._get_scope_overrides(scope)
+            #another process may have cached newer settings meanwhile
+            self._cache.add(self._scope_cache_key_prefix + scope,
+                            {'version': snapshot.version, 'overrides': overrides},
+                            snapshot.version, self._cache_timeout())
+            scope_settings = _ScopeSettings(snapshot, snapshot.version, overrides)
+        else:
+            self._stats.incr('cache_hits')
+            if scope_settings is not None and cached['version'] == scope_settings.version:
+                overrides = scope_settings.overrides
+            else:
+                overrides = freeze(cached['overrides'])
+            scope_settings = _ScopeSettings(snapshot, cached['version'], overrides)
+        self._scopes[scope] = scope_settings
+        return scope_settings
+    
+    def _get_scope_overrides(self, scope):
+        overrides = {}
+        for db_setting in models.Settings.objects.filter(scope=scope):
+            overrides[db_setting.key] = freeze(self._decode_value(db_setting.value, db_setting.type))
+        self._stats.incr('rows_decoded', len(overrides))
+        return FrozenDict(overrides)
+    
+    def _check_version(self):
+        #compare the local version with the published version at most
+        #once per DYNAMICSETTINGS_VERSION_CHECK_INTERVAL seconds (or once
+        #per request if the interval is None) and reload the settings
+        #only if they have been changed by another process
+        now = time.time()
+        if now < self._next_version_check:
+            return
+        #only one thread is checking the version, the other threads do
+        #not wait for it but keep using the current snapshot (they only
+        #wait if there are no settings yet)
+        if not self._lock.acquire(self._snapshot is None):
+            return
+        try:
+            if now < self._next_version_check:
+                return
+            interval = app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL
+            if interval is None:
+                self._next_version_check = float('inf')
+            else:
+                self._next_version_check = now + interval
+            self._stats.incr('version_checks')
+            version = cache.get(self._version_cache_key)
+            if version is None:
+                version = self._get_db_version()
+                cache.set(self._version_cache_key, version, self._cache_timeout())
+            if self._snapshot is None or version != self._snapshot.version:
+                self._load_settings(version)
+        finally:
+            self._lock.release()
+    
+    def _load_settings(self, version):
+        if self._use_snapshot_file() and self._load_snapshot_file(version):
+            return
+        if app_settings.DYNAMICSETTINGS_CACHE_MODE == 'keys':
+            cached = cache.get(self._index_cache_key)
+        else:
+            cached = cache.get(self._settings_cache_key)
+        if cached is not None and cached['version'] == version:
+            if time.time() < cached['expires']:
+                self._stats.incr('cache_hits')
+                self._use_cached_settings(cached)
+                return
+            self._stats.incr('cache_stale')
+        else:
+            self._stats.incr('cache_misses')
+            cached = None
+        #the settings are expired or outdated: only one process is
+        #combining the settings again, the others are using the expired
+        #settings (or their own settings) until the new ones are published
+        if cache.add(self._lock_cache_key, True, REBUILD_LOCK_TIMEOUT):
+            try:
+                self._get_settings(version)
+            finally:
+                cache.delete(self._lock_cache_key)
+        elif cached is not None:
+            self._use_cached_settings(cached)
+        elif self._snapshot is None:
+            #no settings to use yet
+            self._get_settings(version)
+    
+    def _load_snapshot_file(self, version):
+        #the settings saved in the database written to the snapshot file by
+        #any process on this host, used instead of fetching them from the
+        #cache. The values are read from the file when they are used
+        rows = self._get_snapshot_file().read(version)
+        if rows is None or time.time() >= rows.expires:
+            return False
+        self._stats.incr('file_hits')
+        static_settings, static_sources = _get_static_settings()
+        all_settings = dict(static_settings)
+        sources = dict(static_sources)
+        for key in rows:
+            all_settings.pop(key, None)
+        sources.update(dict.fromkeys(rows, 'db'))
+        self._snapshot = Snapshot(version, FrozenDict(all_settings), sources, set(rows), rows)
+        return True
+    
+    def _use_snapshot_file(self):
+        #the snapshot file contains the encoded values, so it is only used
+        #with the TypedCodec (other codecs may save code, like pickles)
+        return bool(app_settings.DYNAMICSETTINGS_SNAPSHOT_FILE) and \
+            isinstance(codec.get_codec(app_settings.DYNAMICSETTINGS_CODEC), codec.TypedCodec)
+    
+    def _get_snapshot_file(self):
+        return snapshotfile.get_snapshot_file(app_settings.DYNAMICSETTINGS_SNAPSHOT_FILE)
+    
+    def _use_cached_settings(self, cached):
+        if app_settings.DYNAMICSETTINGS_CACHE_MODE == 'keys':
+            #only load the names of the settings saved in the database,
+            #their values are fetched from the cache when they are used
+            static_settings, static_sources = _get_static_settings()
+            sources = dict(static_sources)
+            sources.update(dict.fromkeys(cached['keys'], 'db'))
+            self._snapshot = Snapshot(cached['version'], FrozenDict(static_settings),
+                                      sources, set(cached['keys']))
+        else:
+            #settings cached by earlier versions have no ``raw`` settings
+            raw = cached.get('raw', {})
+            all_settings = freeze(cached['settings'])
+            self._snapshot = Snapshot(cached['version'], all_settings, cached['sources'],
+                                      _undecoded_keys(all_settings, raw), raw)
+    
+    def _notify_version(self, version):
+        #called by the broadcast backend when a new version was published,
+        #the version is checked (and the settings reloaded) on the next read
+        snapshot = self._snapshot
+        if snapshot is None or version != snapshot.version:
+            self._next_version_check = 0
+    
+    def _get_broadcast(self):
+        return broadcast.get_broadcast(app_settings.DYNAMICSETTINGS_BROADCAST,
+                                       app_settings.DYNAMICSETTINGS_BROADCAST_OPTIONS)
+    
+    def _cache_timeout(self):
+        #the timeout is randomly shortened (by up to DYNAMICSETTINGS_CACHE_JITTER),
+        #so the settings cached by different processes do not expire at the same time
+        timeout = app_settings.DYNAMICSETTINGS_CACHE_TIMEOUT
+        return int(timeout - timeout * app_settings.DYNAMICSETTINGS_CACHE_JITTER * random.random())
+    
+    def _fetch_settings(self, snapshot, keys):
+        #decode the settings saved in the database which are only kept
+        #encoded (see ``Snapshot.raw``) and fetch the values of the other
+        #settings with one request to the cache, settings missing in the
+        #cache are taken from the database
+        fetched_settings = {}
+        cache_keys = {}
+        for key in keys:
+            if key in snapshot.raw:
+                value, value_type = snapshot.raw[key]
+                fetched_settings[key] = freeze(self._decode_value(value, value_type))
+            else:
+                cache_keys[self._setting_cache_key_prefix + key] = key
+        if fetched_settings:
+            self._stats.incr('rows_decoded', len(fetched_settings))
+        missing_keys = ()
+        if cache_keys:
+            cached_settings = {}
+            for cache_key, value in self._cache.get_many(cache_keys.keys(), snapshot.version).iteritems():
+                cached_settings[cache_keys[cache_key]] = value
+            self._stats.incr('cache_hits', len(cached_settings))
+            missing_keys = [key for key in cache_keys.itervalues() if key not in cached_settings]
+            fetched_settings.update(cached_settings)
+        if missing_keys:
+            self._stats.incr('cache_misses', len(missing_keys))
+            db_settings_dict = {}
+            for db_setting in models.Settings.objects.filter(key__in=missing_keys, scope=''):
+                db_settings_dict[db_setting.key] = freeze(self._decode_value(db_setting.value, db_setting.type))
+            self._stats.incr('rows_decoded', len(db_settings_dict))
+            self._cache_settings(db_settings_dict, snapshot.version)
+            fetched_settings.update(db_settings_dict)
+        #the fetched settings were not visible before, so the frozen
+        #settings can be updated in place (every instance has its own
+        #settings, see ``_get_settings``). The values are added before
+        #the keys are removed from ``pending``, so other threads never
+        #miss a setting (at most they fetch it once more)
+        dict.update(snapshot.settings, fetched_settings)
+        snapshot.pending.difference_update(keys)
+    
+    def _cache_settings(self, settings_dict, version, timeout=None):
+        #``version`` is the version of the settings the values belong to
+        #(see ``localcache.TieredCache``)
+        if timeout is None:
+            timeout = self._cache_timeout() + app_settings.DYNAMICSETTINGS_CACHE_STALE_TIMEOUT
+        self._cache.set_many(dict((self._setting_cache_key_prefix + key, value)
+                                  for key, value in settings_dict.iteritems()),
+                             version, timeout)
+    
+    def _get_db_version(self):
         try:
-            settings_module = importlib.import_module(settings_module_string)
-        except ImportError:
-            pass
-        return settings_module
-        
-    def _filter_settings(self, settings_module):
-        settings = {}
-        for setting_key, setting_value in settings_module.__dict__.iteritems():
-            #ignore private settings and check if setting is simple type
-            if type(setting_value).__name__ in ALLOWED_TYPES\
-            and not setting_key.startswith('__') and setting_key.isupper():
-               settings[setting_key] = setting_value
-        return settings
+            return models.Version.objects.get(pk=1).version
+        except models.Version.DoesNotExist:
+            return 0
+    
+    def _encode_value(self, value, value_type):
+        return codec.get_codec(app_settings.DYNAMICSETTINGS_CODEC).encode(value, value_type)
+    
+    def _compile_value(self, key, value, value_type):
+        #flags are kept compiled within the settings, all values are
+        #checked against the schema of their setting before they are saved
+        if value_type == 'flag' and not isinstance(value, flags.Flag):
+            value = flags.Flag(value)
+        return schemas.validate(key, value)
+    
+    def _decode_value(self, value, value_type):
+        return codec.get_codec(app_settings.DYNAMICSETTINGS_CODEC).decode(value, value_type)
+    
+    def _bump_version(self):
+        updated = models.Version.objects.filter(pk=1).update(version=F('version') + 1)
+        if not updated:
+            models.Version.objects.get_or_create(pk=1, defaults={'version': 1})
+        return self._get_db_version()
+    
+    def _save_version(self, scope, changes, user):
+        #increase the version and add the changed rows to the history (see
+        #``history.record``), called within the transaction saving the rows
+        #so the rows, the version and the history are saved together
+        version = self._bump_version()
+        if changes and app_settings.DYNAMICSETTINGS_HISTORY:
+            history.record(version, {scope or '': changes}, user)
+        return version
+    
+    def _update_settings(self, version, changed, removed=(), scope=None, changes=None):
+        #patch the changed settings into the current settings instead
+        #of combining all settings again. This is only possible if no
+        #other process changed the settings since they were loaded,
+        #otherwise the changes of the other process would get lost.
+        #Settings of a scope are kept apart, only the settings of the
+        #changed scope are loaded again. ``version`` is the version
+        #returned by ``_save_version`` for the changed rows ``changes``.
+        snapshot = self._snapshot
+        if snapshot is None or version != snapshot.version + 1 or (scope is None and changes is None):
+            self._get_settings(version)
+        elif scope is None:
+            changed_rows = dict((key, (value, value_type))
+                                for key, old_value, old_type, value, value_type in changes
+                                if value_type is not None)
+            self._patch_settings(snapshot, version, changed, removed, changed_rows)
+        else:
+            self._patch_settings(snapshot, version, {}, (), {})
+        snapshot = self._snapshot
+        if scope is not None:
+            self._refresh_scope(scope, snapshot)
+        else:
+            self._patch_pinned(snapshot, list(changed) + list(removed))
+        signals.settings_changed.send(sender=self.__class__, version=snapshot.version,
+                                      changed=list(changed), removed=list(removed), scope=scope)
+    
+    def _publish_changes(self, version, changed, removed):
+        #combine all settings again after many settings of several scopes
+        #were changed, ``changed`` and ``removed`` are dicts with the names
+        #of the changed settings of every scope
+        self._get_settings(version)
+        snapshot = self._snapshot
+        scopes = sorted(set(changed) | set(removed))
+        for scope in scopes:
+            if scope:
+                self._refresh_scope(scope, snapshot)
+        self._patch_pinned(snapshot, list(changed.get('', [])) + list(removed.get('', [])))
+        for scope in scopes:
+            signals.settings_changed.send(sender=self.__class__, version=snapshot.version,
+                                          changed=changed.get(scope, []), removed=removed.get(scope, []),
+                                          scope=scope or None)
+    
+    def _refresh_scope(self, scope, snapshot):
+        #load the settings of a changed scope and publish them to the cache
+        overrides = self._get_scope_overrides(scope)
+        self._cache.set(self._scope_cache_key_prefix + scope,
+                        {'version': snapshot.version, 'overrides': overrides},
+                        snapshot.version, self._cache_timeout())
+        self._scopes[scope] = _ScopeSettings(snapshot, snapshot.version, overrides)
+    
+    def _patch_pinned(self, snapshot, keys):
+        #the settings changed by this thread (``keys``) are patched into the
+        #settings pinned by it, so the thread is able to read its own changes
+        #but does not use the changes of other processes until it unpins
+        #the settings. The values are taken from the new ``snapshot``
+        stack = getattr(self._local, 'stack', None)
+        if not stack or not keys:
+            return
+        pending = snapshot.pending.intersection(keys)
+        if pending:
+            self._fetch_settings(snapshot, pending)
+        patched = {}
+        for pinned in stack:
+            if id(pinned) not in patched:
+                all_settings = dict(pinned.settings)
+                sources = dict(pinned.sources)
+                for key in keys:
+                    if key in snapshot.sources:
+                        all_settings[key] = snapshot.settings[key]
+                        sources[key] = snapshot.sources[key]
+                    else:
+                        all_settings.pop(key, None)
+                        sources.pop(key, None)
+                patched[id(pinned)] = Snapshot(pinned.version, FrozenDict(all_settings), sources,
+                                               pinned.pending.difference(keys), pinned.raw)
+        stack[:] = [patched[id(pinned)] for pinned in stack]
+        self._local.snapshot = stack[-1]
+    
+    def _patch_settings(self, snapshot, version, changed, removed, changed_rows):
+        #the encoded settings are kept (``changed_rows`` are the encoded
+        #values of ``changed``) without copying the unchanged rows (which
+        #may be in the shared snapshot file), settings which are not decoded
+        #yet are decoded when they are used
+        raw = snapshot.raw
+        pending = [key for key in snapshot.pending if key not in raw]
+        if pending:
+            self._fetch_settings(snapshot, pending)
+        raw = PatchedRows(raw, changed_rows, removed)
+        static_settings, static_sources = _get_static_settings()
+        all_settings = dict(snapshot.settings)
+        for key, value in changed.iteritems():
+            all_settings[key] = freeze(value)
+        sources = dict(snapshot.sources)
+        sources.update(dict.fromkeys(changed, 'db'))
+        for key in removed:
+            if key in static_settings:
+                all_settings[key] = static_settings[key]
+                sources[key] = static_sources[key]
+            else:
+                all_settings.pop(key, None)
+                sources.pop(key, None)
+        self._publish_settings(version, FrozenDict(all_settings), sources, changed, removed, raw)
+    
+    def _get_settings(self, min_version=None):
+        #only one thread of the process is combining the settings, other
+        #threads (of any instance) wanting to combine them at the same time
+        #wait for it and use its result, unless the result is older than
+        #``min_version`` (the version which has to be included)
+        rebuild_key = (self.__class__, tuple(app_settings.DYNAMICSETTINGS_INCLUDE_MODULES))
+        while True:
+            _rebuilds_lock.acquire()
+            try:
+                rebuild = _rebuilds.get(rebuild_key)
+                is_running = rebuild is not None
+                if not is_running:
+                    rebuild = _rebuilds[rebuild_key] = _Rebuild()
+            finally:
+                _rebuilds_lock.release()
+            if not is_running:
+                try:
+                    #read the version before the settings, so a concurrent change
+                    #will always be noticed by the next version check
+                    version = self._get_db_version()
+                    started = time.time()
+                    all_settings, sources, raw = self._combine_settings()
+                    self._stats.timing('rebuild', time.time() - started)
+                    self._stats.incr('rebuilds')
+                    self._publish_settings(version, all_settings, sources, raw=raw)
+                    rebuild.result = self._snapshot
+                finally:
+                    _rebuilds_lock.acquire()
+                    try:
+                        del _rebuilds[rebuild_key]
+                    finally:
+                        _rebuilds_lock.release()
+                    rebuild.finished.set()
+                return
+            rebuild.finished.wait()
+            #the result is None if the rebuild failed
+            snapshot = rebuild.result
+            if snapshot is not None and (min_version is None or snapshot.version >= min_version):
+                #already published to the cache by the other thread. The
+                #settings are copied, as the settings are decoded into the
+                #dict of the snapshot (see ``_fetch_settings``) and a dict
+                #returned by the other instance must not be changed. The
+                #pending keys are copied first, a setting decoded meanwhile
+                #is then decoded once more instead of missing
+                pending = set(snapshot.pending)
+                self._snapshot = Snapshot(snapshot.version, FrozenDict(snapshot.settings),
+                                          snapshot.sources, pending, snapshot.raw)
+                return
+    
+    def _publish_settings(self, version, all_settings, sources, changed=None, removed=(), raw=None):
+        #``changed`` and ``removed`` are the settings changed in the
+        #database, if ``changed`` is None all settings are published.
+        #``raw`` are the encoded settings saved in the database, the ones
+        #missing in ``all_settings`` are decoded when they are used.
+        #The new snapshot replaces the current one with one assignment.
+        if raw is None:
+            raw = {}
+        snapshot = Snapshot(version, all_settings, sources, _undecoded_keys(all_settings, raw), raw)
+        self._snapshot = snapshot
+        #the cached settings are expired after ``timeout`` seconds, but 
+        #kept in the cache for DYNAMICSETTINGS_CACHE_STALE_TIMEOUT seconds
+        #longer to be used while they are combined again
+        timeout = self._cache_timeout()
+        expires = time.time() + timeout
+        stale_timeout = timeout + app_settings.DYNAMICSETTINGS_CACHE_STALE_TIMEOUT
+        if app_settings.DYNAMICSETTINGS_CACHE_MODE == 'keys':
+            db_keys = [key for key, source in sources.iteritems() if source == 'db']
+            if changed is None:
+                changed = db_keys
+            #every setting is cached on its own, so it has to be decoded
+            undecoded = [key for key in changed if key in snapshot.pending]
+            if undecoded:
+                self._fetch_settings(snapshot, undecoded)
+            self._cache_settings(dict((key, all_settings[key]) for key in changed), version, stale_timeout)
+            if removed:
+                self._cache.delete_many([self._setting_cache_key_prefix + key for key in removed])
+            index = {'version': version, 'keys': db_keys, 'expires': expires}
+            cache.set(self._index_cache_key, index, stale_timeout)
+        else:
+            cached = {'version': version, 'settings': all_settings, 'sources': sources,
+                      'raw': raw, 'expires': expires}
+            cache.set(self._settings_cache_key, cached, stale_timeout)
+        #the file needs the encoded values of all settings saved in the
+        #database (they are missing if the settings were fetched one by
+        #one from the cache, with DYNAMICSETTINGS_CACHE_MODE 'keys')
+        if self._use_snapshot_file() and \
+        all(key in raw for key, source in sources.iteritems() if source == 'db'):
+            self._get_snapshot_file().write(version, expires, raw)
+        cache.set(self._version_cache_key, version, timeout)
+    
+    def _combine_settings(self):
+        #global and app specific settings
+        static_settings, static_sources = _get_static_settings()
+        all_settings = dict(static_settings)
+        sources = dict(static_sources)
+        #and finally check within the db, the settings saved in the
+        #db are only decoded when they are used (see ``_fetch_settings``)
+        raw = {}
+        db_settings = models.Settings.objects.filter(scope='').values_list('key', 'value', 'type')
+        for key, value, value_type in db_settings:
+            raw[key] = (value, value_type)
+            all_settings.pop(key, None)
+        sources.update(dict.fromkeys(raw, 'db'))
+        return FrozenDict(all_settings), sources, raw
     
     def __getattr__(self, key):
-        if key not in self._settings:
+        if key.startswith('_'):
+            raise AttributeError('\'%s\' object has no attribute \'%s\'' % (self.__class__.__name__, key))
+        self._stats.incr('reads')
+        snapshot = self._get_read_snapshot()
+        if key in snapshot.pending:
+            self._fetch_settings(snapshot, [key])
+        all_settings = snapshot.settings
+        if key not in all_settings:
             raise AttributeError('\'%s\' object has no attribute \'%s\'' % (self.__class__.__name__, key))
-        return self._settings[key]
+        return all_settings[key]
 
  
 settings = LazyDynamicSettings()
 
+
+def _get_static_settings():
+    #returns the global and module settings and the source of every
+    #setting, both combined only once per process
+    modules = tuple(app_settings.DYNAMICSETTINGS_INCLUDE_MODULES)
+    if modules not in _static_settings:
+        static_settings = {}
+        static_sources = {}
+        #first get from global settings
+        global_settings = django_settings._wrapped
+        global_settings_dict = _filter_settings(global_settings)
+        static_settings.update(global_settings_dict)
+        static_sources.update(dict.fromkeys(global_settings_dict, 'global'))
+        #second use app specific settings
+        for module_name in modules:
+            settings_module = _load_settings_module(module_name)
+            if settings_module is not None:
+                settings_dict = _filter_settings(settings_module)
+                static_settings.update(settings_dict)
+                static_sources.update(dict.fromkeys(settings_dict, module_name))
+        _static_settings[modules] = (freeze(static_settings), static_sources)
+    return _static_settings[modules]
+
+
+def _load_settings_module(settings_module_string):
+    settings_module = None
+    try:
+        settings_module = importlib.import_module(settings_module_string)
+    except ImportError:
+        pass
+    return settings_module
+
+
+def _filter_settings(settings_module):
+    settings = {}
+    for setting_key, setting_value in settings_module.__dict__.iteritems():
+        #ignore private settings and check if setting is simple type
+        if setting_key.isupper() and not setting_key.startswith('__')\
+        and type(setting_value).__name__ in _allowed_types:
+            settings[setting_key] = setting_value
+    return settings
+
+
+def _undecoded_keys(all_settings, raw):
+    #the names of the encoded settings (see ``Snapshot.raw``) which are
+    #not decoded in ``all_settings`` yet
+    return set(key for key in raw if key not in all_settings)
+
+
+def _batches(iterable, size):
+    #splits ``iterable`` into lists of at most ``size`` items
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def reload_static():
+    """Forget the combined global and module settings of this
+    process, they are combined again when they are used next time.
+    Use ``settings.reload_static()`` to combine them immediately.
+    """
+    _static_settings.clear()
+
+
+def warm_up():
+    """Combine the global and module settings of this process, so
+    the first request does not have to do it. Does not access the
+    database or the cache.
+    """
+    _get_static_settings()
+
+
+def _check_version_on_request(sender, **kwargs):
+    #with DYNAMICSETTINGS_VERSION_CHECK_INTERVAL set to None the version
+    #is compared once at the beginning of every request
+    if app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL is None\
+    and isinstance(settings._wrapped, DynamicSettings):
+        settings._wrapped._next_version_check = 0
+
+request_started.connect(_check_version_on_request, dispatch_uid='dynamicsettings.check_version')
+
+
+def _broadcast_version(sender, version, **kwargs):
+    #notify all other processes about the new version
+    if app_settings.DYNAMICSETTINGS_BROADCAST:
+        broadcast.get_broadcast(app_settings.DYNAMICSETTINGS_BROADCAST,
+                                app_settings.DYNAMICSETTINGS_BROADCAST_OPTIONS).publish(version)
+
+signals.settings_changed.connect(_broadcast_version, dispatch_uid='dynamicsettings.broadcast_version')
+
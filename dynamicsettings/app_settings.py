@@ -40,3 +40,180 @@ available it will raise an exception.
 DYNAMICSETTINGS_INCLUDE_SETTINGS = getattr(settings, 'DYNAMICSETTINGS_INCLUDE_SETTINGS', [])
 
 DYNAMICSETTINGS_CACHE_TIMEOUT = getattr(settings, 'DYNAMICSETTINGS_CACHE_TIMEOUT', 300)
+
+"""Example:
+
+``DYNAMICSETTINGS_LOCAL_CACHE_TIMEOUT = 5``
+``DYNAMICSETTINGS_LOCAL_CACHE_MAX_ENTRIES = 1000``
+
+*Notes*:
+
+- the number of seconds the settings fetched from the cache are kept in
+  the memory of the process (only used for the settings of scopes and
+  with DYNAMICSETTINGS_CACHE_MODE 'keys', all other settings are kept by
+  every process until their version changes), ``0`` (the default) keeps
+  nothing in the memory of the process
+- the settings are only used for the version of the settings they were
+  fetched for, settings changed by another process are fetched again as
+  soon as the new version is seen
+- DYNAMICSETTINGS_LOCAL_CACHE_MAX_ENTRIES is the maximum number of settings
+  kept in the memory of the process, if there are more the least recently
+  used settings are removed
+"""
+DYNAMICSETTINGS_LOCAL_CACHE_TIMEOUT = getattr(settings, 'DYNAMICSETTINGS_LOCAL_CACHE_TIMEOUT', 0)
+
+DYNAMICSETTINGS_LOCAL_CACHE_MAX_ENTRIES = getattr(settings, 'DYNAMICSETTINGS_LOCAL_CACHE_MAX_ENTRIES', 1000)
+
+"""Example:
+
+``DYNAMICSETTINGS_CACHE_STALE_TIMEOUT = 60``
+
+*Notes*:
+
+- the number of seconds expired settings are kept in the cache: while
+  one process is combining the settings again, the other processes are
+  using the expired settings instead of combining them as well
+"""
+DYNAMICSETTINGS_CACHE_STALE_TIMEOUT = getattr(settings, 'DYNAMICSETTINGS_CACHE_STALE_TIMEOUT', 300)
+
+"""Example:
+
+``DYNAMICSETTINGS_CACHE_JITTER = 0.2``
+
+*Notes*:
+
+- the timeout of the cached settings is randomly shortened by up to this
+  fraction of DYNAMICSETTINGS_CACHE_TIMEOUT, so settings cached by 
+  different processes do not expire at the same time
+"""
+DYNAMICSETTINGS_CACHE_JITTER = getattr(settings, 'DYNAMICSETTINGS_CACHE_JITTER', 0.1)
+
+"""Example:
+
+``DYNAMICSETTINGS_VERSION_CHECK_INTERVAL = 5``
+
+*Notes*:
+
+- the number of seconds between two checks if the settings were changed
+  by another process (only a small version number is fetched from the
+  cache, the settings are only reloaded if the version changed)
+- if set to ``None`` the version is checked once at the beginning of
+  every request
+"""
+DYNAMICSETTINGS_VERSION_CHECK_INTERVAL = getattr(settings, 'DYNAMICSETTINGS_VERSION_CHECK_INTERVAL', 1)
+
+"""Example:
+
+``DYNAMICSETTINGS_INDEX_PAGE_SIZE = 50``
+
+*Notes*:
+
+- the number of settings shown on one page in the admin
+"""
+DYNAMICSETTINGS_INDEX_PAGE_SIZE = getattr(settings, 'DYNAMICSETTINGS_INDEX_PAGE_SIZE', 100)
+
+"""Example:
+
+``DYNAMICSETTINGS_CODEC = 'dynamicsettings.codec.PickleCodec'``
+
+*Notes*:
+
+- the python path of the class used to encode the values of the settings
+  saved in the database
+- ``'dynamicsettings.codec.TypedCodec'`` (the default) saves simple types as
+  their string representation and lists, tuples and dicts as compact JSON
+- ``'dynamicsettings.codec.PickleCodec'`` saves base64 encoded pickles (as
+  earlier versions of *django-dynamic-settings* did)
+"""
+DYNAMICSETTINGS_CODEC = getattr(settings, 'DYNAMICSETTINGS_CODEC', 'dynamicsettings.codec.TypedCodec')
+
+"""Example:
+
+``DYNAMICSETTINGS_CACHE_MODE = 'keys'``
+
+*Notes*:
+
+- ``'snapshot'`` (the default): all settings are saved in the cache
+  under one key and loaded at once
+- ``'keys'``: only the settings saved in the database are saved in the
+  cache, each under its own key, and fetched when they are used (the
+  global and module settings are kept in the memory of every process)
+"""
+DYNAMICSETTINGS_CACHE_MODE = getattr(settings, 'DYNAMICSETTINGS_CACHE_MODE', 'snapshot')
+
+"""Example:
+
+``DYNAMICSETTINGS_BROADCAST = 'dynamicsettings.broadcast.FileBroadcast'``
+``DYNAMICSETTINGS_BROADCAST_OPTIONS = {'path': '/var/run/myproject/dynamicsettings.version'}``
+
+*Notes*:
+
+- the python path of the backend used to notify all processes immediately
+  when settings are changed, instead of waiting for the next version check
+  (see DYNAMICSETTINGS_VERSION_CHECK_INTERVAL)
+- ``'dynamicsettings.broadcast.LocalBroadcast'`` only notifies the current
+  process, ``'dynamicsettings.broadcast.FileBroadcast'`` all processes on
+  the same host
+- DYNAMICSETTINGS_BROADCAST_OPTIONS are passed as keyword arguments to the
+  backend
+"""
+DYNAMICSETTINGS_BROADCAST = getattr(settings, 'DYNAMICSETTINGS_BROADCAST', None)
+
+DYNAMICSETTINGS_BROADCAST_OPTIONS = getattr(settings, 'DYNAMICSETTINGS_BROADCAST_OPTIONS', {})
+
+"""Example:
+
+``DYNAMICSETTINGS_SNAPSHOT_FILE = '/var/run/myproject/dynamicsettings.snapshot'``
+
+*Notes*:
+
+- the path of a file the encoded settings saved in the database are
+  written to every time they are combined or changed, shared by all
+  processes on the same host (the static settings are read by every
+  process itself)
+- the processes memory-map the file and use the settings from the file
+  instead of fetching them from the cache (only the small version number
+  is fetched from the cache), the index of the file is only read again
+  if it was replaced by a new version and every value is decoded when it
+  is used
+- the file is only used with the ``TypedCodec`` (see
+  DYNAMICSETTINGS_CODEC), it contains no pickles
+- the directory of the file has to exist and be writable by all processes
+"""
+DYNAMICSETTINGS_SNAPSHOT_FILE = getattr(settings, 'DYNAMICSETTINGS_SNAPSHOT_FILE', None)
+
+"""Example:
+
+``DYNAMICSETTINGS_HISTORY = True``
+``DYNAMICSETTINGS_HISTORY_CHECKPOINT_INTERVAL = 100``
+
+*Notes*:
+
+- if ``True`` (the default) every change of a setting saved in the database
+  is added to the history of the settings (``models.SettingsChange``), used
+  by ``settings.as_of`` and ``settings.restore``
+- every DYNAMICSETTINGS_HISTORY_CHECKPOINT_INTERVAL versions all settings
+  saved in the database are saved as checkpoint, so only the changes since
+  the closest checkpoint have to be read to get the settings of a version
+"""
+DYNAMICSETTINGS_HISTORY = getattr(settings, 'DYNAMICSETTINGS_HISTORY', True)
+
+DYNAMICSETTINGS_HISTORY_CHECKPOINT_INTERVAL = getattr(settings, 'DYNAMICSETTINGS_HISTORY_CHECKPOINT_INTERVAL', 100)
+
+"""Example:
+
+``DYNAMICSETTINGS_SCHEMAS = {
+    'MAX_UPLOAD_SIZE': {'type': 'int', 'min': 1, 'max': 1024},
+    'THEME': {'type': 'str', 'choices': ['light', 'dark']},
+    'MIRRORS': {'type': 'list', 'schema': {'items': {'type': 'string'}, 'maxItems': 5}},
+}``
+
+*Notes*:
+
+- the schemas of the settings (see ``dynamicsettings.schemas.Schema``),
+  values which do not match the schema of their setting can not be saved
+  in the database and are rejected by the form in the admin
+- the schemas are compiled once and used by the typed accessors like
+  ``settings.get_int`` as well
+"""
+DYNAMICSETTINGS_SCHEMAS = getattr(settings, 'DYNAMICSETTINGS_SCHEMAS', {})
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import tempfile
+import threading
+
+from django.utils import importlib
+
+
+class BaseBroadcast(object):
+    """Base class of the backends used to notify all processes
+    immediately about a new version of the settings. Subscribers
+    are callables which are called with the new version.
+    """
+
+    def __init__(self):
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+
+    def publish(self, version):
+        """Publish a new version of the settings to all subscribers.
+        Needs to be implemented by the backends.
+        """
+        raise NotImplementedError
+
+    def subscribe(self, callback):
+        """Call ``callback`` with the new version every time a new
+        version is published. The subscription is removed as soon as
+        the callback raises a ``ReferenceError`` (for example if it is
+        using a weak reference to an object which does not exist anymore).
+        """
+        self._subscribers_lock.acquire()
+        try:
+            self._subscribers.append(callback)
+        finally:
+            self._subscribers_lock.release()
+
+    def close(self):
+        pass
+
+    def _notify(self, version):
+        self._subscribers_lock.acquire()
+        try:
+            subscribers = list(self._subscribers)
+        finally:
+            self._subscribers_lock.release()
+        for callback in subscribers:
+            try:
+                callback(version)
+            except ReferenceError:
+                self._subscribers_lock.acquire()
+                try:
+                    self._subscribers.remove(callback)
+                finally:
+                    self._subscribers_lock.release()
+
+
+class LocalBroadcast(BaseBroadcast):
+    """Notifies only the subscribers within the same process,
+    useful for threaded servers and tests.
+    """
+
+    def publish(self, version):
+        self._notify(version)
+
+
+class FileBroadcast(BaseBroadcast):
+    """Notifies all processes on the same host by writing the version
+    to a file. Every subscribing process is watching the file with a
+    background thread which is checking the file every ``poll_interval``
+    seconds (a ``stat`` call, the file is only read if it was replaced).
+
+    Params:
+        - ``path`` (optional): the path of the file, defaults to
+          ``dynamicsettings.version`` in the temp directory
+        - ``poll_interval`` (optional): the number of seconds between
+          two checks of the file, defaults to ``0.1``
+    """
+
+    def __init__(self, path=None, poll_interval=0.1):
+        super(FileBroadcast, self).__init__()
+        if path is None:
+            path = os.path.join(tempfile.gettempdir(), 'dynamicsettings.version')
+        self.path = path
+        self.poll_interval = poll_interval
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def publish(self, version):
+        #write to a temporary file first and replace the file afterwards,
+        #so subscribers never read a partially written version
+        tmp_path = '%s.%d.%d.tmp' % (self.path, os.getpid(), threading.current_thread().ident)
+        tmp_file = open(tmp_path, 'w')
+        try:
+            tmp_file.write(str(version))
+        finally:
+            tmp_file.close()
+        os.rename(tmp_path, self.path)
+
+    def subscribe(self, callback):
+        super(FileBroadcast, self).subscribe(callback)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name='dynamicsettings-broadcast')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def close(self):
+        self._stopped.set()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime, stat.st_size)
+
+    def _read(self):
+        try:
+            version_file = open(self.path)
+            try:
+                return int(version_file.read())
+            finally:
+                version_file.close()
+        except (IOError, ValueError):
+            return None
+
+    def _watch(self):
+        last_stat = self._stat()
+        while not self._stopped.is_set():
+            time.sleep(self.poll_interval)
+            stat = self._stat()
+            if stat is not None and stat != last_stat:
+                last_stat = stat
+                version = self._read()
+                if version is not None:
+                    self._notify(version)
+
+
+_broadcasts = {}
+
+def get_broadcast(broadcast_path, options=None):
+    """Returns an instance of the broadcast backend given by its
+    python path, for example ``'dynamicsettings.broadcast.FileBroadcast'``.
+    Every backend is only instantiated once (with ``options`` as
+    keyword arguments).
+    """
+    if broadcast_path not in _broadcasts:
+        module_name, class_name = broadcast_path.rsplit('.', 1)
+        module = importlib.import_module(module_name)
+        _broadcasts[broadcast_path] = getattr(module, class_name)(**(options or {}))
+    return _broadcasts[broadcast_path]
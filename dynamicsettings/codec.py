@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+import re
+import ast
+import pickle
+import base64
+
+from django.utils import importlib
+from django.utils import simplejson
+
+from dynamicsettings.flags import Flag
+
+
+class PickleCodec(object):
+    """Codec which saves the values as base64 encoded pickles.
+    Used by earlier versions of *django-dynamic-settings*, only
+    kept to convert existing values in the database (see the
+    ``convertdynamicsettings`` management command).
+    """
+
+    def encode(self, value, value_type):
+        return base64.b64encode(pickle.dumps(value))
+
+    def decode(self, value, value_type):
+        return pickle.loads(base64.b64decode(value.strip()))
+
+
+#strings which can not be saved as text (byte strings which are not
+#valid UTF-8) are saved base64 encoded with this prefix
+BYTES_PREFIX = u'dynamicsettings.base64:'
+
+_base64_re = re.compile(r'^(?:[A-Za-z0-9+/]{4})+(?:[A-Za-z0-9+/]{2}==|[A-Za-z0-9+/]{3}=)?$')
+
+#a string or unicode string pickled by the ``PickleCodec``
+_pickled_text_re = re.compile(r'^(?:S(\'.*\'|".*")|V(.*))\np\d+\n\.$', re.DOTALL)
+
+
+class TypedCodec(object):
+    """Codec which is using the type of a setting (saved in the
+    ``type`` field of ``models.Settings``) to save the value in
+    a compact and readable way: simple types are saved as their
+    string representation, lists, tuples and dicts as compact JSON.
+    Values which would be changed by JSON (for example dicts with
+    numbers as keys or tuples within lists) can not be encoded.
+    Strings and unicode strings which were saved as pickles by the
+    ``PickleCodec`` and not converted yet are still decoded (without
+    unpickling them).
+    """
+
+    def __init__(self):
+        self._encoders = {
+            'NoneType': lambda value: 'None',
+            'bool': lambda value: value and 'True' or 'False',
+            'int': str,
+            'long': str,
+            'float': repr,
+            'str': self._encode_text,
+            'unicode': self._encode_text,
+            'list': self._dumps,
+            'tuple': self._dumps,
+            'dict': self._dumps,
+            'flag': self._dump_flag,
+        }
+        self._decoders = {
+            'NoneType': lambda value: None,
+            'bool': lambda value: value == 'True',
+            'int': int,
+            'long': long,
+            'float': float,
+            'str': self._decode_str,
+            'unicode': self._decode_unicode,
+            'list': lambda value: list(simplejson.loads(value)),
+            'tuple': lambda value: tuple(simplejson.loads(value)),
+            'dict': simplejson.loads,
+            'flag': lambda value: Flag(simplejson.loads(value)),
+        }
+
+    def encode(self, value, value_type):
+        """Encode a value to its string representation.
+
+        Params:
+            - ``value``: the value of the setting
+            - ``value_type``: the (Python) type of the setting as its string
+              representation
+
+        Returns:
+            - the encoded value as string
+
+        Raises:
+            - ``ValueError`` if the value can not be encoded
+        """
+        try:
+            return self._encoders[value_type](value)
+        except KeyError:
+            raise ValueError('Settings from type "%s" can not be encoded.' % value_type)
+        except TypeError as e:
+            raise ValueError(str(e))
+
+    def decode(self, value, value_type):
+        """Decode a value from its string representation.
+
+        Params:
+            - ``value``: the encoded value as string
+            - ``value_type``: the (Python) type of the setting as its string
+              representation
+
+        Returns:
+            - the decoded value
+
+        Raises:
+            - ``ValueError`` if the value can not be decoded
+        """
+        try:
+            return self._decoders[value_type](value)
+        except KeyError:
+            raise ValueError('Settings from type "%s" can not be decoded.' % value_type)
+
+    def _dumps(self, value):
+        encoded_value = simplejson.dumps(value, separators=(',', ':'))
+        #JSON only knows lists and strings as keys of objects, so for
+        #example tuples within lists would be decoded as lists
+        if isinstance(value, tuple):
+            value = list(value)
+        if simplejson.loads(encoded_value) != value:
+            raise ValueError('The value %r can not be saved as JSON without changing it.' % (value, ))
+        return encoded_value
+
+    def _encode_text(self, value):
+        #byte strings are saved decoded from UTF-8, most databases only
+        #accept text. Other byte strings (and strings which would be
+        #mistaken for them or for pickles) are saved base64 encoded
+        if isinstance(value, unicode):
+            text = value
+        else:
+            try:
+                text = value.decode('utf-8')
+            except UnicodeDecodeError:
+                return BYTES_PREFIX + base64.b64encode(value)
+        if text.startswith(BYTES_PREFIX) or self._unpickle_text(text) is not None:
+            return BYTES_PREFIX + base64.b64encode(text.encode('utf-8'))
+        return text
+
+    def _decode_str(self, value):
+        if value.startswith(BYTES_PREFIX):
+            return base64.b64decode(value[len(BYTES_PREFIX):])
+        pickled_value = self._unpickle_text(value)
+        if pickled_value is not None:
+            value = pickled_value
+        if isinstance(value, unicode):
+            return value.encode('utf-8')
+        return value
+
+    def _decode_unicode(self, value):
+        if value.startswith(BYTES_PREFIX):
+            return base64.b64decode(value[len(BYTES_PREFIX):]).decode('utf-8')
+        pickled_value = self._unpickle_text(value)
+        if pickled_value is not None:
+            value = pickled_value
+        if isinstance(value, str):
+            return value.decode('utf-8')
+        return unicode(value)
+
+    def _unpickle_text(self, value):
+        #returns the string if ``value`` is a string pickled by the
+        #``PickleCodec``, ``None`` otherwise. The pickle is not loaded,
+        #only the string literal within it is read
+        if not _base64_re.match(value):
+            return None
+        match = _pickled_text_re.match(base64.b64decode(value))
+        if match is None:
+            return None
+        if match.group(1) is not None:
+            return ast.literal_eval(match.group(1))
+        return match.group(2).decode('raw-unicode-escape')
+
+    def _dump_flag(self, value):
+        if not isinstance(value, Flag):
+            value = Flag(value)
+        return self._dumps(value.rules)
+
+
+_codecs = {}
+
+def get_codec(codec_path):
+    """Returns an instance of the codec class given by its
+    python path, for example ``'dynamicsettings.codec.TypedCodec'``.
+    Every codec is only instantiated once.
+    """
+    if codec_path not in _codecs:
+        module_name, class_name = codec_path.rsplit('.', 1)
+        module = importlib.import_module(module_name)
+        _codecs[codec_path] = getattr(module, class_name)()
+    return _codecs[codec_path]
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+
+
+class FrozenDict(dict):
+    """A dict which can not be changed after it was created.
+    Reading is as fast as reading a normal dict, so one instance
+    can be shared by all callers (and threads) without copying it.
+    """
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('\'%s\' object does not support item assignment' % self.__class__.__name__)
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+
+class FrozenList(list):
+    """A list which can not be changed after it was created.
+    Compares equal to a normal list with the same items.
+    """
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('\'%s\' object does not support item assignment' % self.__class__.__name__)
+
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = _immutable
+    __iadd__ = __imul__ = _immutable
+    append = extend = insert = pop = remove = reverse = sort = _immutable
+
+    def __reduce__(self):
+        return (self.__class__, (list(self),))
+
+
+def freeze(value):
+    """Returns an immutable version of ``value``: dicts are converted
+    to ``FrozenDict``, lists to ``FrozenList`` and tuples are frozen
+    item by item. Nested dicts, lists and tuples are frozen as well.
+    """
+    if isinstance(value, FrozenDict) or isinstance(value, FrozenList):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.iteritems())
+    if isinstance(value, list):
+        return FrozenList(freeze(item) for item in value)
+    if isinstance(value, tuple):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+#separates the namespace of a setting from the rest of its name,
+#for example ``FEATURE_SEARCH`` is in the namespace ``FEATURE``
+NAMESPACE_SEPARATOR = '_'
+
+FROZEN_TYPE_NAMES = {
+    FrozenDict: 'dict',
+    FrozenList: 'list',
+}
+
+def type_name(value):
+    """Returns the name of the (Python) type of ``value`` as it is saved
+    in the ``type`` field of ``models.Settings``, frozen dicts and lists
+    are named like normal dicts and lists.
+    """
+    value_type = type(value)
+    return FROZEN_TYPE_NAMES.get(value_type) or value_type.__name__
+
+
+class Snapshot(object):
+    """The settings of one version together with the source of every
+    setting. A snapshot is replaced as a whole and never changed after it
+    was published (except that the values of ``pending`` settings are
+    added when they are fetched or decoded), so all threads can read it
+    without a lock.
+    """
+    __slots__ = ('version', 'settings', 'sources', 'pending', 'raw', 'converted',
+                 '_sorted_keys', '_namespaces')
+
+    def __init__(self, version, settings, sources, pending=None, raw=None):
+        self.version = version
+        self.settings = settings
+        self.sources = sources
+        #settings saved in the database which were not fetched from the
+        #cache (with DYNAMICSETTINGS_CACHE_MODE 'keys') or decoded yet
+        if pending is None:
+            pending = set()
+        self.pending = pending
+        #the encoded values and types of the settings saved in the database,
+        #they are decoded when they are used first (their names are in
+        #``pending`` until then). Never changed, so snapshots of the same
+        #version can share it.
+        if raw is None:
+            raw = {}
+        self.raw = raw
+        #the values converted by the typed accessors (like ``get_int``),
+        #a dict where the key is a tuple ``(key, value_type)``
+        self.converted = {}
+        #built when they are used first
+        self._sorted_keys = None
+        self._namespaces = None
+
+    def sorted_keys(self):
+        """Returns the sorted names of all settings of the snapshot.
+        """
+        if self._sorted_keys is None:
+            self._sorted_keys = sorted(self.sources)
+        return self._sorted_keys
+
+    def keys_with_prefix(self, prefix):
+        """Returns the sorted names of the settings starting with
+        ``prefix``, found by a binary search in the sorted names.
+        """
+        sorted_keys = self.sorted_keys()
+        start = bisect.bisect_left(sorted_keys, prefix)
+        end = start
+        while end < len(sorted_keys) and sorted_keys[end].startswith(prefix):
+            end += 1
+        return sorted_keys[start:end]
+
+    def namespaces(self):
+        """Returns a sorted list of the namespaces of the settings, the
+        part of the names before the first ``NAMESPACE_SEPARATOR``.
+        """
+        if self._namespaces is None:
+            namespaces = set()
+            for key in self.sources:
+                if NAMESPACE_SEPARATOR in key:
+                    namespaces.add(key.split(NAMESPACE_SEPARATOR, 1)[0])
+            self._namespaces = sorted(namespaces)
+        return self._namespaces
+
+
+class PatchedRows(object):
+    """The encoded settings of a ``Snapshot`` (see ``Snapshot.raw``) with
+    some rows changed or removed, a read-only mapping which keeps the other
+    rows where they are (for example in the memory-mapped snapshot file,
+    see ``dynamicsettings.snapshotfile.Rows``) instead of copying them.
+    Patching the result again keeps the same ``rows``. Pickled as a dict.
+
+    Params:
+        - ``rows``: the encoded settings, a mapping where the key is the
+          name of the setting and the value a tuple ``(value, type)``
+        - ``changed``: a dict with the changed rows (in the same format)
+        - ``removed``: the names of the removed settings
+    """
+    __slots__ = ('_rows', '_changed', '_removed')
+
+    def __init__(self, rows, changed, removed=()):
+        removed = set(removed)
+        if isinstance(rows, PatchedRows):
+            #only the changes are combined
+            previous_changed = dict(rows._changed)
+            for key in removed:
+                previous_changed.pop(key, None)
+            previous_changed.update(changed)
+            changed = previous_changed
+            removed = rows._removed.union(removed)
+            rows = rows._rows
+        self._rows = rows
+        self._changed = changed
+        self._removed = frozenset(key for key in removed if key not in changed)
+
+    def __getitem__(self, key):
+        if key in self._changed:
+            return self._changed[key]
+        if key in self._removed:
+            raise KeyError(key)
+        return self._rows[key]
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        return self[key]
+
+    def __contains__(self, key):
+        return key in self._changed or (key not in self._removed and key in self._rows)
+
+    def __iter__(self):
+        for key in self._changed:
+            yield key
+        for key in self._rows:
+            if key not in self._changed and key not in self._removed:
+                yield key
+
+    def keys(self):
+        return list(self)
+
+    def iteritems(self):
+        for key in self:
+            yield key, self[key]
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def __reduce__(self):
+        return (dict, (dict(self.iteritems()), ))
+
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import zlib
+
+from dynamicsettings.datastructures import FROZEN_TYPE_NAMES
+
+RULES = ('enabled', 'percentage', 'users', 'groups')
+
+
+class Flag(object):
+    """A feature flag, saved as setting of the type ``flag``. The rules
+    of the flag are a dict with the following (optional) keys:
+
+        - ``enabled``: if ``False`` the flag is disabled for everybody,
+          if ``True`` and there are no other rules it is enabled for
+          everybody, defaults to ``False``
+        - ``percentage``: the flag is enabled for this percentage of the
+          users (0 to 100), every user is always in the same bucket
+        - ``users``: a list of user names or ids the flag is enabled for
+        - ``groups``: a list of names of groups the flag is enabled for
+
+    The rules are compiled once when the flag is loaded, so checking
+    a flag needs only a few lookups.
+
+    Params:
+        - ``rules``: the rules of the flag as dict
+
+    Raises:
+        - ``ValueError`` if the rules are not valid
+    """
+    __slots__ = ('rules', 'enabled', 'everybody', 'percentage', 'users', 'groups')
+
+    def __init__(self, rules):
+        if not isinstance(rules, dict):
+            raise ValueError('The rules of a flag must be a dict.')
+        unknown = [name for name in rules if name not in RULES]
+        if unknown:
+            raise ValueError('Unknown rules of a flag: %s.' % ', '.join(sorted(unknown)))
+        percentage = rules.get('percentage')
+        if percentage is not None:
+            if isinstance(percentage, bool) or not isinstance(percentage, (int, long, float))\
+            or not 0 <= percentage <= 100:
+                raise ValueError('The percentage of a flag must be a number between 0 and 100.')
+        for name in ('users', 'groups'):
+            if not isinstance(rules.get(name, []), (list, tuple)):
+                raise ValueError('The %s of a flag must be a list.' % name)
+        self.rules = dict(rules)
+        self.enabled = bool(rules.get('enabled', False))
+        self.percentage = percentage
+        self.users = frozenset(unicode(user) for user in rules.get('users', ()))
+        self.groups = frozenset(unicode(group) for group in rules.get('groups', ()))
+        self.everybody = percentage is None and not self.users and not self.groups
+
+    def is_enabled(self, name, user=None):
+        """Check if the flag is enabled for a user.
+
+        Params:
+            - ``name``: the name of the flag, used to put the users of
+              every flag into different percentage buckets
+            - ``user`` (optional): a ``django.contrib.auth`` user or the
+              id of a user (as string or number)
+
+        Returns:
+            - a boolean: ``True`` if the flag is enabled for the user,
+              ``False`` otherwise
+        """
+        if not self.enabled:
+            return False
+        if self.everybody:
+            return True
+        if user is None or getattr(user, 'is_anonymous', lambda: False)():
+            return self.percentage == 100
+        if hasattr(user, 'pk'):
+            user_id = unicode(user.pk)
+            if user_id in self.users or user.username in self.users:
+                return True
+        else:
+            user_id = unicode(user)
+            if user_id in self.users:
+                return True
+        if self.percentage is not None and bucket(name, user_id) < self.percentage:
+            return True
+        if self.groups and hasattr(user, 'groups'):
+            return not self.groups.isdisjoint(user_groups(user))
+        return False
+
+    def __reduce__(self):
+        return (self.__class__, (self.rules,))
+
+    def __eq__(self, other):
+        return isinstance(other, Flag) and self.rules == other.rules
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'Flag(%r)' % self.rules
+
+
+FROZEN_TYPE_NAMES[Flag] = 'flag'
+
+
+def bucket(name, user_id):
+    """Returns the percentage bucket (0 to 99) of a user for the flag
+    ``name``. The bucket is the same in every process and only depends
+    on the name of the flag and the id of the user.
+    """
+    return (zlib.crc32(('%s:%s' % (name, user_id)).encode('utf-8')) & 0xffffffff) % 100
+
+
+def user_groups(user):
+    #the names of the groups of a user, only queried once per user object
+    groups = getattr(user, '_dynamicsettings_groups', None)
+    if groups is None:
+        groups = frozenset(user.groups.values_list('name', flat=True))
+        user._dynamicsettings_groups = groups
+    return groups
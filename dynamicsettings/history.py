@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+from django.utils import simplejson
+
+from dynamicsettings import app_settings
+from dynamicsettings import models
+
+
+def get_rows():
+    """Returns the settings currently saved in the database (of all scopes)
+    as a dict where the key is a tuple ``(scope, key)`` and the value a
+    tuple ``(value, type)`` with the encoded value.
+    """
+    rows = {}
+    for scope, key, value, value_type in models.Settings.objects.values_list('scope', 'key', 'value', 'type'):
+        rows[(scope, key)] = (value, value_type)
+    return rows
+
+
+def record(version, changes, user=None, checkpoint=True, first=True):
+    """Add the changes of the settings which resulted in ``version`` to
+    the history. Every ``DYNAMICSETTINGS_HISTORY_CHECKPOINT_INTERVAL``
+    versions all settings are saved as checkpoint, so the settings of a
+    version can be reconstructed without reading the whole history.
+
+    Params:
+        - ``version``: the version of the settings after the changes
+        - ``changes``: a dict where the key is the scope of the changed
+          settings (``''`` for the settings used everywhere) and the value
+          a list of tuples ``(key, old_value, old_type, new_value, new_type)``
+          with the encoded values, old values are ``None`` if the setting
+          was not saved in the database, new values are ``None`` if the
+          setting was reset
+        - ``user`` (optional): the user who changed the settings
+        - ``checkpoint`` (optional): if ``False`` no checkpoint is saved,
+          used if more changes of the same version are recorded afterwards
+          (see ``save_checkpoint``)
+        - ``first`` (optional): ``False`` if changes of the same version
+          were recorded before (within the same transaction)
+    """
+    changes = dict((scope, scope_changes) for scope, scope_changes in changes.iteritems() if scope_changes)
+    if not changes:
+        return
+    if user is not None and not user.is_authenticated():
+        user = None
+    if first and not _has_checkpoint():
+        #the history starts with the settings before the first change
+        #(of all scopes, the rows are already saved)
+        rows = get_rows()
+        for scope, scope_changes in changes.iteritems():
+            for key, old_value, old_type, new_value, new_type in scope_changes:
+                if old_type is None:
+                    rows.pop((scope, key), None)
+                else:
+                    rows[(scope, key)] = (old_value, old_type)
+        _save_checkpoint(version - 1, rows)
+    settings_changes = [models.SettingsChange(version=version, scope=scope, key=key, user=user,
+                                              old_value=old_value, old_type=old_type,
+                                              new_value=new_value, new_type=new_type)
+                        for scope, scope_changes in sorted(changes.iteritems())
+                        for key, old_value, old_type, new_value, new_type in scope_changes]
+    models.bulk_create(models.SettingsChange, settings_changes)
+    if checkpoint:
+        save_checkpoint(version)
+
+
+def save_checkpoint(version):
+    """Save all settings as checkpoint if ``version`` is one of every
+    ``DYNAMICSETTINGS_HISTORY_CHECKPOINT_INTERVAL`` versions.
+    """
+    if version % app_settings.DYNAMICSETTINGS_HISTORY_CHECKPOINT_INTERVAL == 0:
+        _save_checkpoint(version, get_rows())
+
+
+def rows_as_of(version=None, when=None):
+    """Returns the settings saved in the database at ``version`` or at
+    the time ``when`` (in the format of ``get_rows``). The settings of the
+    closest checkpoint before are combined with the changes since then,
+    both found via an index.
+
+    Params:
+        - ``version``: the version of the settings
+        - ``when``: a ``datetime``, used if ``version`` is ``None``
+
+    Returns:
+        - a tuple ``(version, rows)``
+
+    Raises:
+        - ``ValueError`` if the history does not contain the version
+    """
+    if version is None:
+        if when is None:
+            raise ValueError('Either a version or a time is needed.')
+        #the latest change before ``when`` (via the index of ``created``)
+        earlier_changes = models.SettingsChange.objects.filter(created__lte=when).order_by('-created', '-version')
+        last_version = earlier_changes.values_list('version', flat=True)[:1]
+        if last_version:
+            version = last_version[0]
+        else:
+            #before the first change, the settings of the first checkpoint
+            first_checkpoint = models.SettingsCheckpoint.objects.order_by('version')[:1]
+            if not first_checkpoint:
+                raise ValueError('There is no history of the settings.')
+            version = first_checkpoint[0].version
+    try:
+        checkpoint = models.SettingsCheckpoint.objects.filter(version__lte=version).order_by('-version')[0]
+    except IndexError:
+        raise ValueError('The history of the settings does not contain version %d.' % version)
+    rows = {}
+    for scope, key, value, value_type in simplejson.loads(checkpoint.settings):
+        rows[(scope, key)] = (value, value_type)
+    changes = models.SettingsChange.objects.filter(version__gt=checkpoint.version, version__lte=version)
+    for scope, key, new_value, new_type in changes.order_by('version', 'id').values_list('scope', 'key', 'new_value', 'new_type'):
+        if new_type is None:
+            rows.pop((scope, key), None)
+        else:
+            rows[(scope, key)] = (new_value, new_type)
+    return version, rows
+
+
+#set once a checkpoint was found, checkpoints are never removed, so
+#the database is not asked again on every change. Only checked before
+#anything is recorded in a transaction (see ``first`` of ``record``),
+#so a checkpoint which may be rolled back is never found
+_checkpoint_saved = False
+
+def _has_checkpoint():
+    global _checkpoint_saved
+    if not _checkpoint_saved:
+        _checkpoint_saved = models.SettingsCheckpoint.objects.exists()
+    return _checkpoint_saved
+
+
+def _save_checkpoint(version, rows):
+    settings_list = [[scope, key, value, value_type]
+                     for (scope, key), (value, value_type) in sorted(rows.iteritems())]
+    models.SettingsCheckpoint.objects.filter(version=version).delete()
+    models.SettingsCheckpoint.objects.create(version=version,
+                                             settings=simplejson.dumps(settings_list, separators=(',', ':')))
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+from collections import OrderedDict
+
+#returned by ``LocalCache.get`` for missing entries
+_missing = object()
+
+
+class LocalCache(object):
+    """A cache within the memory of the process, keeping at most
+    ``max_entries`` entries for ``timeout`` seconds each. If the cache
+    is full the least recently used entry is removed.
+
+    Params:
+        - ``timeout``: the number of seconds an entry is kept
+        - ``max_entries``: the maximum number of entries
+    """
+
+    def __init__(self, timeout, max_entries):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            if entry[0] <= time.time():
+                #expired
+                return default
+            #the most recently used entries are at the end
+            self._entries[key] = entry
+            return entry[1]
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        self._lock.acquire()
+        try:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.timeout, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        finally:
+            self._lock.release()
+
+    def delete(self, key):
+        self._lock.acquire()
+        try:
+            self._entries.pop(key, None)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TieredCache(object):
+    """Two tiers of caches: a ``LocalCache`` (L1) in front of a Django
+    cache (L2). Values are read from the local cache first and from the
+    Django cache if they are missing, values which are written are written
+    to both. The values in the local cache are kept together with the
+    version of the settings they were read or written for and only used
+    for the same version, so a value changed by another process (which
+    increased the version) is never read from the local cache once the new
+    version is used. The hits and misses of every tier are counted in
+    ``stats`` (``l1_hits``, ``l1_misses``, ``l2_hits`` and ``l2_misses``).
+
+    Params:
+        - ``local``: a ``LocalCache`` or ``None`` to only use the Django cache
+        - ``remote``: the Django cache
+        - ``stats``: the ``dynamicsettings.stats.Stats`` to count the hits
+    """
+
+    def __init__(self, local, remote, stats):
+        self.local = local
+        self.remote = remote
+        self.stats = stats
+
+    def get(self, key, version, default=None):
+        return self.get_many([key], version).get(key, default)
+
+    def get_many(self, keys, version):
+        values = {}
+        if self.local is not None:
+            missing_keys = []
+            for key in keys:
+                entry = self.local.get(key, _missing)
+                if entry is _missing or entry[0] != version:
+                    missing_keys.append(key)
+                else:
+                    values[key] = entry[1]
+            self._count('l1', len(values), len(missing_keys))
+        else:
+            missing_keys = list(keys)
+        if missing_keys:
+            fetched = self.remote.get_many(missing_keys)
+            self._count('l2', len(fetched), len(missing_keys) - len(fetched))
+            if self.local is not None:
+                for key, value in fetched.iteritems():
+                    self.local.set(key, (version, value))
+            values.update(fetched)
+        return values
+
+    def set(self, key, value, version, timeout=None):
+        self.remote.set(key, value, timeout)
+        if self.local is not None:
+            self.local.set(key, (version, value))
+
+    def set_many(self, mapping, version, timeout=None):
+        self.remote.set_many(mapping, timeout)
+        if self.local is not None:
+            for key, value in mapping.iteritems():
+                self.local.set(key, (version, value))
+
+    def add(self, key, value, version, timeout=None):
+        added = self.remote.add(key, value, timeout)
+        if added and self.local is not None:
+            self.local.set(key, (version, value))
+        return added
+
+    def delete(self, key):
+        self.delete_many([key])
+
+    def delete_many(self, keys):
+        self.remote.delete_many(keys)
+        if self.local is not None:
+            for key in keys:
+                self.local.delete(key)
+
+    def _count(self, tier, hits, misses):
+        if hits:
+            self.stats.incr(tier + '_hits', hits)
+        if misses:
+            self.stats.incr(tier + '_misses', misses)
+
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from dynamicsettings import app_settings
+from dynamicsettings import codec
+from dynamicsettings import models
+
+
+class Command(BaseCommand):
+    """Converts the values of the settings saved in the database
+    from one codec to another. Needs to be run once after upgrading
+    from a version of *django-dynamic-settings* which saved the values
+    as pickles. If one of the values can not be converted without
+    changing it nothing is converted.
+    """
+    help = 'Converts the values of the settings saved in the database from one codec to another.'
+    option_list = BaseCommand.option_list + (
+        make_option('--from', dest='from_codec', default='dynamicsettings.codec.PickleCodec',
+                    help='The python path of the codec the values are currently saved with.'),
+        make_option('--to', dest='to_codec', default=None,
+                    help='The python path of the codec the values should be saved with. Defaults to DYNAMICSETTINGS_CODEC.'),
+    )
+
+    def handle(self, *args, **options):
+        from_codec = codec.get_codec(options['from_codec'])
+        to_codec = codec.get_codec(options['to_codec'] or app_settings.DYNAMICSETTINGS_CODEC)
+        #all values are converted before the first one is saved, so
+        #nothing is saved if one of the values can not be converted
+        encoded_values = {}
+        for pk, key, value, value_type in models.Settings.objects.values_list('pk', 'key', 'value', 'type'):
+            try:
+                decoded_value = from_codec.decode(value, value_type)
+                encoded_value = to_codec.encode(decoded_value, value_type)
+                if to_codec.decode(encoded_value, value_type) != decoded_value:
+                    raise ValueError('the value would be changed')
+            except Exception as e:
+                raise CommandError('Setting "%s" could not be converted: %s' % (key, e))
+            encoded_values[pk] = encoded_value
+        with transaction.commit_on_success():
+            for pk, encoded_value in encoded_values.iteritems():
+                models.Settings.objects.filter(pk=pk).update(value=encoded_value)
+        self.stdout.write('Converted %d settings.\n' % len(encoded_values))
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import simplejson
+
+from dynamicsettings import app_settings
+from dynamicsettings import codec
+from dynamicsettings import models
+from dynamicsettings.flags import Flag
+
+FORMATS = ('ndjson', 'json')
+
+
+class Command(BaseCommand):
+    """Exports the settings saved in the database, for example to load
+    them into another environment with the ``loaddynamicsettings`` command.
+    Every setting is written as JSON object with the keys ``key``, ``scope``,
+    ``type`` and ``value`` (the decoded value), either one object per line
+    (``ndjson``) or as JSON list (``json``). The settings are read from the
+    database in chunks and written one by one, so the memory used does not
+    depend on the number of settings.
+    """
+    help = 'Exports the settings saved in the database as JSON.'
+    args = '[output file]'
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', default='ndjson',
+                    help='The format of the export: "ndjson" (one setting per line, the default) or "json".'),
+        make_option('--scope', dest='scope', default=None,
+                    help='Only export the settings of this scope ("" for the settings used everywhere).'),
+    )
+
+    def handle(self, *args, **options):
+        if options['format'] not in FORMATS:
+            raise CommandError('Unknown format "%s", use one of: %s.' % (options['format'], ', '.join(FORMATS)))
+        if len(args) > 1:
+            raise CommandError('Only one output file can be given.')
+        if args:
+            output = open(args[0], 'w')
+        else:
+            output = self.stdout
+        try:
+            count = self.dump(output, options['format'], options['scope'])
+        finally:
+            if args:
+                output.close()
+        if args:
+            self.stderr.write('Exported %d settings.\n' % count)
+
+    def dump(self, output, output_format, scope=None):
+        settings_codec = codec.get_codec(app_settings.DYNAMICSETTINGS_CODEC)
+        db_settings = models.Settings.objects.order_by('scope', 'key')
+        if scope is not None:
+            db_settings = db_settings.filter(scope=scope)
+        count = 0
+        if output_format == 'json':
+            output.write('[')
+        for key, scope, value, value_type in db_settings.values_list('key', 'scope', 'value', 'type').iterator():
+            try:
+                value = settings_codec.decode(value, value_type)
+            except Exception as e:
+                raise CommandError('Setting "%s" could not be decoded: %s' % (key, e))
+            record = simplejson.dumps({'key': key, 'scope': scope, 'type': value_type, 'value': value},
+                                      sort_keys=True, separators=(',', ':'), default=_encode_flag)
+            if output_format == 'json':
+                output.write(count and ',\n' or '\n')
+            output.write(record)
+            if output_format == 'ndjson':
+                output.write('\n')
+            count += 1
+        if output_format == 'json':
+            output.write('\n]\n')
+        return count
+
+
+def _encode_flag(value):
+    #flags are exported as their rules
+    if isinstance(value, Flag):
+        return value.rules
+    raise TypeError('%r is not JSON serializable' % value)
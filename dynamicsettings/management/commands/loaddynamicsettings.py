@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import simplejson
+
+from dynamicsettings import models
+from dynamicsettings import DynamicSettings
+
+TYPES = frozenset(value_type for value_type, name in models.TYPE_CHOICES)
+
+
+class Command(BaseCommand):
+    """Imports settings exported by the ``dumpdynamicsettings`` command.
+    New settings are added and existing settings are changed (settings
+    missing in the file are kept), all within one transaction. Nothing is
+    imported if one of the settings can not be changed or would change its
+    type. Files in
+    the ``ndjson`` format are read line by line, so the memory used does
+    not depend on the number of settings. With ``--dry-run`` the changes
+    are only printed.
+    """
+    help = 'Imports settings exported by the dumpdynamicsettings command.'
+    args = '<input file>'
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run', action='store_true', dest='dry_run', default=False,
+                    help='Only print the changes, do not save them.'),
+        make_option('--batch-size', type='int', dest='batch_size', default=1000,
+                    help='The number of settings saved at once.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Give the file to import ("-" to read from stdin).')
+        if args[0] == '-':
+            input_file = sys.stdin
+        else:
+            try:
+                input_file = open(args[0])
+            except IOError as e:
+                raise CommandError('The file could not be opened: %s' % e)
+        #the changes are printed with --dry-run or a verbosity of 2 or more
+        callback = None
+        if options['dry_run'] or int(options.get('verbosity', 1)) > 1:
+            callback = self.print_change
+        try:
+            count = DynamicSettings().load(self.records(input_file), dry_run=options['dry_run'],
+                                           batch_size=options['batch_size'], callback=callback)
+        except KeyError as e:
+            #settings which can not be changed
+            raise CommandError('The settings could not be imported: %s' % e.args[0])
+        except ValueError as e:
+            #for example a value not matching the schema of its setting
+            raise CommandError('The settings could not be imported: %s' % e)
+        finally:
+            if input_file is not sys.stdin:
+                input_file.close()
+        if options['dry_run']:
+            self.stdout.write('%d settings would be changed.\n' % count)
+        else:
+            self.stdout.write('Changed %d settings.\n' % count)
+
+    def records(self, input_file):
+        #the format is detected from the first character: a JSON list
+        #is loaded at once, every other line is a setting otherwise
+        first_line = input_file.readline()
+        if first_line.lstrip().startswith('['):
+            try:
+                settings_list = simplejson.loads(first_line + input_file.read())
+            except ValueError as e:
+                raise CommandError('The file is not valid JSON: %s' % e)
+            for number, setting in enumerate(settings_list):
+                yield self.record(setting, 'setting %d' % (number + 1))
+            return
+        line = first_line
+        number = 1
+        while line:
+            if line.strip():
+                try:
+                    setting = simplejson.loads(line)
+                except ValueError as e:
+                    raise CommandError('Line %d is not valid JSON: %s' % (number, e))
+                yield self.record(setting, 'line %d' % number)
+            line = input_file.readline()
+            number += 1
+
+    def record(self, setting, position):
+        if not isinstance(setting, dict) or 'key' not in setting or 'value' not in setting\
+        or setting.get('type') not in TYPES:
+            raise CommandError('The setting in %s needs a "key", a "value" and a known "type".' % position)
+        value = setting['value']
+        if setting['type'] == 'tuple' and isinstance(value, list):
+            value = tuple(value)
+        return (setting.get('scope') or '', setting['key'], value, setting['type'])
+
+    def print_change(self, scope, key, old_value, old_type, new_value, new_type):
+        if scope:
+            key = '%s (scope %s)' % (key, scope)
+        if old_type is None:
+            self.stdout.write('+ %s: %s (%s)\n' % (key, new_value, new_type))
+        else:
+            self.stdout.write('~ %s: %s (%s) -> %s (%s)\n' % (key, old_value, old_type, new_value, new_type))
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+from dynamicsettings import settings
+
+
+class DynamicSettingsMiddleware(object):
+    """Pins the settings for the whole request (see ``settings.pin``),
+    so all reads within the request are using the same settings, even
+    if the settings are changed by another process meanwhile. The 
+    pinned settings are also available as ``request.dynamic_settings``
+    (see ``dynamicsettings.PinnedSettings``), only the settings used by
+    the request are decoded.
+    """
+
+    def process_request(self, request):
+        #remove settings which might have been left pinned by a
+        #previous request of this thread
+        settings.unpin_all()
+        request.dynamic_settings = settings.pin()
+
+    def process_response(self, request, response):
+        if hasattr(request, 'dynamic_settings'):
+            settings.unpin()
+        return response
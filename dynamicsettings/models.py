@@ -1,25 +1,128 @@
 
+import datetime
+
+from django.db import connection, models, transaction
+from django.contrib.auth.models import User
+
+TYPE_CHOICES = (
+    ('NoneType', 'NoneType'),
+    ('bool', 'bool'),
+    ('int', 'int'),
+    ('long', 'long'),
+    ('float', 'float'),
+    ('str', 'str'),
+    ('unicode', 'unicode'),
+    ('list', 'list'),
+    ('tuple', 'tuple'),
+    ('dict', 'dict'),
+    ('flag', 'flag'),
+)
 
-from django.db import models
 
 class Settings(models.Model):
-    key = models.CharField(max_length=255, unique=True, null=False, blank=False)
+    key = models.CharField(max_length=255, null=False, blank=False)
+    #settings with an empty scope are used everywhere, other settings
+    #only for their scope (for example a site or a tenant)
+    scope = models.CharField(max_length=255, default='', null=False, blank=True, db_index=True)
     value = models.TextField(null=False, blank=False)
-    type = models.CharField(max_length=10, choices=(
-        ('NoneType', 'NoneType'),
-        ('bool', 'bool'),
-        ('int', 'int'),
-        ('long', 'long'),
-        ('float', 'float'),
-        ('str', 'str'),
-        ('unicode', 'unicode'),
-        ('list', 'list'),
-        ('tuple', 'tuple'),
-        ('dict', 'dict'),
-    ), null=False, blank=False)
+    type = models.CharField(max_length=10, choices=TYPE_CHOICES, null=False, blank=False)
     
     class Meta:
         verbose_name_plural = "Settings"
+        unique_together = (('key', 'scope'),)
     
     def __unicode__(self):
         return self.key
+
+
+class Version(models.Model):
+    """Holds the version of the dynamic settings in a single row.
+    The version is increased on every change of the settings in
+    the database, so other processes can detect that their 
+    settings are outdated.
+    """
+    version = models.PositiveIntegerField(default=0, null=False)
+    
+    def __unicode__(self):
+        return unicode(self.version)
+
+
+class SettingsChange(models.Model):
+    """One change of a setting saved in the database, the history of the
+    settings is only appended to. The values are saved encoded (like the
+    values of ``Settings``), the old value is ``None`` if the setting was
+    not saved in the database before, the new value is ``None`` if the
+    setting was reset.
+    """
+    version = models.PositiveIntegerField(null=False, db_index=True)
+    created = models.DateTimeField(default=datetime.datetime.now, null=False, db_index=True)
+    key = models.CharField(max_length=255, null=False, blank=False)
+    scope = models.CharField(max_length=255, default='', null=False, blank=True)
+    old_value = models.TextField(null=True, blank=True)
+    old_type = models.CharField(max_length=10, choices=TYPE_CHOICES, null=True, blank=True)
+    new_value = models.TextField(null=True, blank=True)
+    new_type = models.CharField(max_length=10, choices=TYPE_CHOICES, null=True, blank=True)
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    
+    class Meta:
+        ordering = ('version', 'id')
+    
+    def __unicode__(self):
+        return u'%s (version %d)' % (self.key, self.version)
+
+
+class SettingsCheckpoint(models.Model):
+    """All settings saved in the database at one version, saved every
+    DYNAMICSETTINGS_HISTORY_CHECKPOINT_INTERVAL versions, so the settings
+    of a version are found by combining the closest checkpoint with the
+    changes since then. ``settings`` is a JSON list of ``[scope, key,
+    value, type]`` lists.
+    """
+    version = models.PositiveIntegerField(null=False, unique=True)
+    created = models.DateTimeField(default=datetime.datetime.now, null=False)
+    settings = models.TextField(null=False, blank=True)
+    
+    def __unicode__(self):
+        return unicode(self.version)
+
+
+def bulk_create(model, objects):
+    """Insert ``objects`` (new instances of ``model``) at once. Uses
+    ``bulk_create`` if the version of Django has it and one ``executemany``
+    otherwise, instead of saving every object on its own.
+    """
+    if hasattr(model.objects, 'bulk_create'):
+        model.objects.bulk_create(objects)
+        return
+    if not objects:
+        return
+    qn = connection.ops.quote_name
+    fields = [field for field in model._meta.local_fields if not isinstance(field, models.AutoField)]
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (qn(model._meta.db_table),
+                                               ', '.join(qn(field.column) for field in fields),
+                                               ', '.join(['%s'] * len(fields)))
+    params = [[field.get_db_prep_save(field.pre_save(obj, True), connection=connection) for field in fields]
+              for obj in objects]
+    connection.cursor().executemany(sql, params)
+    _set_dirty()
+
+
+def bulk_update_settings(rows):
+    """Change the values of several ``Settings`` at once with one
+    ``executemany``, ``rows`` is a list of tuples ``(scope, key, value, type)``.
+    """
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    sql = 'UPDATE %s SET %s = %%s, %s = %%s WHERE %s = %%s AND %s = %%s' % (
+        qn(Settings._meta.db_table), qn('value'), qn('type'), qn('scope'), qn('key'))
+    connection.cursor().executemany(sql, [(value, value_type, scope, key) for scope, key, value, value_type in rows])
+    _set_dirty()
+
+
+def _set_dirty():
+    #changes made with the cursor are not noticed by the transaction management
+    if transaction.is_managed():
+        transaction.set_dirty()
+    else:
+        transaction.commit_unless_managed()
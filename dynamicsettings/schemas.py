@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+
+import re
+import threading
+
+from django.utils import simplejson
+
+from dynamicsettings import app_settings
+from dynamicsettings.datastructures import type_name
+from dynamicsettings.flags import Flag
+
+ERROR_MESSAGE = 'A setting from type %s must be set to %s.'
+
+#the options of a schema and the keywords of the JSON schema for
+#containers, they are compiled to a list of checks once (see ``Schema``)
+OPTIONS = ('type', 'min', 'max', 'choices', 'schema')
+
+JSON_SCHEMA_KEYWORDS = ('type', 'enum', 'minimum', 'maximum', 'minLength', 'maxLength',
+                        'pattern', 'items', 'minItems', 'maxItems', 'properties',
+                        'required', 'additionalProperties', 'title', 'description')
+
+JSON_TYPES = {
+    'null': type(None),
+    'boolean': bool,
+    'integer': (int, long),
+    'number': (int, long, float),
+    'string': basestring,
+    'array': (list, tuple),
+    'object': dict,
+}
+
+
+def _parse_none(value):
+    if value != 'None':
+        raise ValueError(ERROR_MESSAGE % ('NoneType', '"None"'))
+    return None
+
+def _parse_bool(value):
+    if value == 'True':
+        return True
+    if value == 'False':
+        return False
+    raise ValueError(ERROR_MESSAGE % ('bool', '"True" or "False"'))
+
+def _parse_number(convert, value_type):
+    def parse(value):
+        try:
+            return convert(value)
+        except ValueError:
+            raise ValueError(ERROR_MESSAGE % (value_type, 'a number'))
+    return parse
+
+def _parse_json(container_type, description):
+    message = ERROR_MESSAGE % (container_type.__name__, description)
+    def parse(value):
+        try:
+            value = simplejson.loads(value)
+        except ValueError:
+            raise ValueError(message)
+        #JSON arrays are loaded as lists, objects as dicts
+        if isinstance(value, dict) != (container_type is dict) or not isinstance(value, (list, dict)):
+            raise ValueError(message)
+        return container_type(value)
+    return parse
+
+def _parse_flag(value):
+    try:
+        return Flag(simplejson.loads(value))
+    except ValueError:
+        raise ValueError(ERROR_MESSAGE % ('flag', 'a valid JSON string representing the rules of the flag (for example {"enabled": true, "percentage": 10})'))
+
+_array_description = 'a valid JSON string representing an Array (leading "["and traling "]")'
+
+PARSERS = {
+    'NoneType': _parse_none,
+    'bool': _parse_bool,
+    'int': _parse_number(int, 'int or long'),
+    'long': _parse_number(long, 'int or long'),
+    'float': _parse_number(float, 'float'),
+    'str': lambda value: value,
+    'unicode': unicode,
+    'list': _parse_json(list, _array_description),
+    'tuple': _parse_json(tuple, _array_description),
+    'dict': _parse_json(dict, 'a valid JSON string representing an Object (leading "{"and traling "}")'),
+    'flag': _parse_flag,
+}
+
+#the (Python) types of the values of every type, ``int`` and ``long``
+#as well as ``str`` and ``unicode`` are used for the same settings
+TYPES = {
+    'NoneType': type(None),
+    'bool': bool,
+    'int': (int, long),
+    'long': (int, long),
+    'float': float,
+    'str': basestring,
+    'unicode': basestring,
+    'list': list,
+    'tuple': tuple,
+    'dict': dict,
+    'flag': Flag,
+}
+
+#the conversions between types used by the typed accessors which do not
+#lose anything, the key is a tuple ``(type, new type)``. Other values
+#are only converted if they are strings (see ``convert``)
+CONVERTERS = {
+    ('int', 'float'): float,
+    ('long', 'float'): float,
+    ('list', 'tuple'): tuple,
+    ('tuple', 'list'): list,
+}
+
+
+def parse(value, value_type):
+    """Parse a value entered as string (for example in the form of
+    the admin) to a value of ``value_type``. Lists, tuples, dicts and
+    flags are entered as JSON.
+
+    Params:
+        - ``value``: the value as string
+        - ``value_type``: the (Python) type of the setting as its string
+          representation
+
+    Returns:
+        - the parsed value
+
+    Raises:
+        - ``ValueError`` if the value can not be parsed
+    """
+    try:
+        parser = PARSERS[value_type]
+    except KeyError:
+        raise ValueError('Settings from type "%s" are not supported.' % value_type)
+    return parser(value)
+
+
+def convert(value, value_type):
+    """Convert the value of a setting to ``value_type``, used by the typed
+    accessors like ``settings.get_int``. Values which already have the type
+    are returned as they are, strings are parsed (see ``parse``), ``str``
+    and ``unicode`` are converted with UTF-8. Otherwise only numbers are
+    widened (``int`` and ``long`` to ``float``) and lists and tuples are
+    converted to each other (see ``CONVERTERS``).
+
+    Raises:
+        - ``ValueError`` if the value can not be converted
+    """
+    try:
+        if value_type == 'str' and isinstance(value, unicode):
+            return value.encode('utf-8')
+        if value_type == 'unicode' and isinstance(value, str):
+            return value.decode('utf-8')
+    except UnicodeError:
+        raise ValueError(ERROR_MESSAGE % (value_type, 'a valid UTF-8 string'))
+    if is_type(value, value_type):
+        return value
+    if isinstance(value, basestring):
+        return parse(value, value_type)
+    converter = CONVERTERS.get((type_name(value), value_type))
+    if converter is None:
+        raise ValueError('A setting from type %s can not be converted to %s.' % (type_name(value), value_type))
+    return converter(value)
+
+
+def is_type(value, value_type):
+    """Check if ``value`` is a value of ``value_type`` (booleans are
+    no numbers here).
+    """
+    if isinstance(value, bool) and value_type != 'bool':
+        return False
+    return isinstance(value, TYPES.get(value_type, ()))
+
+
+class Schema(object):
+    """The schema of a setting, the value of the setting is checked
+    against it before it is saved and when it is read via the typed
+    accessors (like ``settings.get_int``). The definition is a dict with
+    the following (optional) keys:
+
+        - ``type``: the (Python) type of the setting, for example ``'int'``
+        - ``min`` and ``max``: the bounds of a number (inclusive)
+        - ``choices``: a list of the allowed values
+        - ``schema``: a JSON schema for lists, tuples and dicts, the keywords
+          ``type``, ``enum``, ``minimum``, ``maximum``, ``minLength``,
+          ``maxLength``, ``pattern``, ``items``, ``minItems``, ``maxItems``,
+          ``properties``, ``required`` and ``additionalProperties`` are
+          supported
+
+    The definition is compiled to a list of checks once, so validating a
+    value needs no further lookups in the definition.
+
+    Params:
+        - ``definition``: the definition of the schema as dict
+
+    Raises:
+        - ``ValueError`` if the definition is not valid
+    """
+    __slots__ = ('type', 'definition', '_checks')
+
+    def __init__(self, definition):
+        if not isinstance(definition, dict):
+            raise ValueError('The definition of a schema must be a dict.')
+        unknown = [name for name in definition if name not in OPTIONS]
+        if unknown:
+            raise ValueError('Unknown options of a schema: %s.' % ', '.join(sorted(unknown)))
+        self.definition = definition
+        self.type = definition.get('type')
+        checks = []
+        if self.type is not None:
+            if self.type not in TYPES:
+                raise ValueError('Unknown type of a schema: %s.' % self.type)
+            checks.append(_check_type(self.type))
+        if 'min' in definition or 'max' in definition:
+            checks.append(_check_bounds(definition.get('min'), definition.get('max'), 'the setting'))
+        if 'choices' in definition:
+            checks.append(_check_choices(definition['choices'], 'the setting'))
+        if 'schema' in definition:
+            checks.append(_compile_json_schema(definition['schema'], 'the setting'))
+        self._checks = checks
+
+    def validate(self, value):
+        """Check ``value`` against the schema.
+
+        Returns:
+            - the value
+
+        Raises:
+            - ``ValueError`` if the value is not valid
+        """
+        for check in self._checks:
+            check(value)
+        return value
+
+
+def _error(name, message):
+    #``name`` describes the checked value, for example ``'the setting'``
+    return ValueError('%s%s %s' % (name[0].upper(), name[1:], message))
+
+def _check_type(value_type):
+    def check(value):
+        if not is_type(value, value_type):
+            raise _error('the setting', 'must be from type %s.' % value_type)
+    return check
+
+def _check_bounds(minimum, maximum, name):
+    def check(value):
+        if isinstance(value, bool) or not isinstance(value, (int, long, float)):
+            raise _error(name, 'must be a number.')
+        if minimum is not None and value < minimum:
+            raise _error(name, 'must be at least %s.' % minimum)
+        if maximum is not None and value > maximum:
+            raise _error(name, 'must be at most %s.' % maximum)
+    return check
+
+def _check_choices(choices, name):
+    if not isinstance(choices, (list, tuple)):
+        raise ValueError('The choices of a schema must be a list.')
+    #lists and tuples are the same (like in JSON)
+    allowed = [_comparable(choice) for choice in choices]
+    def check(value):
+        if _comparable(value) not in allowed:
+            raise _error(name, 'must be one of %s.' % ', '.join(repr(choice) for choice in choices))
+    return check
+
+def _check_length(minimum, maximum, name, what):
+    def check(value):
+        if minimum is not None and len(value) < minimum:
+            raise _error(name, 'must have at least %d %s.' % (minimum, what))
+        if maximum is not None and len(value) > maximum:
+            raise _error(name, 'must have at most %d %s.' % (maximum, what))
+    return check
+
+def _only(types, check):
+    #like in JSON schema most keywords only apply to values of some types
+    def check_value(value):
+        if isinstance(value, types) and not (isinstance(value, bool) and bool not in types):
+            check(value)
+    return check_value
+
+def _compile_json_schema(schema, name):
+    #returns one check for the JSON schema, the checks of nested
+    #schemas are compiled at once as well
+    if not isinstance(schema, dict):
+        raise ValueError('A JSON schema must be a dict.')
+    unknown = [keyword for keyword in schema if keyword not in JSON_SCHEMA_KEYWORDS]
+    if unknown:
+        raise ValueError('Unsupported keywords of a JSON schema: %s.' % ', '.join(sorted(unknown)))
+    checks = []
+    if 'type' in schema:
+        json_types = schema['type']
+        if isinstance(json_types, basestring):
+            json_types = [json_types]
+        if any(json_type not in JSON_TYPES for json_type in json_types):
+            raise ValueError('Unknown type of a JSON schema: %s.' % ', '.join(json_types))
+        python_types = tuple(JSON_TYPES[json_type] for json_type in json_types)
+        allows_bool = 'boolean' in json_types
+        def check_type(value):
+            if not isinstance(value, python_types) or (isinstance(value, bool) and not allows_bool):
+                raise _error(name, 'must be from type %s.' % ' or '.join(json_types))
+        checks.append(check_type)
+    if 'enum' in schema:
+        checks.append(_check_choices(schema['enum'], name))
+    if 'minimum' in schema or 'maximum' in schema:
+        checks.append(_only((int, long, float), _check_bounds(schema.get('minimum'), schema.get('maximum'), name)))
+    if 'minLength' in schema or 'maxLength' in schema:
+        checks.append(_only(basestring, _check_length(schema.get('minLength'), schema.get('maxLength'), name, 'characters')))
+    if 'pattern' in schema:
+        pattern = re.compile(schema['pattern'])
+        def check_pattern(value):
+            if not pattern.search(value):
+                raise _error(name, 'must match "%s".' % pattern.pattern)
+        checks.append(_only(basestring, check_pattern))
+    if 'minItems' in schema or 'maxItems' in schema:
+        checks.append(_only((list, tuple), _check_length(schema.get('minItems'), schema.get('maxItems'), name, 'items')))
+    if 'items' in schema:
+        check_item = _compile_json_schema(schema['items'], 'every item of %s' % name)
+        def check_items(value):
+            for item in value:
+                check_item(item)
+        checks.append(_only((list, tuple), check_items))
+    if 'required' in schema:
+        required = list(schema['required'])
+        def check_required(value):
+            missing = [key for key in required if key not in value]
+            if missing:
+                raise _error(name, 'must contain %s.' % ', '.join(missing))
+        checks.append(_only(dict, check_required))
+    properties = schema.get('properties', {})
+    additional = schema.get('additionalProperties', True)
+    if properties or additional is not True:
+        property_checks = dict((key, _compile_json_schema(property_schema, '%s of %s' % (key, name)))
+                               for key, property_schema in properties.iteritems())
+        check_additional = None
+        if isinstance(additional, dict):
+            check_additional = _compile_json_schema(additional, 'every item of %s' % name)
+        def check_properties(value):
+            for key, item in value.iteritems():
+                if key in property_checks:
+                    property_checks[key](item)
+                elif additional is False:
+                    raise _error(name, 'must not contain %s.' % key)
+                elif check_additional is not None:
+                    check_additional(item)
+        checks.append(_only(dict, check_properties))
+    def check_schema(value):
+        for check in checks:
+            check(value)
+    return check_schema
+
+def _comparable(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_comparable(item) for item in value)
+    if isinstance(value, dict):
+        return sorted((key, _comparable(item)) for key, item in value.iteritems())
+    return value
+
+
+#the schemas registered via ``register`` and the compiled schemas of
+#DYNAMICSETTINGS_SCHEMAS (together with their definition, so a changed
+#definition is compiled again)
+_registry = {}
+_compiled = {}
+_lock = threading.Lock()
+
+def register(key, definition):
+    """Register the schema of a setting, used instead of the schema in
+    DYNAMICSETTINGS_SCHEMAS (for example by reusable apps for their own
+    settings). The definition is compiled at once.
+
+    Params:
+        - ``key``: the name of the setting
+        - ``definition``: the definition of the schema (see ``Schema``)
+
+    Raises:
+        - ``ValueError`` if the definition is not valid
+    """
+    schema = Schema(definition)
+    _lock.acquire()
+    try:
+        _registry[key] = schema
+    finally:
+        _lock.release()
+
+
+def get_schema(key):
+    """Returns the compiled ``Schema`` of a setting or ``None`` if the
+    setting has no schema. Every definition is only compiled once.
+    """
+    schema = _registry.get(key)
+    if schema is not None:
+        return schema
+    definition = app_settings.DYNAMICSETTINGS_SCHEMAS.get(key)
+    if definition is None:
+        return None
+    compiled = _compiled.get(key)
+    if compiled is None or compiled[0] is not definition:
+        compiled = (definition, Schema(definition))
+        _lock.acquire()
+        try:
+            _compiled[key] = compiled
+        finally:
+            _lock.release()
+    return compiled[1]
+
+
+def validate(key, value):
+    """Check the value of a setting against its schema (if it has one).
+
+    Returns:
+        - the value
+
+    Raises:
+        - ``ValueError`` if the value is not valid
+    """
+    schema = get_schema(key)
+    if schema is not None:
+        schema.validate(value)
+    return value
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+
+from django.dispatch import Signal
+
+#sent after settings were set or reset in the database and the new
+#settings are cached, ``changed`` is a list with the names of the settings
+#which were set and ``removed`` a list with the names of the settings
+#which were reset, ``scope`` is the scope of the settings (or None)
+settings_changed = Signal(providing_args=['version', 'changed', 'removed', 'scope'])
+
+#sent every time a value is recorded by the stats of the settings (see
+#``DynamicSettings.stats``), ``kind`` is either 'counter' (``value`` is
+#the increment) or 'timing' (``value`` is the duration in seconds)
+stats_recorded = Signal(providing_args=['name', 'kind', 'value'])
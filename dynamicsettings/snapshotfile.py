@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+import os
+import mmap
+import struct
+import threading
+
+from django.utils import simplejson
+
+#the header of a snapshot file: a magic string, the version of the
+#settings, the time the settings expire and the length of the index
+MAGIC = 'DYNSETS2'.encode('ascii')
+HEADER = struct.Struct('>8sQdQ')
+
+
+class SnapshotFile(object):
+    """A file with the settings saved in the database of one version,
+    shared by all processes on the same host. The file contains the
+    encoded values (see ``dynamicsettings.codec.TypedCodec``), so it
+    contains no code, only text. It starts with a small header containing
+    the version, followed by an index (as JSON) with the name, the type
+    and the position of every setting and the values. Readers memory-map
+    the file, so all processes share the same pages, and only read the
+    index when the version in the header changed. Values are read from
+    the map when they are used (see ``Rows``). Writers replace the whole
+    file (by writing a temporary file first), so readers never see a
+    partially written file.
+
+    Params:
+        - ``path``: the path of the file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._map = None
+        self._stat = None
+        #the version and the rows of the mapped file
+        self._version = None
+        self._rows = None
+
+    def read(self, version):
+        """Returns the ``Rows`` saved with ``write`` if the file contains
+        the settings of ``version``, ``None`` otherwise (also if the file
+        does not exist or is not valid). The index is read once per version.
+        """
+        self._lock.acquire()
+        try:
+            self._remap()
+            if self._map is None or self._version != version:
+                return None
+            if self._rows is None:
+                magic, version, expires, length = HEADER.unpack_from(self._map, 0)
+                index = simplejson.loads(self._map[HEADER.size:HEADER.size + length].decode('utf-8'))
+                self._rows = Rows(self._map, HEADER.size + length, index, expires)
+            return self._rows
+        finally:
+            self._lock.release()
+
+    def version(self):
+        """Returns the version of the settings in the file or ``None``
+        if the file does not exist or is not valid.
+        """
+        self._lock.acquire()
+        try:
+            self._remap()
+            return self._version
+        finally:
+            self._lock.release()
+
+    def write(self, version, expires, rows):
+        """Replace the file with the settings of ``version``.
+
+        Params:
+            - ``version``: the version of the settings
+            - ``expires``: the time (as returned by ``time.time``) the
+              settings expire
+            - ``rows``: a dict where the key is the name of the setting and
+              the value a tuple ``(value, type)`` with the encoded value
+        """
+        index = {}
+        values = []
+        offset = 0
+        for key, (value, value_type) in rows.iteritems():
+            value = value.encode('utf-8')
+            index[key] = (value_type, offset, len(value))
+            values.append(value)
+            offset += len(value)
+        index = simplejson.dumps(index, separators=(',', ':')).encode('utf-8')
+        tmp_path = '%s.%d.%d.tmp' % (self.path, os.getpid(), threading.current_thread().ident)
+        tmp_file = open(tmp_path, 'wb')
+        try:
+            tmp_file.write(HEADER.pack(MAGIC, version, expires, len(index)))
+            tmp_file.write(index)
+            for value in values:
+                tmp_file.write(value)
+        finally:
+            tmp_file.close()
+        os.rename(tmp_path, self.path)
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            self._unmap()
+        finally:
+            self._lock.release()
+
+    def _remap(self):
+        #the file is only mapped again if it was replaced (a ``stat`` call)
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self._unmap()
+            return
+        stat = (stat.st_dev, stat.st_ino, stat.st_mtime, stat.st_size)
+        if stat == self._stat:
+            return
+        self._unmap()
+        self._stat = stat
+        if stat[3] < HEADER.size:
+            return
+        snapshot_file = open(self.path, 'rb')
+        try:
+            file_map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            snapshot_file.close()
+        magic, version, expires, length = HEADER.unpack_from(file_map, 0)
+        if magic != MAGIC or HEADER.size + length > len(file_map):
+            file_map.close()
+            return
+        self._map = file_map
+        self._version = version
+
+    def _unmap(self):
+        #the map is not closed, ``Rows`` of the previous version may still
+        #be used. It is closed when the last of them is removed
+        self._map = None
+        self._stat = None
+        self._version = None
+        self._rows = None
+
+
+class Rows(object):
+    """The settings of a ``SnapshotFile``, a read-only mapping where the
+    key is the name of the setting and the value a tuple ``(value, type)``
+    with the encoded value (like ``Snapshot.raw``). Every value is read
+    from the shared map when it is used, only the index is kept by the
+    process.
+    """
+    __slots__ = ('expires', '_map', '_start', '_index')
+
+    def __init__(self, file_map, start, index, expires):
+        self.expires = expires
+        self._map = file_map
+        self._start = start
+        self._index = index
+
+    def __getitem__(self, key):
+        value_type, offset, length = self._index[key]
+        start = self._start + offset
+        return self._map[start:start + length].decode('utf-8'), value_type
+
+    def get(self, key, default=None):
+        if key not in self._index:
+            return default
+        return self[key]
+
+    def keys(self):
+        return self._index.keys()
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+
+_snapshot_files = {}
+_snapshot_files_lock = threading.Lock()
+
+def get_snapshot_file(path):
+    """Returns the ``SnapshotFile`` for ``path``, every file is
+    only mapped once per process.
+    """
+    _snapshot_files_lock.acquire()
+    try:
+        if path not in _snapshot_files:
+            _snapshot_files[path] = SnapshotFile(path)
+        return _snapshot_files[path]
+    finally:
+        _snapshot_files_lock.release()
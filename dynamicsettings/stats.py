@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from dynamicsettings import signals
+
+#the upper bounds (in milliseconds) of the buckets of the timing histograms,
+#timings above the last bound are counted in an additional bucket
+TIMING_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class Timing(object):
+    """A histogram of the timings recorded for one name.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(TIMING_BUCKETS) + 1)
+
+    def add(self, seconds):
+        milliseconds = seconds * 1000
+        self.count += 1
+        self.total += milliseconds
+        self.max = max(self.max, milliseconds)
+        for index, bound in enumerate(TIMING_BUCKETS):
+            if milliseconds <= bound:
+                self.buckets[index] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def as_dict(self):
+        bounds = [str(bound) for bound in TIMING_BUCKETS] + ['inf']
+        return {
+            'count': self.count,
+            'total_ms': self.total,
+            'max_ms': self.max,
+            'mean_ms': self.count and self.total / self.count or 0.0,
+            'buckets': dict(zip(bounds, self.buckets)),
+        }
+
+
+class Stats(object):
+    """Counters and timing histograms of one ``DynamicSettings`` instance.
+    Every recorded value is also sent with the ``stats_recorded`` signal
+    (see ``dynamicsettings.signals``), so it can be passed to a metrics
+    system. Counters are not locked, so under heavy concurrency a few
+    increments may get lost.
+
+    Params:
+        - ``sender``: the sender of the ``stats_recorded`` signal
+    """
+
+    def __init__(self, sender=None):
+        self.sender = sender
+        self._lock = threading.Lock()
+        self.reset()
+
+    def incr(self, name, count=1):
+        """Increase the counter ``name`` by ``count``.
+        """
+        counters = self._counters
+        counters[name] = counters.get(name, 0) + count
+        if signals.stats_recorded.receivers:
+            signals.stats_recorded.send(sender=self.sender, name=name, kind='counter', value=count)
+
+    def timing(self, name, seconds):
+        """Add a duration (in seconds) to the timing histogram ``name``.
+        """
+        self._lock.acquire()
+        try:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = Timing()
+            timing.add(seconds)
+        finally:
+            self._lock.release()
+        if signals.stats_recorded.receivers:
+            signals.stats_recorded.send(sender=self.sender, name=name, kind='timing', value=seconds)
+
+    def reset(self):
+        """Set all counters and timings back to zero.
+        """
+        self._lock.acquire()
+        try:
+            self._counters = {}
+            self._timings = {}
+        finally:
+            self._lock.release()
+
+    def as_dict(self):
+        """Returns the counters and timings as a dict which can
+        be serialized as JSON:
+
+            {'counters': {'reads': 10, ...},
+             'timings': {'rebuild': {'count': 1, 'total_ms': ..., 'max_ms': ...,
+                                     'mean_ms': ..., 'buckets': {'1': 0, ...}}}}
+        """
+        self._lock.acquire()
+        try:
+            return {
+                'counters': dict(self._counters),
+                'timings': dict((name, timing.as_dict()) for name, timing in self._timings.iteritems()),
+            }
+        finally:
+            self._lock.release()
@@ -1,14 +1,42 @@
 # -*- coding: utf-8 -*-
 
-from django.test import TestCase
+import os
+import time
+import datetime
+import pickle
+import weakref
+import shutil
+import tempfile
+import threading
+from StringIO import StringIO
+
+from django.test import TestCase, TransactionTestCase
 from django.test.client import Client
-from django.contrib.auth.models import User
+from django.contrib.auth.models import User, Group
 from django.utils import simplejson
 from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
 
 from dynamicsettings import models
 from dynamicsettings import settings as dynamic_settings
+from dynamicsettings import DynamicSettings
+from dynamicsettings.tests import test_settings
+from dynamicsettings.datastructures import FrozenDict, FrozenList, PatchedRows, Snapshot, freeze, type_name
+import dynamicsettings
 from dynamicsettings import app_settings
+from dynamicsettings import broadcast
+from dynamicsettings import codec
+from dynamicsettings import flags
+from dynamicsettings import forms
+from dynamicsettings import history
+from dynamicsettings import localcache
+from dynamicsettings import middleware
+from dynamicsettings import schemas
+from dynamicsettings import signals
+from dynamicsettings import snapshotfile
 
 
 class DynamicSettingsViewsTestCase(TestCase):
@@ -58,11 +86,64 @@ class DynamicSettingsViewsTestCase(TestCase):
         self.assertTrue('settings_form_rendered' in response.context)
         #check against a couple random settings which should be present
         for setting_dict in response.context['dynamic_settings']:
-            self.assertEqual(setting_dict['type'], type(dynamic_settings.__getattr__(setting_dict['key'])).__name__, msg=setting_dict['key'])
+            self.assertEqual(setting_dict['type'], type_name(dynamic_settings.__getattr__(setting_dict['key'])), msg=setting_dict['key'])
             self.assertEqual(setting_dict['in_db'], False, msg=setting_dict['key']) #should be False at this moment
             self.assertEqual(setting_dict['can_change'], dynamic_settings.can_change(setting_dict['key']), msg=setting_dict['key'])
         self.client.logout()
     
+    def test_index_view_queries(self):
+        dynamic_settings.set_many({'TEST_SETTING1': 42, 'TEST_SETTING2': 'changed'})
+        logged_in = self.client.login(username=self.staff['username'], password=self.staff['password'])
+        self.assertTrue(logged_in)
+        page_size = app_settings.DYNAMICSETTINGS_INDEX_PAGE_SIZE
+        app_settings.DYNAMICSETTINGS_INDEX_PAGE_SIZE = 3
+        try:
+            #the settings which can be changed are on the first page
+            response = self.client.get('/')
+            keys = [setting_dict['key'] for setting_dict in response.context['dynamic_settings']]
+            self.assertEqual(keys, ['TEST_SETTING1', 'TEST_SETTING2', 'TEST_SETTING3'])
+            self.assertEqual([setting_dict['in_db'] for setting_dict in response.context['dynamic_settings']],
+                             [True, True, False])
+            self.assertTrue(response.context['page'].has_next())
+            #filter by name
+            response = self.client.get('/', {'q': 'test_setting', 'page': 2})
+            keys = [setting_dict['key'] for setting_dict in response.context['dynamic_settings']]
+            self.assertEqual(keys, ['TEST_SETTING4', 'TEST_SETTING5'])
+            self.assertEqual(response.context['query'], 'test_setting')
+            #filter by namespace
+            response = self.client.get('/', {'ns': 'test'})
+            keys = [setting_dict['key'] for setting_dict in response.context['dynamic_settings']]
+            self.assertEqual(keys, ['TEST_SETTING1', 'TEST_SETTING2', 'TEST_SETTING3'])
+            self.assertEqual(response.context['namespace'], 'TEST')
+            self.assertTrue('TEST' in response.context['namespaces'])
+            self.assertTrue('ns=TEST&amp;page=2' in response.content)
+            response = self.client.get('/', {'ns': 'TEST', 'q': '5'})
+            keys = [setting_dict['key'] for setting_dict in response.context['dynamic_settings']]
+            self.assertEqual(keys, ['TEST_SETTING5'])
+            #only the settings of the page are decoded
+            cache.clear()
+            dynamic_settings._wrapped = None
+            response = self.client.get('/', {'page': 2})
+            self.assertFalse('rows_decoded' in dynamic_settings.stats()['counters'])
+            self.assertEqual(dynamic_settings._snapshot.pending, set(['TEST_SETTING1', 'TEST_SETTING2']))
+            #the number of queries does not depend on the number of settings
+            #(the queries are reset at the beginning of every request)
+            connection = connections['default']
+            debug_cursor = connection.use_debug_cursor
+            connection.use_debug_cursor = True
+            try:
+                self.client.get('/', {'q': 'TEST_SETTING'})
+                test_setting_queries = len(connection.queries)
+                self.client.get('/', {'q': 'TEST_SETTING1'})
+                self.assertEqual(len(connection.queries), test_setting_queries)
+                self.assertFalse([query for query in connection.queries if 'dynamicsettings_settings' in query['sql']])
+            finally:
+                connection.use_debug_cursor = debug_cursor
+        finally:
+            app_settings.DYNAMICSETTINGS_INDEX_PAGE_SIZE = page_size
+            dynamic_settings.reset_many(['TEST_SETTING1', 'TEST_SETTING2'])
+        self.client.logout()
+    
     def test_index_view_normal(self):
         logged_in = self.client.login(username=self.normal['username'], password=self.normal['password'])
         self.assertTrue(logged_in)
@@ -87,6 +168,8 @@ class DynamicSettingsViewsTestCase(TestCase):
         self.assertEqual(content_json['value'], 42)
         self.assertEqual(content_json['type'], 'int')
         self.assertTrue(dynamic_settings.is_in_db('TEST_SETTING1'))
+        self.assertEqual(models.SettingsChange.objects.filter(key='TEST_SETTING1').latest('id').user.username,
+                         self.staff['username'])
         #change to non int
         response = self.client.post('/set/', {'key': 'TEST_SETTING1', 'value': 'some random string', 'type': 'int'})
         self.assertEqual(response.status_code, 200)
@@ -231,6 +314,48 @@ class DynamicSettingsViewsTestCase(TestCase):
         
         self.client.logout()
     
+    def test_set_many_view_staff(self):
+        logged_in = self.client.login(username=self.staff['username'], password=self.staff['password'])
+        self.assertTrue(logged_in)
+        response = self.client.get('/set_many/')
+        self.assertEqual(response.status_code, 405)
+        
+        submitted_settings = [
+            {'key': 'TEST_SETTING1', 'value': '42', 'type': 'int'},
+            {'key': 'TEST_SETTING2', 'value': 'my_custom_string', 'type': 'str'},
+        ]
+        response = self.client.post('/set_many/', {'settings': simplejson.dumps(submitted_settings)})
+        self.assertEqual(response.status_code, 200)
+        content_json = simplejson.loads(response.content)
+        self.assertEqual(content_json['status'], 'success')
+        self.assertEqual(content_json['settings']['TEST_SETTING1'], {'value': 42, 'type': 'int'})
+        self.assertEqual(content_json['settings']['TEST_SETTING2'], {'value': 'my_custom_string', 'type': 'str'})
+        self.assertEqual(dynamic_settings.TEST_SETTING1, 42)
+        self.assertEqual(dynamic_settings.TEST_SETTING2, 'my_custom_string')
+        self.assertEqual(dynamic_settings.reset_many(['TEST_SETTING1', 'TEST_SETTING2']), ['TEST_SETTING1', 'TEST_SETTING2'])
+        
+        #one invalid setting, none of the settings should be saved
+        submitted_settings = [
+            {'key': 'TEST_SETTING1', 'value': '42', 'type': 'int'},
+            {'key': 'TEST_SETTING3', 'value': '{"d": 123}', 'type': 'list'},
+        ]
+        response = self.client.post('/set_many/', {'settings': simplejson.dumps(submitted_settings)})
+        self.assertEqual(response.status_code, 200)
+        content_json = simplejson.loads(response.content)
+        self.assertEqual(content_json['status'], 'error')
+        self.assertTrue('TEST_SETTING3' in content_json['errors'])
+        self.assertFalse('TEST_SETTING1' in content_json['errors'])
+        self.assertFalse(dynamic_settings.is_in_db('TEST_SETTING1'))
+        self.assertEqual(dynamic_settings.TEST_SETTING1, 73)
+        
+        #no valid JSON list
+        response = self.client.post('/set_many/', {'settings': '{"TEST_SETTING1": 42}'})
+        self.assertEqual(response.status_code, 200)
+        content_json = simplejson.loads(response.content)
+        self.assertEqual(content_json['status'], 'error')
+        
+        self.client.logout()
+    
     def test_reset_view_normal(self):
         logged_in = self.client.login(username=self.normal['username'], password=self.normal['password'])
         self.assertTrue(logged_in)
@@ -247,5 +372,1382 @@ class DynamicSettingsViewsTestCase(TestCase):
         self.assertEqual(dynamic_settings.TEST_SETTING1, 73)
         
         self.client.logout()
+    
+    def test_stats_view(self):
+        logged_in = self.client.login(username=self.normal['username'], password=self.normal['password'])
+        self.assertTrue(logged_in)
+        response = self.client.get('/stats/')
+        self.assertFalse('"counters"' in response.content)
+        self.client.logout()
+        
+        logged_in = self.client.login(username=self.staff['username'], password=self.staff['password'])
+        self.assertTrue(logged_in)
+        dynamic_settings.TEST_SETTING1
+        response = self.client.get('/stats/')
+        self.assertEqual(response.status_code, 200)
+        stats = simplejson.loads(response.content)
+        self.assertEqual(stats['version'], dynamic_settings.version())
+        self.assertTrue(stats['counters']['reads'] > 0)
+        response = self.client.post('/stats/')
+        self.assertEqual(response.status_code, 405)
+        self.client.logout()
+
+
+class DynamicSettingsVersionTestCase(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        app_settings.DYNAMICSETTINGS_INCLUDE_MODULES = ['dynamicsettings.tests.test_settings']
+        app_settings.DYNAMICSETTINGS_INCLUDE_SETTINGS = ['TEST_SETTING1', 'TEST_SETTING2']
+        self.check_interval = app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL
+        app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL = 60
+    
+    def tearDown(self):
+        app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL = self.check_interval
+        cache.clear()
+    
+    def test_version_increases(self):
+        worker = DynamicSettings()
+        version = worker.version()
+        worker.set('TEST_SETTING1', 1, 'int')
+        self.assertEqual(worker.version(), version + 1)
+        worker.reset('TEST_SETTING1')
+        self.assertEqual(worker.version(), version + 2)
+        self.assertEqual(models.Version.objects.get(pk=1).version, version + 2)
+    
+    def test_change_seen_by_other_worker(self):
+        worker1 = DynamicSettings()
+        worker2 = DynamicSettings()
+        self.assertEqual(worker2.TEST_SETTING1, 73)
+        worker1.set('TEST_SETTING1', 42, 'int')
+        #worker2 does not check the version before the interval passed
+        self.assertEqual(worker2.TEST_SETTING1, 73)
+        worker2._next_version_check = 0
+        self.assertEqual(worker2.TEST_SETTING1, 42)
+        self.assertEqual(worker2.version(), worker1.version())
+        worker1.reset('TEST_SETTING1')
+        worker2._next_version_check = 0
+        self.assertEqual(worker2.get('TEST_SETTING1'), 73)
+    
+    def test_snapshot_not_rebuilt_if_version_unchanged(self):
+        worker1 = DynamicSettings()
+        worker2 = DynamicSettings()
+        snapshot = worker2._snapshot
+        worker2._snapshot = Snapshot(snapshot.version, FrozenDict({'TEST_SETTING1': 'local'}), snapshot.sources)
+        worker2._next_version_check = 0
+        #same version, so the local settings are kept
+        self.assertEqual(worker2.TEST_SETTING1, 'local')
+        worker1.set('TEST_SETTING2', 'changed', 'str')
+        worker2._next_version_check = 0
+        self.assertEqual(worker2.TEST_SETTING1, 73)
+        self.assertEqual(worker2.TEST_SETTING2, 'changed')
+    
+    def test_version_from_db_on_cache_miss(self):
+        worker1 = DynamicSettings()
+        worker1.set('TEST_SETTING1', 42, 'int')
+        cache.clear()
+        worker2 = DynamicSettings()
+        self.assertEqual(worker2.version(), worker1.version())
+        self.assertEqual(worker2.TEST_SETTING1, 42)
+        worker1.reset('TEST_SETTING1')
+    
+    def test_set_patches_settings(self):
+        worker = DynamicSettings()
+        def combine_settings():
+            raise AssertionError('settings should not be combined again')
+        worker._combine_settings = combine_settings
+        worker.set('TEST_SETTING1', 42, 'int')
+        self.assertEqual(worker.TEST_SETTING1, 42)
+        self.assertEqual(cache.get('dynamicsettings.snapshot')['settings']['TEST_SETTING1'], 42)
+        worker.reset('TEST_SETTING1')
+        self.assertEqual(worker.TEST_SETTING1, 73)
+        self.assertEqual(cache.get('dynamicsettings.snapshot')['settings']['TEST_SETTING1'], 73)
+    
+    def test_set_with_outdated_settings(self):
+        worker1 = DynamicSettings()
+        worker2 = DynamicSettings()
+        worker1.set('TEST_SETTING2', 'changed', 'str')
+        #worker2 did not notice the change yet, so its settings have to be combined again
+        worker2.set('TEST_SETTING1', 42, 'int')
+        self.assertEqual(worker2.TEST_SETTING1, 42)
+        self.assertEqual(worker2.TEST_SETTING2, 'changed')
+        worker2.reset('TEST_SETTING1')
+        worker2.reset('TEST_SETTING2')
+    
+    def test_set_many(self):
+        worker = DynamicSettings()
+        worker.set('TEST_SETTING1', 1, 'int')
+        version = worker.version()
+        worker.set_many({'TEST_SETTING1': 42, 'TEST_SETTING2': 'changed'}, {'TEST_SETTING1': 'int'})
+        #only one version for all settings
+        self.assertEqual(worker.version(), version + 1)
+        self.assertEqual(worker.TEST_SETTING1, 42)
+        self.assertEqual(worker.TEST_SETTING2, 'changed')
+        self.assertEqual(models.Settings.objects.get(key='TEST_SETTING1').type, 'int')
+        self.assertEqual(models.Settings.objects.get(key='TEST_SETTING2').type, 'str')
+        self.assertEqual(DynamicSettings().dict(['TEST_SETTING1', 'TEST_SETTING2']),
+                         {'TEST_SETTING1': 42, 'TEST_SETTING2': 'changed'})
+        self.assertEqual(sorted(worker.reset_many(['TEST_SETTING1', 'TEST_SETTING2', 'TEST_SETTING3'])),
+                         ['TEST_SETTING1', 'TEST_SETTING2'])
+        self.assertEqual(worker.version(), version + 2)
+        self.assertEqual(worker.TEST_SETTING1, 73)
+        self.assertEqual(worker.TEST_SETTING2, 'a string')
+        self.assertEqual(worker.reset_many(['TEST_SETTING1']), [])
+        self.assertEqual(worker.version(), version + 2)
+        #nothing to set, the version is not increased
+        self.assertTrue(worker.set_many({}))
+        self.assertEqual(worker.version(), version + 2)
+    
+    def test_set_many_not_allowed(self):
+        worker = DynamicSettings()
+        self.assertRaises(KeyError, worker.set_many, {'TEST_SETTING1': 42, 'TEST_SETTING3': [4, 5]})
+        self.assertFalse(models.Settings.objects.exists())
+        self.assertEqual(worker.TEST_SETTING1, 73)
+    
+    def test_source(self):
+        worker = DynamicSettings()
+        self.assertEqual(worker.source('TEST_SETTING1'), 'dynamicsettings.tests.test_settings')
+        self.assertEqual(worker.source('INSTALLED_APPS'), 'global')
+        self.assertEqual(worker.source('NOT_EXISTING_SETTING'), None)
+        worker.set('TEST_SETTING1', 42, 'int')
+        self.assertEqual(worker.source('TEST_SETTING1'), 'db')
+        self.assertTrue(worker.is_in_db('TEST_SETTING1'))
+        self.assertEqual(DynamicSettings().source('TEST_SETTING1'), 'db')
+        worker.reset('TEST_SETTING1')
+        self.assertEqual(worker.source('TEST_SETTING1'), 'dynamicsettings.tests.test_settings')
+        self.assertFalse(worker.is_in_db('TEST_SETTING1'))
+
+    
+    def test_cache_mode_keys(self):
+        cache_mode = app_settings.DYNAMICSETTINGS_CACHE_MODE
+        app_settings.DYNAMICSETTINGS_CACHE_MODE = 'keys'
+        app_settings.DYNAMICSETTINGS_INCLUDE_SETTINGS = ['TEST_SETTING1', 'TEST_SETTING2', 'TEST_SETTING3']
+        try:
+            worker1 = DynamicSettings()
+            worker1.set_many({'TEST_SETTING1': 42, 'TEST_SETTING2': 'changed', 'TEST_SETTING3': [4, 5]})
+            self.assertEqual(cache.get('dynamicsettings.setting.TEST_SETTING1'), 42)
+            self.assertEqual(cache.get('dynamicsettings.snapshot'), None)
+            worker2 = DynamicSettings()
+            #only the names of the settings in the database are loaded
+            self.assertEqual(worker2._snapshot.pending, set(['TEST_SETTING1', 'TEST_SETTING2', 'TEST_SETTING3']))
+            self.assertTrue(worker2.is_in_db('TEST_SETTING1'))
+            self.assertEqual(worker2.TEST_SETTING1, 42)
+            self.assertEqual(worker2._snapshot.pending, set(['TEST_SETTING2', 'TEST_SETTING3']))
+            self.assertEqual(worker2.dict(['TEST_SETTING2', 'TEST_SETTING4']),
+                             {'TEST_SETTING2': 'changed', 'TEST_SETTING4': {'key': 'value', 'num': 3}})
+            self.assertEqual(worker2._snapshot.pending, set(['TEST_SETTING3']))
+            #missing in the cache, so it is taken from the database
+            cache.delete('dynamicsettings.setting.TEST_SETTING3')
+            self.assertEqual(worker2.get('TEST_SETTING3'), [4, 5])
+            self.assertEqual(cache.get('dynamicsettings.setting.TEST_SETTING3'), [4, 5])
+            worker1.reset('TEST_SETTING1')
+            self.assertEqual(cache.get('dynamicsettings.setting.TEST_SETTING1'), None)
+            worker2._next_version_check = 0
+            self.assertEqual(worker2.TEST_SETTING1, 73)
+            self.assertFalse(worker2.is_in_db('TEST_SETTING1'))
+            self.assertEqual(worker2.dict()['TEST_SETTING2'], 'changed')
+            worker1.reset_many(['TEST_SETTING2', 'TEST_SETTING3'])
+        finally:
+            app_settings.DYNAMICSETTINGS_CACHE_MODE = cache_mode
+    
+    def test_local_cache(self):
+        local_cache = localcache.LocalCache(60, 2)
+        local_cache.set('a', 1)
+        local_cache.set('b', 2)
+        self.assertEqual(local_cache.get('a'), 1)
+        #'b' is the least recently used entry
+        local_cache.set('c', 3)
+        self.assertEqual(local_cache.get('b'), None)
+        self.assertEqual(local_cache.get('a'), 1)
+        self.assertEqual(local_cache.get('c'), 3)
+        self.assertEqual(len(local_cache), 2)
+        #expired
+        local_cache.timeout = 0
+        local_cache.set('a', 4)
+        self.assertEqual(local_cache.get('a', 'missing'), 'missing')
+    
+    def test_local_cache_tier(self):
+        cache_mode = app_settings.DYNAMICSETTINGS_CACHE_MODE
+        app_settings.DYNAMICSETTINGS_CACHE_MODE = 'keys'
+        app_settings.DYNAMICSETTINGS_LOCAL_CACHE_TIMEOUT = 60
+        try:
+            worker1 = DynamicSettings()
+            worker1.set('TEST_SETTING1', 42, 'int')
+            worker1.for_scope('site-1').set('TEST_SETTING2', 'site', 'str')
+            worker2 = DynamicSettings()
+            self.assertEqual(worker2.TEST_SETTING1, 42)
+            self.assertEqual(worker2.for_scope('site-1').TEST_SETTING2, 'site')
+            #another process changes the same settings, the values kept in
+            #the local cache are not used for the new version
+            worker1.set('TEST_SETTING1', 43, 'int')
+            worker1.for_scope('site-1').set('TEST_SETTING2', 'changed', 'str')
+            worker2._next_version_check = 0
+            self.assertEqual(worker2.TEST_SETTING1, 43)
+            self.assertEqual(worker2.for_scope('site-1').TEST_SETTING2, 'changed')
+            stats = worker2.stats()
+            self.assertFalse('l1_hits' in stats['counters'])
+            self.assertEqual(stats['counters']['l1_misses'], 4)
+            self.assertEqual(stats['counters']['l2_hits'], 4)
+            #but for the same version
+            version = worker2.version()
+            self.assertEqual(worker2._cache.get('dynamicsettings.setting.TEST_SETTING1', version), 43)
+            self.assertEqual(worker2.stats()['counters']['l1_hits'], 1)
+            self.assertEqual(worker2.stats()['hit_rates'], {'l1': 1.0 / 5, 'l2': 1.0})
+            #changes made by the process itself are seen immediately
+            worker2.set('TEST_SETTING1', 44, 'int')
+            worker2.reset('TEST_SETTING2')
+            version = worker2.version()
+            self.assertEqual(worker2._cache.get('dynamicsettings.setting.TEST_SETTING1', version), 44)
+            self.assertEqual(worker2._cache.get('dynamicsettings.setting.TEST_SETTING2', version), None)
+            worker2.reset('TEST_SETTING1')
+            worker2.for_scope('site-1').reset('TEST_SETTING2')
+        finally:
+            app_settings.DYNAMICSETTINGS_CACHE_MODE = cache_mode
+            app_settings.DYNAMICSETTINGS_LOCAL_CACHE_TIMEOUT = 0
+    
+    def test_expired_settings_combined_once(self):
+        worker1 = DynamicSettings()
+        worker2 = DynamicSettings()
+        def combine_settings():
+            raise AssertionError('settings should not be combined again')
+        worker2._combine_settings = combine_settings
+        worker1.set('TEST_SETTING1', 42, 'int')
+        snapshot = cache.get('dynamicsettings.snapshot')
+        snapshot['expires'] = time.time() - 1
+        cache.set('dynamicsettings.snapshot', snapshot)
+        #another process is combining the settings at the moment
+        cache.add('dynamicsettings.lock', True)
+        worker2._next_version_check = 0
+        self.assertEqual(worker2.TEST_SETTING1, 42)
+        self.assertEqual(worker2.version(), worker1.version())
+        #the lock is released, the first process will combine the settings again
+        cache.delete('dynamicsettings.lock')
+        worker3 = DynamicSettings()
+        self.assertEqual(worker3.TEST_SETTING1, 42)
+        self.assertTrue(cache.get('dynamicsettings.snapshot')['expires'] > time.time())
+        self.assertEqual(cache.get('dynamicsettings.lock'), None)
+        worker1.reset('TEST_SETTING1')
+    
+    def test_stats(self):
+        recorded = []
+        def receiver(sender, name, kind, value, **kwargs):
+            recorded.append((name, kind))
+        signals.stats_recorded.connect(receiver)
+        try:
+            worker1 = DynamicSettings()
+            worker1.set('TEST_SETTING1', 42, 'int')
+            worker1.TEST_SETTING1
+            worker1.get('TEST_SETTING2')
+            worker2 = DynamicSettings()
+        finally:
+            signals.stats_recorded.disconnect(receiver)
+        stats = worker1.stats()
+        self.assertEqual(stats['version'], 1)
+        self.assertEqual(stats['counters']['reads'], 2)
+        self.assertEqual(stats['counters']['cache_misses'], 1)
+        self.assertEqual(stats['counters']['rebuilds'], 1)
+        self.assertEqual(stats['timings']['rebuild']['count'], 1)
+        self.assertEqual(stats['timings']['write']['count'], 1)
+        self.assertEqual(sum(stats['timings']['write']['buckets'].values()), 1)
+        #the second worker is using the cached settings
+        stats = worker2.stats()
+        self.assertEqual(stats['counters']['cache_hits'], 1)
+        self.assertFalse('rebuilds' in stats['counters'])
+        self.assertTrue(('write', 'timing') in recorded)
+        self.assertTrue(('reads', 'counter') in recorded)
+        self.assertTrue(('cache_hits', 'counter') in recorded)
+    
+    def test_settings_decoded_when_used(self):
+        worker1 = DynamicSettings()
+        worker1.set_many({'TEST_SETTING1': 42, 'TEST_SETTING2': 'changed'})
+        #the settings are combined again, the changed settings were
+        #decoded by the first worker
+        cache.clear()
+        worker2 = DynamicSettings()
+        self.assertEqual(worker2.source('TEST_SETTING2'), 'db')
+        self.assertFalse('rows_decoded' in worker2.stats()['counters'])
+        self.assertEqual(worker2.TEST_SETTING1, 42)
+        self.assertEqual(worker2.TEST_SETTING1, 42)
+        self.assertEqual(worker2.stats()['counters']['rows_decoded'], 1)
+        self.assertEqual(worker2.dict()['TEST_SETTING2'], 'changed')
+        self.assertEqual(worker2.stats()['counters']['rows_decoded'], 2)
+        #the settings which are not decoded yet are published encoded
+        cached = cache.get('dynamicsettings.snapshot')
+        self.assertFalse('TEST_SETTING2' in cached['settings'])
+        self.assertEqual(cached['raw']['TEST_SETTING2'][1], 'str')
+        worker1.reset_many(['TEST_SETTING1', 'TEST_SETTING2'])
+    
+    def test_prefix_and_namespace(self):
+        worker = DynamicSettings()
+        worker.set('TEST_SETTING1', 42, 'int')
+        self.assertEqual(worker.prefix('TEST_SETTING'), {
+            'TEST_SETTING1': 42, 'TEST_SETTING2': 'a string', 'TEST_SETTING3': [1, 2, 3],
+            'TEST_SETTING4': {'key': 'value', 'num': 3}, 'TEST_SETTING5': None,
+        })
+        self.assertEqual(worker.prefix('TEST_SETTING4'), {'TEST_SETTING4': {'key': 'value', 'num': 3}})
+        self.assertEqual(worker.prefix('NOT_EXISTING_'), {})
+        namespace = worker.namespace('TEST')
+        self.assertEqual(namespace['SETTING1'], 42)
+        self.assertEqual(namespace['SETTING2'], 'a string')
+        self.assertEqual(worker.namespace('TEST_SETTING'), {})
+        self.assertTrue('TEST' in worker.namespaces())
+        self.assertTrue('DYNAMICSETTINGS' not in worker.namespaces())
+        self.assertEqual(worker.namespaces(), sorted(worker.namespaces()))
+        #the pinned settings are used
+        with worker.pinned():
+            other_worker = DynamicSettings()
+            other_worker.reset('TEST_SETTING1')
+            worker._next_version_check = 0
+            self.assertEqual(worker.namespace('TEST')['SETTING1'], 42)
+        self.assertEqual(worker.namespace('TEST')['SETTING1'], 73)
+    
+    def test_scopes(self):
+        worker1 = DynamicSettings()
+        site1 = worker1.for_scope('site-1')
+        site2 = worker1.for_scope('site-2')
+        site1.set('TEST_SETTING1', 1, 'int')
+        worker1.set('TEST_SETTING2', 'changed', 'str')
+        self.assertEqual(site1.TEST_SETTING1, 1)
+        self.assertEqual(site1.TEST_SETTING2, 'changed')
+        self.assertEqual(site2.TEST_SETTING1, 73)
+        self.assertEqual(worker1.TEST_SETTING1, 73)
+        self.assertEqual(worker1.get('TEST_SETTING1', scope='site-1'), 1)
+        self.assertRaises(AttributeError, getattr, site1, 'NOT_EXISTING')
+        self.assertEqual(site1.source('TEST_SETTING1'), 'scope')
+        self.assertEqual(site1.source('TEST_SETTING2'), 'db')
+        self.assertEqual(site2.source('TEST_SETTING1'), 'dynamicsettings.tests.test_settings')
+        self.assertEqual(site1.dict(['TEST_SETTING1', 'TEST_SETTING2']),
+                         {'TEST_SETTING1': 1, 'TEST_SETTING2': 'changed'})
+        self.assertEqual(site1.dict()['TEST_SETTING1'], 1)
+        self.assertEqual(site2.dict()['TEST_SETTING1'], 73)
+        self.assertEqual(models.Settings.objects.get(key='TEST_SETTING1').scope, 'site-1')
+        #seen by other processes, the settings of both scopes are cached
+        loaded = []
+        class CountingDynamicSettings(DynamicSettings):
+            def _get_scope_overrides(self, scope):
+                loaded.append(scope)
+                return super(CountingDynamicSettings, self)._get_scope_overrides(scope)
+        worker2 = CountingDynamicSettings()
+        self.assertEqual(worker2.get('TEST_SETTING1', scope='site-1'), 1)
+        self.assertEqual(worker2.get('TEST_SETTING1', scope='site-2'), 73)
+        self.assertEqual(loaded, [])
+        #only the changed scope is loaded again
+        site1.set_many({'TEST_SETTING1': 2, 'TEST_SETTING2': 'site'})
+        worker2._next_version_check = 0
+        self.assertEqual(worker2.get('TEST_SETTING1', scope='site-1'), 2)
+        self.assertEqual(worker2.get('TEST_SETTING2', scope='site-1'), 'site')
+        self.assertEqual(worker2.get('TEST_SETTING1', scope='site-2'), 73)
+        self.assertEqual(loaded, [])
+        self.assertEqual(site1.reset_many(['TEST_SETTING1', 'TEST_SETTING2']), ['TEST_SETTING1', 'TEST_SETTING2'])
+        self.assertFalse(site1.reset('TEST_SETTING1'))
+        self.assertEqual(site1.TEST_SETTING1, 73)
+        self.assertEqual(site1.TEST_SETTING2, 'changed')
+        worker1.reset('TEST_SETTING2')
+        self.assertEqual(site1.TEST_SETTING2, 'a string')
+    
+    def test_cache_timeout_jitter(self):
+        worker = DynamicSettings()
+        timeout = app_settings.DYNAMICSETTINGS_CACHE_TIMEOUT
+        min_timeout = timeout - timeout * app_settings.DYNAMICSETTINGS_CACHE_JITTER
+        timeouts = set()
+        for i in range(50):
+            cache_timeout = worker._cache_timeout()
+            self.assertTrue(min_timeout - 1 <= cache_timeout <= timeout)
+            timeouts.add(cache_timeout)
+        self.assertTrue(len(timeouts) > 1)
+
+    
+    def test_reload_static(self):
+        dynamicsettings.reload_static()
+        dynamicsettings.warm_up()
+        worker = DynamicSettings()
+        test_settings.TEST_SETTING6 = 'new'
+        try:
+            #the module settings are only combined once per process
+            cache.clear()
+            self.assertEqual(DynamicSettings().get('TEST_SETTING6'), None)
+            worker.reload_static()
+            self.assertEqual(worker.TEST_SETTING6, 'new')
+            self.assertEqual(worker.source('TEST_SETTING6'), 'dynamicsettings.tests.test_settings')
+            self.assertEqual(DynamicSettings().TEST_SETTING6, 'new')
+        finally:
+            del test_settings.TEST_SETTING6
+            dynamicsettings.reload_static()
+
+    
+    def test_pinned(self):
+        worker1 = DynamicSettings()
+        worker2 = DynamicSettings()
+        with worker2.pinned() as pinned_settings:
+            self.assertEqual(pinned_settings['TEST_SETTING1'], 73)
+            worker1.set('TEST_SETTING1', 42, 'int')
+            worker2._next_version_check = 0
+            #still the pinned settings
+            self.assertEqual(worker2.TEST_SETTING1, 73)
+            self.assertEqual(worker2.get('TEST_SETTING1'), 73)
+            self.assertEqual(worker2.dict(['TEST_SETTING1']), {'TEST_SETTING1': 73})
+            self.assertEqual(worker2.dict(), dict(pinned_settings))
+            self.assertEqual(pinned_settings.get('NOT_EXISTING_SETTING', 'default'), 'default')
+            self.assertTrue('TEST_SETTING1' in pinned_settings)
+            self.assertRaises(AttributeError, getattr, worker2, 'NOT_EXISTING_SETTING')
+            #the settings are only pinned for the current thread
+            values = []
+            thread = threading.Thread(target=lambda: values.append(worker2.TEST_SETTING1))
+            thread.start()
+            thread.join()
+            self.assertEqual(values, [42])
+            with worker2.pinned():
+                self.assertEqual(worker2.TEST_SETTING1, 42)
+            self.assertEqual(worker2.TEST_SETTING1, 73)
+            #changes of the thread itself are visible, but not the changes
+            #of other processes
+            worker2.set('TEST_SETTING2', 'changed', 'str')
+            self.assertEqual(worker2.TEST_SETTING2, 'changed')
+            self.assertEqual(worker2.TEST_SETTING1, 73)
+            worker2.reset_many(['TEST_SETTING2'])
+            self.assertEqual(worker2.TEST_SETTING2, 'a string')
+            worker2.set('TEST_SETTING2', 'changed', 'str')
+        self.assertEqual(worker2.TEST_SETTING1, 42)
+        worker1.reset_many(['TEST_SETTING1', 'TEST_SETTING2'])
+    
+    def test_middleware(self):
+        settings_middleware = middleware.DynamicSettingsMiddleware()
+        request = HttpRequest()
+        settings_middleware.process_request(request)
+        try:
+            self.assertEqual(request.dynamic_settings['TEST_SETTING1'], 73)
+            self.assertEqual(dynamic_settings.TEST_SETTING1, 73)
+        finally:
+            response = settings_middleware.process_response(request, HttpResponse())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(dynamic_settings._local.snapshot, None)
+    
+    def test_pinned_settings_decoded_when_used(self):
+        worker1 = DynamicSettings()
+        worker1.set_many({'TEST_SETTING1': 42, 'TEST_SETTING2': 'changed'})
+        #the settings are combined again (see ``test_settings_decoded_when_used``)
+        cache.clear()
+        worker2 = DynamicSettings()
+        #a request only decodes the settings it reads
+        settings_middleware = middleware.DynamicSettingsMiddleware()
+        request = HttpRequest()
+        dynamicsettings.settings._wrapped = worker2
+        try:
+            settings_middleware.process_request(request)
+            try:
+                self.assertEqual(worker2._snapshot.pending, set(['TEST_SETTING1', 'TEST_SETTING2']))
+                self.assertEqual(request.dynamic_settings['TEST_SETTING1'], 42)
+                self.assertEqual(worker2.get('TEST_SETTING1'), 42)
+                self.assertEqual(worker2._snapshot.pending, set(['TEST_SETTING2']))
+                self.assertEqual(worker2.stats()['counters']['rows_decoded'], 1)
+                self.assertEqual(worker2.TEST_SETTING2, 'changed')
+                self.assertEqual(worker2._snapshot.pending, set())
+            finally:
+                settings_middleware.process_response(request, HttpResponse())
+        finally:
+            dynamicsettings.settings._wrapped = None
+        worker1.reset_many(['TEST_SETTING1', 'TEST_SETTING2'])
+
+
+class DynamicSettingsCodecTestCase(TestCase):
+    values = [
+        (None, 'NoneType'),
+        (True, 'bool'),
+        (False, 'bool'),
+        (42, 'int'),
+        (2**70, 'long'),
+        (0.1, 'float'),
+        ('a string', 'str'),
+        (u'你好', 'unicode'),
+        ([1, 'a', None], 'list'),
+        ((1, 2, [3]), 'tuple'),
+        ({'key': [1, 2], 'num': 3.5}, 'dict'),
+    ]
+    
+    def setUp(self):
+        cache.clear()
+        app_settings.DYNAMICSETTINGS_INCLUDE_MODULES = ['dynamicsettings.tests.test_settings']
+        app_settings.DYNAMICSETTINGS_INCLUDE_SETTINGS = ['TEST_SETTING1', 'TEST_SETTING3', 'TEST_SETTING4']
+    
+    def tearDown(self):
+        cache.clear()
+    
+    def test_typed_codec(self):
+        typed_codec = codec.TypedCodec()
+        for value, value_type in self.values:
+            encoded_value = typed_codec.encode(value, value_type)
+            self.assertTrue(isinstance(encoded_value, basestring), msg=value_type)
+            decoded_value = typed_codec.decode(encoded_value, value_type)
+            self.assertEqual(decoded_value, value, msg=value_type)
+            self.assertEqual(type(decoded_value).__name__, value_type)
+        self.assertEqual(typed_codec.encode([1, 2], 'list'), '[1,2]')
+        self.assertRaises(ValueError, typed_codec.encode, 1, 'object')
+        self.assertRaises(ValueError, typed_codec.encode, [object()], 'list')
+        #values which would be changed by JSON
+        self.assertRaises(ValueError, typed_codec.encode, {1: 'x'}, 'dict')
+        self.assertRaises(ValueError, typed_codec.encode, [(1, 2)], 'list')
+        self.assertRaises(ValueError, DynamicSettings().set, 'TEST_SETTING4', {1: 'x'})
+        self.assertEqual(models.Settings.objects.count(), 0)
+    
+    def test_typed_codec_strings(self):
+        typed_codec = codec.TypedCodec()
+        #byte strings are saved as text, other byte strings base64 encoded
+        self.assertEqual(typed_codec.encode('caf\xc3\xa9', 'str'), u'caf\xe9')
+        for value in ['caf\xc3\xa9', '\xff\xfe', codec.BYTES_PREFIX.encode('utf-8') + 'x',
+                      codec.PickleCodec().encode('abc', 'str')]:
+            encoded_value = typed_codec.encode(value, 'str')
+            self.assertEqual(typed_codec.decode(encoded_value, 'str'), value)
+        self.assertEqual(typed_codec.decode(typed_codec.encode(u'caf\xe9', 'unicode'), 'unicode'), u'caf\xe9')
+        worker = DynamicSettings()
+        app_settings.DYNAMICSETTINGS_INCLUDE_SETTINGS = ['TEST_SETTING2']
+        worker.set('TEST_SETTING2', 'caf\xc3\xa9')
+        cache.clear()
+        self.assertEqual(DynamicSettings().TEST_SETTING2, 'caf\xc3\xa9')
+        worker.reset('TEST_SETTING2')
+    
+    def test_legacy_pickled_strings(self):
+        #strings saved as pickles and not converted, read without unpickling them
+        typed_codec = codec.TypedCodec()
+        pickle_codec = codec.PickleCodec()
+        for value, value_type in [('abc', 'str'), ("it's", 'str'), ('caf\xc3\xa9', 'str'),
+                                  (u'caf\xe9', 'unicode'), (u'', 'unicode')]:
+            decoded_value = typed_codec.decode(pickle_codec.encode(value, value_type), value_type)
+            self.assertEqual(decoded_value, value)
+            self.assertEqual(type(decoded_value).__name__, value_type)
+        #text which only looks like base64 is kept
+        self.assertEqual(typed_codec.decode(u'abcd', 'str'), 'abcd')
+    
+    def test_saved_with_typed_codec(self):
+        worker = DynamicSettings()
+        worker.set('TEST_SETTING1', 42, 'int')
+        worker.set('TEST_SETTING3', [4, 5], 'list')
+        self.assertEqual(models.Settings.objects.get(key='TEST_SETTING1').value, '42')
+        self.assertEqual(models.Settings.objects.get(key='TEST_SETTING3').value, '[4,5]')
+        cache.clear()
+        worker = DynamicSettings()
+        self.assertEqual(worker.TEST_SETTING1, 42)
+        self.assertEqual(worker.TEST_SETTING3, [4, 5])
+    
+    def test_convert_command(self):
+        pickle_codec = codec.PickleCodec()
+        models.Settings.objects.create(key='TEST_SETTING1', value=pickle_codec.encode(42, 'int'), type='int')
+        models.Settings.objects.create(key='TEST_SETTING4', value=pickle_codec.encode({'a': [1]}, 'dict'), type='dict')
+        call_command('convertdynamicsettings', stdout=StringIO())
+        self.assertEqual(models.Settings.objects.get(key='TEST_SETTING1').value, '42')
+        self.assertEqual(models.Settings.objects.get(key='TEST_SETTING4').value, '{"a":[1]}')
+        worker = DynamicSettings()
+        self.assertEqual(worker.TEST_SETTING1, 42)
+        self.assertEqual(worker.TEST_SETTING4, {'a': [1]})
+    
+    def test_convert_command_fails(self):
+        pickle_codec = codec.PickleCodec()
+        models.Settings.objects.create(key='TEST_SETTING1', value=pickle_codec.encode(42, 'int'), type='int')
+        value = pickle_codec.encode({1: 'x'}, 'dict')
+        models.Settings.objects.create(key='TEST_SETTING4', value=value, type='dict')
+        #call_command exits on errors of commands
+        self.assertRaises(SystemExit, call_command, 'convertdynamicsettings',
+                          stdout=StringIO(), stderr=StringIO())
+        #nothing is converted
+        self.assertEqual(models.Settings.objects.get(key='TEST_SETTING4').value, value)
+        self.assertEqual(models.Settings.objects.get(key='TEST_SETTING1').value, pickle_codec.encode(42, 'int'))
+
+
+class DynamicSettingsBroadcastTestCase(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        app_settings.DYNAMICSETTINGS_INCLUDE_MODULES = ['dynamicsettings.tests.test_settings']
+        app_settings.DYNAMICSETTINGS_INCLUDE_SETTINGS = ['TEST_SETTING1']
+        self.check_interval = app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL
+        app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL = 60
+        self.tmp_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL = self.check_interval
+        app_settings.DYNAMICSETTINGS_BROADCAST = None
+        shutil.rmtree(self.tmp_dir)
+        cache.clear()
+    
+    def test_local_broadcast(self):
+        app_settings.DYNAMICSETTINGS_BROADCAST = 'dynamicsettings.broadcast.LocalBroadcast'
+        worker1 = DynamicSettings()
+        worker2 = DynamicSettings()
+        self.assertEqual(worker2.TEST_SETTING1, 73)
+        worker1.set('TEST_SETTING1', 42, 'int')
+        #seen immediately, without waiting for the next version check
+        self.assertEqual(worker2.TEST_SETTING1, 42)
+        worker1.reset('TEST_SETTING1')
+        self.assertEqual(worker2.TEST_SETTING1, 73)
+    
+    def test_subscription_removed(self):
+        local_broadcast = broadcast.LocalBroadcast()
+        worker = DynamicSettings()
+        proxy = weakref.proxy(worker)
+        local_broadcast.subscribe(lambda version: proxy._notify_version(version))
+        self.assertEqual(len(local_broadcast._subscribers), 1)
+        del worker
+        local_broadcast.publish(1)
+        self.assertEqual(len(local_broadcast._subscribers), 0)
+    
+    def test_file_broadcast(self):
+        path = os.path.join(self.tmp_dir, 'version')
+        #publisher and subscriber are usually in different processes
+        publisher = broadcast.FileBroadcast(path)
+        subscriber = broadcast.FileBroadcast(path, poll_interval=0.01)
+        received = []
+        notified = threading.Event()
+        def callback(version):
+            received.append((version, time.time()))
+            notified.set()
+        subscriber.subscribe(callback)
+        try:
+            time.sleep(0.05)
+            for version in (7, 8):
+                notified.clear()
+                published = time.time()
+                publisher.publish(version)
+                self.assertTrue(notified.wait(2) or notified.is_set())
+                received_version, received_time = received[-1]
+                self.assertEqual(received_version, version)
+                #propagation time
+                self.assertTrue(received_time - published < 1)
+        finally:
+            subscriber.close()
+
+
+class DynamicSettingsSnapshotFileTestCase(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        app_settings.DYNAMICSETTINGS_INCLUDE_MODULES = ['dynamicsettings.tests.test_settings']
+        app_settings.DYNAMICSETTINGS_INCLUDE_SETTINGS = ['TEST_SETTING1']
+        self.check_interval = app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL
+        app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL = 60
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'snapshot')
+    
+    def tearDown(self):
+        app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL = self.check_interval
+        app_settings.DYNAMICSETTINGS_SNAPSHOT_FILE = None
+        snapshotfile.get_snapshot_file(self.path).close()
+        shutil.rmtree(self.tmp_dir)
+        cache.clear()
+    
+    def test_read_write(self):
+        writer = snapshotfile.SnapshotFile(self.path)
+        reader = snapshotfile.SnapshotFile(self.path)
+        self.assertEqual(reader.version(), None)
+        self.assertEqual(reader.read(1), None)
+        expires = time.time() + 60
+        writer.write(1, expires, {'A': (u'[1, 2]', 'list'), 'B': (u'\xe9t\xe9', 'unicode')})
+        self.assertEqual(reader.version(), 1)
+        rows = reader.read(1)
+        self.assertEqual(sorted(rows), ['A', 'B'])
+        self.assertEqual(rows['A'], (u'[1, 2]', 'list'))
+        self.assertEqual(rows['B'], (u'\xe9t\xe9', 'unicode'))
+        self.assertEqual(rows.get('C'), None)
+        self.assertEqual(rows.expires, expires)
+        #the index is read once per version
+        self.assertTrue(reader.read(1) is rows)
+        self.assertEqual(reader.read(2), None)
+        writer.write(2, expires, {'A': (u'3', 'int')})
+        self.assertEqual(reader.read(1), None)
+        self.assertEqual(reader.read(2)['A'], (u'3', 'int'))
+        #the rows of the previous version can still be used
+        self.assertEqual(rows['A'], (u'[1, 2]', 'list'))
+        #not a snapshot file
+        invalid_file = open(self.path, 'wb')
+        invalid_file.write('no snapshot'.encode('ascii') * 10)
+        invalid_file.close()
+        self.assertEqual(reader.version(), None)
+        self.assertEqual(reader.read(2), None)
+        reader.close()
+        writer.close()
+    
+    def test_settings_shared(self):
+        app_settings.DYNAMICSETTINGS_SNAPSHOT_FILE = self.path
+        worker1 = DynamicSettings()
+        worker1.set('TEST_SETTING1', 42, 'int')
+        self.assertEqual(snapshotfile.get_snapshot_file(self.path).version(), worker1.version())
+        #the settings are not fetched from the cache
+        cache.delete(worker1._settings_cache_key)
+        worker2 = DynamicSettings()
+        #the values are decoded from the file when they are used
+        self.assertEqual(worker2._snapshot.pending, set(['TEST_SETTING1']))
+        self.assertEqual(worker2.source('TEST_SETTING1'), 'db')
+        self.assertEqual(worker2.TEST_SETTING1, 42)
+        self.assertEqual(worker2._snapshot.pending, set())
+        self.assertEqual(worker2.stats()['counters']['file_hits'], 1)
+        self.assertFalse('rebuilds' in worker2.stats()['counters'])
+        worker1.reset('TEST_SETTING1')
+        worker2._next_version_check = 0
+        self.assertEqual(worker2.TEST_SETTING1, 73)
+        self.assertEqual(worker2.stats()['counters']['file_hits'], 2)
+    
+    def test_changes_keep_rows_of_file(self):
+        app_settings.DYNAMICSETTINGS_SNAPSHOT_FILE = self.path
+        worker1 = DynamicSettings()
+        worker1.set('TEST_SETTING1', 42, 'int')
+        cache.delete(worker1._settings_cache_key)
+        worker2 = DynamicSettings()
+        rows = worker2._snapshot.raw
+        self.assertTrue(isinstance(rows, snapshotfile.Rows))
+        #the rows of the file are not copied, only the changed rows are kept
+        worker2.set('TEST_SETTING1', 43, 'int')
+        raw = worker2._snapshot.raw
+        self.assertTrue(isinstance(raw, PatchedRows))
+        self.assertTrue(raw._rows is rows)
+        self.assertEqual(raw['TEST_SETTING1'], (u'43', 'int'))
+        self.assertEqual(worker2.TEST_SETTING1, 43)
+        worker2.reset('TEST_SETTING1')
+        raw = worker2._snapshot.raw
+        self.assertTrue(raw._rows is rows)
+        self.assertFalse('TEST_SETTING1' in raw)
+        self.assertEqual(list(raw), [])
+        self.assertEqual(worker2.TEST_SETTING1, 73)
+        #published as dict
+        self.assertEqual(cache.get(worker2._settings_cache_key)['raw'], {})
+    
+    def test_settings_shared_only_with_typed_codec(self):
+        app_settings.DYNAMICSETTINGS_SNAPSHOT_FILE = self.path
+        settings_codec = app_settings.DYNAMICSETTINGS_CODEC
+        app_settings.DYNAMICSETTINGS_CODEC = 'dynamicsettings.codec.PickleCodec'
+        try:
+            worker = DynamicSettings()
+            worker.set('TEST_SETTING1', 42, 'int')
+            self.assertEqual(snapshotfile.get_snapshot_file(self.path).version(), None)
+            self.assertFalse(os.path.exists(self.path))
+        finally:
+            app_settings.DYNAMICSETTINGS_CODEC = settings_codec
+
+
+class DynamicSettingsFrozenTestCase(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        app_settings.DYNAMICSETTINGS_INCLUDE_MODULES = ['dynamicsettings.tests.test_settings']
+        app_settings.DYNAMICSETTINGS_INCLUDE_SETTINGS = ['TEST_SETTING3', 'TEST_SETTING4']
+    
+    def tearDown(self):
+        cache.clear()
+    
+    def test_freeze(self):
+        value = freeze({'list': [1, {'a': [2]}], 'tuple': ([3],)})
+        self.assertTrue(isinstance(value, FrozenDict))
+        self.assertTrue(isinstance(value['list'], FrozenList))
+        self.assertTrue(isinstance(value['list'][1], FrozenDict))
+        self.assertTrue(isinstance(value['tuple'][0], FrozenList))
+        self.assertEqual(value, {'list': [1, {'a': [2]}], 'tuple': ([3],)})
+        self.assertEqual(type_name(value), 'dict')
+        self.assertEqual(type_name(value['list']), 'list')
+        self.assertRaises(TypeError, value.__setitem__, 'key', 1)
+        self.assertRaises(TypeError, value.update, {'key': 1})
+        self.assertRaises(TypeError, value['list'].append, 1)
+        self.assertRaises(TypeError, value['list'].__setitem__, 0, 1)
+        self.assertRaises(TypeError, value['list'][1]['a'].extend, [1])
+        #pickled and unpickled (as done by the cache)
+        unpickled_value = pickle.loads(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(unpickled_value, value)
+        self.assertTrue(isinstance(unpickled_value['list'], FrozenList))
+    
+    def test_settings_frozen(self):
+        worker = DynamicSettings()
+        all_settings = worker.dict()
+        self.assertTrue(all_settings is worker.dict())
+        self.assertRaises(TypeError, all_settings.__setitem__, 'TEST_SETTING3', [])
+        self.assertRaises(TypeError, worker.TEST_SETTING3.append, 4)
+        self.assertRaises(TypeError, worker.TEST_SETTING4.__setitem__, 'key', 'other value')
+        value = [4, 5]
+        worker.set('TEST_SETTING3', value)
+        value.append(6)
+        self.assertEqual(worker.TEST_SETTING3, [4, 5])
+        self.assertRaises(TypeError, worker.TEST_SETTING3.append, 6)
+        #the settings returned before are not changed
+        self.assertEqual(all_settings['TEST_SETTING3'], [1, 2, 3])
+        self.assertEqual(models.Settings.objects.get(key='TEST_SETTING3').type, 'list')
+        cache.clear()
+        self.assertRaises(TypeError, DynamicSettings().TEST_SETTING3.append, 6)
+        worker.reset('TEST_SETTING3')
+
+
+class DynamicSettingsThreadingTestCase(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        app_settings.DYNAMICSETTINGS_INCLUDE_MODULES = ['dynamicsettings.tests.test_settings']
+        app_settings.DYNAMICSETTINGS_INCLUDE_SETTINGS = ['TEST_SETTING1', 'TEST_SETTING2']
+        self.check_interval = app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL
+        app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL = 60
+    
+    def tearDown(self):
+        app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL = self.check_interval
+        cache.clear()
+    
+    def test_consistent_reads_while_writing(self):
+        worker = DynamicSettings()
+        consistent = set([(73, 'a string'), (42, 'changed')])
+        stopped = threading.Event()
+        errors = []
+        reads = []
+        def read():
+            count = 0
+            try:
+                while not stopped.is_set():
+                    all_settings = worker.dict()
+                    if (all_settings['TEST_SETTING1'], all_settings['TEST_SETTING2']) not in consistent:
+                        errors.append(dict(all_settings))
+                    some_settings = worker.dict(['TEST_SETTING1', 'TEST_SETTING2'])
+                    if (some_settings['TEST_SETTING1'], some_settings['TEST_SETTING2']) not in consistent:
+                        errors.append(some_settings)
+                    worker.TEST_SETTING1
+                    worker.get('TEST_SETTING2')
+                    count += 4
+            except Exception as e:
+                errors.append(e)
+            reads.append(count)
+        threads = [threading.Thread(target=read) for i in range(4)]
+        started = time.time()
+        for thread in threads:
+            thread.start()
+        try:
+            for i in range(20):
+                worker.set_many({'TEST_SETTING1': 42, 'TEST_SETTING2': 'changed'})
+                worker.reset_many(['TEST_SETTING1', 'TEST_SETTING2'])
+        finally:
+            stopped.set()
+            for thread in threads:
+                thread.join()
+        throughput = sum(reads) / (time.time() - started)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(reads), 4)
+        self.assertTrue(throughput > 0)
+        self.assertEqual(worker.version(), 40)
+    
+    def test_readers_do_not_wait_for_writer(self):
+        worker = DynamicSettings()
+        values = []
+        def read():
+            values.append(worker.TEST_SETTING1)
+        #the version is due to be checked, but another thread is
+        #loading or changing the settings
+        worker._next_version_check = 0
+        worker._lock.acquire()
+        try:
+            thread = threading.Thread(target=read)
+            thread.start()
+            thread.join(2)
+            self.assertFalse(thread.is_alive())
+        finally:
+            worker._lock.release()
+        self.assertEqual(values, [73])
+    
+    def test_lazy_settings_created_once(self):
+        #the settings are cached, so the threads need no database
+        DynamicSettings()
+        created = []
+        class CountingDynamicSettings(DynamicSettings):
+            def __init__(self):
+                created.append(self)
+                time.sleep(0.05)
+                super(CountingDynamicSettings, self).__init__()
+        original_class = dynamicsettings.DynamicSettings
+        dynamicsettings.DynamicSettings = CountingDynamicSettings
+        try:
+            lazy_settings = dynamicsettings.LazyDynamicSettings()
+            values = []
+            def read():
+                values.append(lazy_settings.TEST_SETTING1)
+            threads = [threading.Thread(target=read) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            dynamicsettings.DynamicSettings = original_class
+        self.assertEqual(len(created), 1)
+        self.assertEqual(values, [73] * 8)
+    
+    def test_concurrent_rebuilds_coalesced(self):
+        combined = []
+        class SlowDynamicSettings(DynamicSettings):
+            def _get_db_version(self):
+                #the threads can not use the test database
+                return 0
+            def _combine_settings(self):
+                combined.append(self)
+                time.sleep(0.2)
+                return FrozenDict(), {'TEST_SETTING1': 'db'}, {'TEST_SETTING1': (u'73', 'int')}
+        workers = []
+        def create():
+            workers.append(SlowDynamicSettings())
+        threads = [threading.Thread(target=create) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(combined), 1)
+        #every instance decodes the settings into its own dict, so
+        #a dict returned by one instance is not changed by another one
+        all_settings = workers[0].dict()
+        self.assertEqual(all_settings, {'TEST_SETTING1': 73})
+        self.assertEqual(len(set(id(worker._snapshot.settings) for worker in workers)), 8)
+        self.assertEqual([worker.TEST_SETTING1 for worker in workers], [73] * 8)
+        self.assertTrue(workers[0].dict() is all_settings)
+        #a newer version than the running rebuild is not coalesced
+        worker = workers[0]
+        self.assertEqual(worker.version(), 0)
+        worker._get_settings(1)
+        self.assertEqual(len(combined), 2)
+
+
+class DynamicSettingsFlagTestCase(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        app_settings.DYNAMICSETTINGS_INCLUDE_MODULES = ['dynamicsettings.tests.test_settings']
+        app_settings.DYNAMICSETTINGS_INCLUDE_SETTINGS = ['TEST_FLAG']
+        self.user = User.objects.create_user('flaguser', 'flaguser@example.com', 'password')
+    
+    def tearDown(self):
+        cache.clear()
+    
+    def test_rules(self):
+        self.assertRaises(ValueError, flags.Flag, [])
+        self.assertRaises(ValueError, flags.Flag, {'unknown': True})
+        self.assertRaises(ValueError, flags.Flag, {'percentage': 101})
+        self.assertRaises(ValueError, flags.Flag, {'percentage': True})
+        self.assertRaises(ValueError, flags.Flag, {'users': 'flaguser'})
+        self.assertFalse(flags.Flag({}).is_enabled('FLAG', self.user))
+        self.assertTrue(flags.Flag({'enabled': True}).is_enabled('FLAG', self.user))
+        self.assertTrue(flags.Flag({'enabled': True}).is_enabled('FLAG'))
+        self.assertFalse(flags.Flag({'enabled': False, 'users': ['flaguser']}).is_enabled('FLAG', self.user))
+        self.assertTrue(flags.Flag({'enabled': True, 'users': ['flaguser']}).is_enabled('FLAG', self.user))
+        self.assertTrue(flags.Flag({'enabled': True, 'users': [self.user.pk]}).is_enabled('FLAG', self.user))
+        self.assertTrue(flags.Flag({'enabled': True, 'users': [7]}).is_enabled('FLAG', '7'))
+        self.assertFalse(flags.Flag({'enabled': True, 'users': ['other']}).is_enabled('FLAG', self.user))
+        self.assertFalse(flags.Flag({'enabled': True, 'users': ['other']}).is_enabled('FLAG'))
+        self.assertTrue(flags.Flag({'enabled': True, 'percentage': 100}).is_enabled('FLAG'))
+        self.assertFalse(flags.Flag({'enabled': True, 'percentage': 0}).is_enabled('FLAG', self.user))
+    
+    def test_percentage(self):
+        #the buckets are stable and spread evenly
+        self.assertEqual(flags.bucket('FLAG', u'1'), flags.bucket('FLAG', '1'))
+        self.assertEqual(flags.bucket('FLAG', u'1'), 68)
+        flag = flags.Flag({'enabled': True, 'percentage': 25})
+        enabled = [user_id for user_id in range(10000) if flag.is_enabled('FLAG', user_id)]
+        self.assertTrue(2300 < len(enabled) < 2700)
+        self.assertEqual(enabled, [user_id for user_id in range(10000) if flag.is_enabled('FLAG', user_id)])
+        #every flag has other users in its buckets
+        other_enabled = [user_id for user_id in range(10000) if flag.is_enabled('OTHER_FLAG', user_id)]
+        self.assertNotEqual(enabled, other_enabled)
+    
+    def test_groups(self):
+        group = Group.objects.create(name='beta')
+        flag = flags.Flag({'enabled': True, 'groups': ['beta']})
+        self.assertFalse(flag.is_enabled('FLAG', User.objects.get(pk=self.user.pk)))
+        self.user.groups.add(group)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertTrue(flag.is_enabled('FLAG', user))
+        #the groups are only queried once per user
+        self.assertEqual(user._dynamicsettings_groups, frozenset([u'beta']))
+        self.assertFalse(flag.is_enabled('FLAG', '7'))
+    
+    def test_is_enabled(self):
+        worker1 = DynamicSettings()
+        self.assertFalse(worker1.is_enabled('TEST_FLAG', self.user))
+        worker1.set('TEST_FLAG', {'enabled': True, 'users': ['flaguser']}, 'flag')
+        self.assertTrue(worker1.is_enabled('TEST_FLAG', self.user))
+        self.assertFalse(worker1.is_enabled('TEST_FLAG', '7'))
+        self.assertEqual(worker1.TEST_FLAG, flags.Flag({'enabled': True, 'users': ['flaguser']}))
+        self.assertEqual(type_name(worker1.TEST_FLAG), 'flag')
+        self.assertEqual(models.Settings.objects.get(key='TEST_FLAG').value, '{"enabled":true,"users":["flaguser"]}')
+        self.assertRaises(ValueError, worker1.set, 'TEST_FLAG', {'percentage': 200}, 'flag')
+        #other settings are used as boolean
+        self.assertTrue(worker1.is_enabled('TEST_SETTING1'))
+        self.assertFalse(worker1.is_enabled('TEST_SETTING5'))
+        #loaded from the cache and from the database
+        worker2 = DynamicSettings()
+        self.assertTrue(worker2.is_enabled('TEST_FLAG', self.user))
+        cache.clear()
+        worker3 = DynamicSettings()
+        self.assertTrue(worker3.is_enabled('TEST_FLAG', self.user))
+        worker1.for_scope('site-1').set('TEST_FLAG', {'enabled': False}, 'flag')
+        self.assertFalse(worker1.for_scope('site-1').is_enabled('TEST_FLAG', self.user))
+        self.assertTrue(worker1.is_enabled('TEST_FLAG', self.user))
+
+
+class DynamicSettingsHistoryTestCase(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        app_settings.DYNAMICSETTINGS_INCLUDE_MODULES = ['dynamicsettings.tests.test_settings']
+        app_settings.DYNAMICSETTINGS_INCLUDE_SETTINGS = ['TEST_SETTING1', 'TEST_SETTING2']
+        self.check_interval = app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL
+        app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL = 60
+        self.user = User.objects.create_user('staff', 'staff@example.com', 'staffpassword')
+        #the checkpoints of the previous tests were removed
+        history._checkpoint_saved = False
+    
+    def tearDown(self):
+        app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL = self.check_interval
+        app_settings.DYNAMICSETTINGS_HISTORY_CHECKPOINT_INTERVAL = 100
+        cache.clear()
+    
+    def test_history(self):
+        worker = DynamicSettings()
+        worker.set('TEST_SETTING1', 42, 'int', user=self.user)
+        worker.set_many({'TEST_SETTING1': 43, 'TEST_SETTING2': 'changed'})
+        worker.reset('TEST_SETTING1', user=self.user)
+        worker.for_scope('site-1').set('TEST_SETTING2', 'site')
+        changes = list(models.SettingsChange.objects.values_list('version', 'key', 'scope', 'old_value',
+                                                                 'new_value', 'new_type'))
+        self.assertEqual(changes, [
+            (1, 'TEST_SETTING1', '', None, '42', 'int'),
+            (2, 'TEST_SETTING1', '', '42', '43', 'int'),
+            (2, 'TEST_SETTING2', '', None, 'changed', 'str'),
+            (3, 'TEST_SETTING1', '', '43', None, None),
+            (4, 'TEST_SETTING2', 'site-1', None, 'site', 'str'),
+        ])
+        self.assertEqual(models.SettingsChange.objects.get(version=1).user, self.user)
+        self.assertEqual(models.SettingsChange.objects.get(version=4).user, None)
+        #the history starts with the settings before the first change
+        self.assertEqual(list(models.SettingsCheckpoint.objects.values_list('version', flat=True)), [0])
+        self.assertEqual(worker.as_of(0)['TEST_SETTING1'], 73)
+        self.assertEqual(worker.as_of(1)['TEST_SETTING1'], 42)
+        self.assertEqual(worker.as_of(2)['TEST_SETTING2'], 'changed')
+        self.assertEqual(worker.as_of(3)['TEST_SETTING1'], 73)
+        self.assertEqual(worker.as_of(4)['TEST_SETTING2'], 'changed')
+        self.assertEqual(worker.as_of(4, scope='site-1')['TEST_SETTING2'], 'site')
+        created = models.SettingsChange.objects.get(version=3).created
+        self.assertEqual(worker.as_of(when=created)['TEST_SETTING2'], 'changed')
+        self.assertEqual(worker.as_of(when=created - datetime.timedelta(days=1))['TEST_SETTING2'], 'a string')
+        self.assertRaises(ValueError, worker.as_of)
+    
+    def test_first_checkpoint_of_several_scopes(self):
+        #the first version changes the settings of two scopes
+        models.Settings.objects.create(key='TEST_SETTING1', scope='', value='42', type='int')
+        models.Settings.objects.create(key='TEST_SETTING2', scope='site-1', value='site', type='str')
+        history.record(1, {'': [('TEST_SETTING1', None, None, '42', 'int')],
+                           'site-1': [('TEST_SETTING2', None, None, 'site', 'str')]})
+        self.assertEqual(history.rows_as_of(0), (0, {}))
+        self.assertEqual(history.rows_as_of(1)[1], {('', 'TEST_SETTING1'): ('42', 'int'),
+                                                    ('site-1', 'TEST_SETTING2'): ('site', 'str')})
+        #the checkpoints are only looked up until one was found
+        history.record(2, {'': [('TEST_SETTING1', '42', 'int', '43', 'int')]})
+        self.assertNumQueries(0, history._has_checkpoint)
+    
+    def test_restore(self):
+        worker1 = DynamicSettings()
+        worker2 = DynamicSettings()
+        worker1.set('TEST_SETTING1', 42, 'int')
+        worker1.set('TEST_SETTING2', 'changed', 'str')
+        worker1.for_scope('site-1').set('TEST_SETTING2', 'site')
+        self.assertEqual(worker2.for_scope('site-1').TEST_SETTING2, 'site')
+        version = worker1.restore(1, user=self.user)
+        self.assertEqual(version, 4)
+        self.assertEqual(worker1.TEST_SETTING1, 42)
+        self.assertEqual(worker1.TEST_SETTING2, 'a string')
+        self.assertFalse(worker1.is_in_db('TEST_SETTING2'))
+        self.assertEqual(worker1.for_scope('site-1').TEST_SETTING2, 'a string')
+        #seen by other processes after the next version check
+        worker2._next_version_check = 0
+        self.assertEqual(worker2.TEST_SETTING2, 'a string')
+        self.assertEqual(worker2.for_scope('site-1').TEST_SETTING2, 'a string')
+        #the restore is part of the history
+        self.assertEqual(sorted(models.SettingsChange.objects.filter(version=4).values_list('key', 'scope', 'user')),
+                         [('TEST_SETTING2', '', self.user.pk), ('TEST_SETTING2', 'site-1', self.user.pk)])
+        self.assertEqual(worker1.restore(3), 5)
+        self.assertEqual(worker1.for_scope('site-1').TEST_SETTING2, 'site')
+        #nothing to restore
+        self.assertEqual(worker1.restore(5), 5)
+    
+    def test_checkpoints(self):
+        app_settings.DYNAMICSETTINGS_HISTORY_CHECKPOINT_INTERVAL = 2
+        worker = DynamicSettings()
+        for value in range(1, 6):
+            worker.set('TEST_SETTING1', value, 'int')
+        self.assertEqual(list(models.SettingsCheckpoint.objects.values_list('version', flat=True)), [0, 2, 4])
+        for version in range(1, 6):
+            self.assertEqual(worker.as_of(version)['TEST_SETTING1'], version)
+        #the closest checkpoint and the changes since then
+        self.assertNumQueries(2, lambda: history.rows_as_of(5))
+        #the latest change before the time as well
+        created = models.SettingsChange.objects.get(version=5).created
+        self.assertNumQueries(3, lambda: history.rows_as_of(when=created))
+        self.assertEqual(history.rows_as_of(when=created)[0], 5)
+
+
+class DynamicSettingsHistoryTransactionTestCase(TransactionTestCase):
+    
+    def setUp(self):
+        cache.clear()
+        app_settings.DYNAMICSETTINGS_INCLUDE_MODULES = ['dynamicsettings.tests.test_settings']
+        app_settings.DYNAMICSETTINGS_INCLUDE_SETTINGS = ['TEST_SETTING1', 'TEST_SETTING2']
+        self.record = history.record
+        history._checkpoint_saved = False
+    
+    def tearDown(self):
+        history.record = self.record
+        cache.clear()
+    
+    def test_changes_saved_with_history(self):
+        worker = DynamicSettings()
+        worker.set('TEST_SETTING1', 42, 'int')
+        def record(*args, **kwargs):
+            raise RuntimeError('history not saved')
+        history.record = record
+        #the rows, the version and the history are saved together
+        self.assertRaises(RuntimeError, worker.set, 'TEST_SETTING2', 'changed', 'str')
+        self.assertRaises(RuntimeError, worker.reset, 'TEST_SETTING1')
+        self.assertRaises(RuntimeError, worker.set_many, {'TEST_SETTING1': 43, 'TEST_SETTING2': 'changed'})
+        self.assertRaises(RuntimeError, worker.reset_many, ['TEST_SETTING1'])
+        self.assertRaises(RuntimeError, worker.restore, 0)
+        self.assertEqual(list(models.Settings.objects.values_list('key', 'value')), [('TEST_SETTING1', '42')])
+        self.assertEqual(models.Version.objects.get(pk=1).version, 1)
+        self.assertEqual(worker.TEST_SETTING1, 42)
+        self.assertEqual(worker.TEST_SETTING2, 'a string')
 
 
+class DynamicSettingsExportTestCase(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        app_settings.DYNAMICSETTINGS_INCLUDE_MODULES = ['dynamicsettings.tests.test_settings']
+        app_settings.DYNAMICSETTINGS_INCLUDE_SETTINGS = ['TEST_SETTING1', 'TEST_SETTING3', 'TEST_FLAG']
+        self.check_interval = app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL
+        app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL = 60
+        self.tmp_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        app_settings.DYNAMICSETTINGS_VERSION_CHECK_INTERVAL = self.check_interval
+        shutil.rmtree(self.tmp_dir)
+        cache.clear()
+    
+    def test_dump(self):
+        worker = DynamicSettings()
+        worker.set_many({'TEST_SETTING1': 42, 'TEST_SETTING3': (4, 5)})
+        worker.set('TEST_FLAG', {'enabled': True, 'percentage': 10}, 'flag')
+        worker.for_scope('site-1').set('TEST_SETTING1', 43)
+        output = StringIO()
+        call_command('dumpdynamicsettings', stdout=output)
+        self.assertEqual(output.getvalue().splitlines(), [
+            '{"key":"TEST_FLAG","scope":"","type":"flag","value":{"enabled":true,"percentage":10}}',
+            '{"key":"TEST_SETTING1","scope":"","type":"int","value":42}',
+            '{"key":"TEST_SETTING3","scope":"","type":"tuple","value":[4,5]}',
+            '{"key":"TEST_SETTING1","scope":"site-1","type":"int","value":43}',
+        ])
+        output = StringIO()
+        call_command('dumpdynamicsettings', format='json', scope='site-1', stdout=output)
+        self.assertEqual(simplejson.loads(output.getvalue()),
+                         [{'key': 'TEST_SETTING1', 'scope': 'site-1', 'type': 'int', 'value': 43}])
+    
+    def test_load(self):
+        worker = DynamicSettings()
+        worker.set('TEST_SETTING1', 42, 'int')
+        path = os.path.join(self.tmp_dir, 'settings.json')
+        call_command('dumpdynamicsettings', path, stdout=StringIO(), stderr=StringIO())
+        export_file = open(path, 'a')
+        export_file.write('{"key":"TEST_SETTING3","type":"list","value":[4,5]}\n')
+        export_file.write('{"key":"TEST_SETTING1","scope":"site-1","type":"int","value":43}\n')
+        export_file.close()
+        worker.set('TEST_SETTING1', 44, 'int')
+        #nothing is saved
+        output = StringIO()
+        call_command('loaddynamicsettings', path, dry_run=True, stdout=output)
+        self.assertEqual(output.getvalue().splitlines(), [
+            '~ TEST_SETTING1: 44 (int) -> 42 (int)',
+            '+ TEST_SETTING3: [4,5] (list)',
+            '+ TEST_SETTING1 (scope site-1): 43 (int)',
+            '3 settings would be changed.',
+        ])
+        self.assertEqual(models.Settings.objects.count(), 1)
+        version = worker.version()
+        call_command('loaddynamicsettings', path, batch_size=2, stdout=StringIO())
+        worker._next_version_check = 0
+        #the version is only increased once
+        self.assertEqual(worker.version(), version + 1)
+        self.assertEqual(worker.TEST_SETTING1, 42)
+        self.assertEqual(worker.TEST_SETTING3, [4, 5])
+        self.assertEqual(worker.for_scope('site-1').TEST_SETTING1, 43)
+        self.assertEqual(models.SettingsChange.objects.filter(version=version + 1).count(), 3)
+        #loaded again, nothing changed
+        output = StringIO()
+        call_command('loaddynamicsettings', path, stdout=output)
+        self.assertEqual(output.getvalue(), 'Changed 0 settings.\n')
+        self.assertEqual(worker.version(), version + 1)
+    
+    def test_load_invalid(self):
+        path = os.path.join(self.tmp_dir, 'settings.json')
+        export_file = open(path, 'w')
+        export_file.write('{"key":"TEST_SETTING1","type":"int","value":42}\n{"key":"TEST_SETTING3"}\n')
+        export_file.close()
+        #call_command exits on errors of commands
+        self.assertRaises(SystemExit, call_command, 'loaddynamicsettings', path,
+                          stdout=StringIO(), stderr=StringIO())
+        #nothing is saved
+        self.assertEqual(models.Settings.objects.count(), 0)
+    
+    def test_load_checked(self):
+        worker = DynamicSettings()
+        #TEST_SETTING2 is not in DYNAMICSETTINGS_INCLUDE_SETTINGS
+        self.assertRaises(KeyError, worker.load, [('', 'TEST_SETTING1', 42, 'int'),
+                                                  ('', 'TEST_SETTING2', 'changed', 'str')])
+        #the type of a setting can not be changed
+        self.assertRaises(ValueError, worker.load, [('', 'TEST_SETTING1', 42, 'int'),
+                                                    ('site-1', 'TEST_SETTING3', (4, 5), 'tuple')])
+        self.assertEqual(models.Settings.objects.count(), 0)
+        path = os.path.join(self.tmp_dir, 'settings.json')
+        export_file = open(path, 'w')
+        export_file.write('{"key":"TEST_SETTING2","type":"str","value":"changed"}\n')
+        export_file.close()
+        stderr = StringIO()
+        self.assertRaises(SystemExit, call_command, 'loaddynamicsettings', path,
+                          stdout=StringIO(), stderr=stderr)
+        self.assertTrue('TEST_SETTING2' in stderr.getvalue())
+        self.assertEqual(models.Settings.objects.count(), 0)
+    
+    def test_load_restored(self):
+        history._checkpoint_saved = False
+        worker = DynamicSettings()
+        #the first change in the history changes the settings of two scopes
+        worker.load([('', 'TEST_SETTING1', 42, 'int'), ('site-1', 'TEST_SETTING1', 43, 'int'),
+                     ('site-2', 'TEST_SETTING3', [4, 5], 'list')], batch_size=2)
+        version = worker.version()
+        self.assertEqual(worker.restore(version - 1), version + 1)
+        self.assertEqual(models.Settings.objects.count(), 0)
+        self.assertEqual(worker.TEST_SETTING1, 73)
+        self.assertEqual(worker.for_scope('site-1').TEST_SETTING1, 73)
+        self.assertEqual(worker.for_scope('site-2').TEST_SETTING3, [1, 2, 3])
+        self.assertEqual(worker.as_of(version - 1, scope='site-1')['TEST_SETTING1'], 73)
+        self.assertEqual(worker.as_of(version, scope='site-1')['TEST_SETTING1'], 43)
+
+
+class DynamicSettingsSchemaTestCase(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        app_settings.DYNAMICSETTINGS_INCLUDE_MODULES = ['dynamicsettings.tests.test_settings']
+        app_settings.DYNAMICSETTINGS_INCLUDE_SETTINGS = ['TEST_SETTING1', 'TEST_SETTING2', 'TEST_SETTING3']
+        app_settings.DYNAMICSETTINGS_SCHEMAS = {
+            'TEST_SETTING1': {'type': 'int', 'min': 0, 'max': 100},
+            'TEST_SETTING3': {'type': 'list', 'schema': {'items': {'type': 'integer', 'minimum': 0}, 'maxItems': 3}},
+        }
+    
+    def tearDown(self):
+        app_settings.DYNAMICSETTINGS_SCHEMAS = {}
+        schemas._registry.clear()
+        cache.clear()
+    
+    def test_parse(self):
+        self.assertEqual(schemas.parse('1.5', 'float'), 1.5)
+        self.assertEqual(schemas.parse('42', 'int'), 42)
+        self.assertTrue(schemas.parse('True', 'bool') is True)
+        self.assertTrue(schemas.parse('False', 'bool') is False)
+        self.assertEqual(schemas.parse('[1, 2]', 'tuple'), (1, 2))
+        self.assertEqual(schemas.parse('{"a": 1}', 'dict'), {'a': 1})
+        self.assertRaises(ValueError, schemas.parse, 'yes', 'bool')
+        self.assertRaises(ValueError, schemas.parse, '1.5a', 'float')
+        self.assertRaises(ValueError, schemas.parse, '{"a": 1}', 'list')
+        self.assertRaises(ValueError, schemas.parse, '[1]', 'dict')
+    
+    def test_schema(self):
+        self.assertRaises(ValueError, schemas.Schema, {'unknown': 1})
+        self.assertRaises(ValueError, schemas.Schema, {'type': 'unknown'})
+        self.assertRaises(ValueError, schemas.Schema, {'schema': {'oneOf': []}})
+        schema = schemas.Schema({'type': 'int', 'min': 0, 'max': 10})
+        self.assertEqual(schema.validate(10), 10)
+        self.assertRaises(ValueError, schema.validate, 11)
+        self.assertRaises(ValueError, schema.validate, True)
+        self.assertRaises(ValueError, schema.validate, '5')
+        schema = schemas.Schema({'choices': ['light', 'dark']})
+        schema.validate('dark')
+        self.assertRaises(ValueError, schema.validate, 'blue')
+        schema = schemas.Schema({'type': 'dict', 'schema': {
+            'required': ['host'],
+            'properties': {'host': {'type': 'string', 'pattern': '^[a-z.]+$'},
+                           'port': {'type': 'integer', 'maximum': 65535}},
+            'additionalProperties': False,
+        }})
+        schema.validate({'host': 'example.com', 'port': 80})
+        self.assertRaises(ValueError, schema.validate, {'port': 80})
+        self.assertRaises(ValueError, schema.validate, {'host': 'Example.com'})
+        self.assertRaises(ValueError, schema.validate, {'host': 'example.com', 'port': 70000})
+        self.assertRaises(ValueError, schema.validate, {'host': 'example.com', 'user': 'x'})
+        #compiled once
+        self.assertTrue(schemas.get_schema('TEST_SETTING1') is schemas.get_schema('TEST_SETTING1'))
+        self.assertEqual(schemas.get_schema('TEST_SETTING2'), None)
+        schemas.register('TEST_SETTING2', {'type': 'str', 'choices': ['a string', 'other']})
+        self.assertEqual(schemas.get_schema('TEST_SETTING2').type, 'str')
+    
+    def test_set_validated(self):
+        worker = DynamicSettings()
+        self.assertRaises(ValueError, worker.set, 'TEST_SETTING1', 101)
+        self.assertRaises(ValueError, worker.set_many, {'TEST_SETTING1': 42, 'TEST_SETTING3': [1, -2]})
+        self.assertEqual(models.Settings.objects.count(), 0)
+        worker.set('TEST_SETTING3', [1, 2])
+        self.assertEqual(worker.TEST_SETTING3, [1, 2])
+        worker.reset('TEST_SETTING3')
+    
+    def test_form(self):
+        form = forms.SettingsForm({'key': 'TEST_SETTING1', 'value': '101', 'type': 'int'})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['__all__'], ['The setting must be at most 100.'])
+        form = forms.SettingsForm({'key': 'TEST_SETTING1', 'value': '42', 'type': 'int'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['value'], 42)
+    
+    def test_convert(self):
+        self.assertEqual(schemas.convert(42, 'int'), 42)
+        self.assertTrue(isinstance(schemas.convert(42, 'float'), float))
+        self.assertEqual(schemas.convert([1, 2], 'tuple'), (1, 2))
+        self.assertEqual(schemas.convert((1, 2), 'list'), [1, 2])
+        self.assertEqual(schemas.convert('42', 'int'), 42)
+        self.assertEqual(schemas.convert(u'\xe9', 'str'), '\xc3\xa9')
+        self.assertEqual(schemas.convert('\xc3\xa9', 'unicode'), u'\xe9')
+        self.assertRaises(ValueError, schemas.convert, '\xff', 'unicode')
+        #only conversions which lose nothing
+        self.assertRaises(ValueError, schemas.convert, 1.5, 'int')
+        self.assertRaises(ValueError, schemas.convert, [1, 2], 'str')
+        self.assertRaises(ValueError, schemas.convert, {'a': 1}, 'list')
+        self.assertRaises(ValueError, schemas.convert, 1, 'bool')
+        self.assertRaises(ValueError, schemas.convert, True, 'int')
+    
+    def test_typed_accessors(self):
+        worker = DynamicSettings()
+        self.assertEqual(worker.get_int('TEST_SETTING1'), 73)
+        self.assertEqual(worker.get_float('TEST_SETTING1'), 73.0)
+        self.assertTrue(isinstance(worker.get_float('TEST_SETTING1'), float))
+        self.assertEqual(worker.get_str('TEST_SETTING2'), 'a string')
+        self.assertEqual(worker.get_list('TEST_SETTING3'), [1, 2, 3])
+        self.assertEqual(worker.get_int('MISSING_SETTING', 5), 5)
+        self.assertRaises(ValueError, worker.get_int, 'TEST_SETTING2')
+        self.assertRaises(ValueError, worker.get_dict, 'TEST_SETTING3')
+        self.assertRaises(ValueError, worker.get_str, 'TEST_SETTING3')
+        #every value is only converted once per version
+        conversions = worker.stats()['counters']['conversions']
+        self.assertEqual(worker.get_float('TEST_SETTING1'), 73.0)
+        self.assertEqual(worker.stats()['counters']['conversions'], conversions)
+        worker.set('TEST_SETTING1', 42)
+        self.assertEqual(worker.get_float('TEST_SETTING1'), 42.0)
+        self.assertEqual(worker.stats()['counters']['conversions'], conversions + 1)
+        #the settings of a scope
+        site_settings = worker.for_scope('site-1')
+        site_settings.set('TEST_SETTING1', 43)
+        self.assertEqual(site_settings.get_float('TEST_SETTING1'), 43.0)
+        self.assertEqual(worker.get_float('TEST_SETTING1'), 42.0)
+        self.assertEqual(site_settings.get_str('TEST_SETTING2'), 'a string')
+        site_settings.reset('TEST_SETTING1')
+        worker.reset('TEST_SETTING1')
+        #a number saved as string (before the schema was added) is
+        #converted before it is checked
+        schema_definitions = app_settings.DYNAMICSETTINGS_SCHEMAS
+        app_settings.DYNAMICSETTINGS_SCHEMAS = {}
+        worker.set('TEST_SETTING1', '5', 'str')
+        app_settings.DYNAMICSETTINGS_SCHEMAS = schema_definitions
+        self.assertEqual(worker.get_int('TEST_SETTING1'), 5)
+        self.assertEqual(worker.get_float('TEST_SETTING1'), 5.0)
+        app_settings.DYNAMICSETTINGS_SCHEMAS = {}
+        worker.set('TEST_SETTING1', '500', 'str')
+        app_settings.DYNAMICSETTINGS_SCHEMAS = schema_definitions
+        self.assertRaises(ValueError, worker.get_int, 'TEST_SETTING1')
+        worker.reset('TEST_SETTING1')
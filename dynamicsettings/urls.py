@@ -7,5 +7,7 @@ from dynamicsettings import views
 urlpatterns = patterns('',
     url(r'^$', views.dynamicsettings_index, name='dynamicsettings_index'),
     url(r'^set/$', views.dynamicsettings_set, name='dynamicsettings_set'),
+    url(r'^set_many/$', views.dynamicsettings_set_many, name='dynamicsettings_set_many'),
     url(r'^reset/$', views.dynamicsettings_reset, name='dynamicsettings_reset'),   
+    url(r'^stats/$', views.dynamicsettings_stats, name='dynamicsettings_stats'),
 )
\ No newline at end of file
@@ -7,36 +7,65 @@ from django import http
 from django.core.context_processors import csrf as csrf_processor
 from django import template
 from django.contrib.admin.views.decorators import staff_member_required
+from django.core.paginator import Paginator, InvalidPage
 from django.utils.translation import ugettext as _
 
+from dynamicsettings import app_settings
 from dynamicsettings import models
 from dynamicsettings import forms
 from dynamicsettings import settings
+from dynamicsettings.datastructures import NAMESPACE_SEPARATOR, type_name
+from dynamicsettings.flags import Flag
 
 @staff_member_required
 def dynamicsettings_index(request):
     """Renders a template in the admin to show a list of settings. 
+    The settings are paginated (``DYNAMICSETTINGS_INDEX_PAGE_SIZE`` settings
+    per page) and can be filtered by their namespace and their name.
     
     Params:
-        - ``request``: a django http request object
+        - ``request``: a django http request object, with the optional
+          GET variables ``ns`` (only show settings of the namespace ``ns``),
+          ``q`` (only show settings containing ``q`` in their name) and
+          ``page`` (the number of the page to show)
         
     Returns:
         - a rendered template with the following variables
           defined in its response dict
-              - ``dynamic_settings``: a list of settings represented
-              as dict's with:
+              - ``dynamic_settings``: a list of settings of the current page
+              represented as dict's with:
                   -  ``key`` - the name of the setting
                   - ``value`` - the value of the setting
                   - ``is_db`` - a boolean indicating if the setting is saved in the db or not
                   - ``type`` - the (Python) type of the setting as its string representation
                   - ``can_change`` - a boolean indicating if the setting can be saved in the database or not
+            - ``page``: the current page (``django.core.paginator.Page``)
+            - ``query``: the string the settings are filtered by
+            - ``namespace``: the namespace the settings are filtered by
+            - ``namespaces``: a sorted list of all namespaces
             - ``settings_form_rendered``: rendered html of ``forms.SettingsForm``
     """
-    keys = [key for key in settings.dict()]
-    keys.sort()
+    query = request.GET.get('q', '').strip()
+    namespace = request.GET.get('ns', '').strip().upper()
+    #only the names of the settings (of the namespace) are looked at, the
+    #values are only decoded for the settings of the current page
+    if namespace:
+        namespace_keys = settings.keys(namespace + NAMESPACE_SEPARATOR)
+    else:
+        namespace_keys = settings.keys()
+    keys = [key for key in namespace_keys if query.upper() in key.upper()]
+    #settings which can be changed first, then ordered by name
+    keys.sort(key=lambda key: (not settings.can_change(key), key))
+    paginator = Paginator(keys, app_settings.DYNAMICSETTINGS_INDEX_PAGE_SIZE)
+    try:
+        page = paginator.page(request.GET.get('page', 1))
+    except InvalidPage:
+        page = paginator.page(paginator.num_pages)
     res = []
-    for key in keys:  
+    for key in page.object_list:
         value = settings.get(key)
+        value_type = type_name(value)
+        value = _flag_rules(value)
         if isinstance(value, (list, tuple, dict)):
             try:
                 value = simplejson.dumps(value, indent=4)
@@ -46,15 +75,18 @@ def dynamicsettings_index(request):
             'key': key,
             'value': value,
             'in_db': settings.is_in_db(key),
-            'type': type(settings.get(key)).__name__,
+            'type': value_type,
             'can_change': settings.can_change(key),
         })
-    res.sort(key=lambda e: e['can_change'], reverse=True)
     form_dict =  {'settings_form': forms.SettingsForm()}
     form_dict.update(csrf_processor(request))
     settings_form_rendered = template.loader.render_to_string('dynamicsettings/settings_form.html', form_dict)
     content_dict = {
         'dynamic_settings': res,
+        'page': page,
+        'query': query,
+        'namespace': namespace,
+        'namespaces': settings.namespaces(),
         'settings_form_rendered': settings_form_rendered,
     }
     return shortcuts.render_to_response('dynamicsettings/settings.html', content_dict,
@@ -87,9 +119,9 @@ def dynamicsettings_set(request):
         settings_form = forms.SettingsForm(request.POST)
         if settings_form.is_valid():
             form_data = settings_form.cleaned_data
-            changed = settings.set(form_data['key'], form_data['value'], form_data['type'])
+            changed = settings.set(form_data['key'], form_data['value'], form_data['type'], user=request.user)
             if changed is True:
-                value = settings.__getattr__(form_data['key'])
+                value = _flag_rules(settings.__getattr__(form_data['key']))
                 if isinstance(value, (list, tuple, dict)):
                     value = simplejson.dumps(value, indent=4)
                 response_dict.update({
@@ -109,6 +141,69 @@ def dynamicsettings_set(request):
         return http.HttpResponse(simplejson.dumps(response_dict, indent=4), mimetype="text/plain")
     return http.HttpResponseNotAllowed(['GET', 'PUT', 'DELETE', 'HEAD', 'TRACE', 'OPTIONS', 'CONNECT', 'PATCH'])
 
+@staff_member_required
+def dynamicsettings_set_many(request):
+    """A view to handle the POST request to 
+    set several settings in the database at once
+    
+    Params:
+        - ``request``: a django http request object with the
+          variable ``settings`` in its POST data, a JSON list of
+          objects with the fields ``key``, ``value`` and ``type``
+          (the same fields as in ``forms.SettingsForm``)
+        
+    Returns:
+        - a response as JSON including the following fields:
+            - ``status``: "success" if all settings were saved in
+               the database, "error" in other cases (in this case none
+               of the settings is saved)
+            - on success:
+                - ``settings``: a dict with the name of the setting as
+                  key and a dict with its new ``value`` and ``type`` 
+            - on error:
+                - ``message``: the message describing the error
+                - ``errors``: a dict with the name of the setting as
+                  key and a dict of the form errors of the setting
+    """
+    if request.method=='POST':
+        try:
+            submitted_settings = simplejson.loads(request.POST.get('settings', ''))
+            if not isinstance(submitted_settings, list)\
+            or not all(isinstance(setting_data, dict) for setting_data in submitted_settings):
+                raise ValueError
+        except ValueError:
+            response_dict = {
+                'status': 'error',
+                'message': _('The variable "settings" in POST request must be a JSON list of objects.'),
+            }
+            return http.HttpResponse(simplejson.dumps(response_dict, indent=4), mimetype="text/plain")
+        mapping = {}
+        value_types = {}
+        errors = {}
+        for setting_data in submitted_settings:
+            settings_form = forms.SettingsForm(setting_data)
+            if settings_form.is_valid():
+                form_data = settings_form.cleaned_data
+                mapping[form_data['key']] = form_data['value']
+                value_types[form_data['key']] = form_data['type']
+            else:
+                key = unicode(setting_data.get('key'))
+                errors[key] = dict((field, list(field_errors)) for field, field_errors in settings_form.errors.items())
+        if errors:
+            response_dict = {
+                'status': 'error',
+                'message': _('Some of the settings are not valid, none of the settings was saved.'),
+                'errors': errors,
+            }
+        else:
+            settings.set_many(mapping, value_types, user=request.user)
+            response_dict = {
+                'status': 'success',
+                'settings': dict((key, {'value': _flag_rules(settings.get(key)), 'type': value_types[key]}) for key in mapping),
+            }
+        return http.HttpResponse(simplejson.dumps(response_dict, indent=4), mimetype="text/plain")
+    return http.HttpResponseNotAllowed(['GET', 'PUT', 'DELETE', 'HEAD', 'TRACE', 'OPTIONS', 'CONNECT', 'PATCH'])
+
 @staff_member_required
 def dynamicsettings_reset(request):
     """A view to handle the POST request to 
@@ -136,15 +231,15 @@ def dynamicsettings_reset(request):
                 'message': _('No variable "key" in POST request.'),
             }
         else:
-            reset_success = settings.reset(key)
+            reset_success = settings.reset(key, user=request.user)
             if reset_success is True:
-                value = settings.__getattr__(key)
+                value = _flag_rules(settings.__getattr__(key))
                 if isinstance(value, (list, tuple, dict)):
                     value = simplejson.dumps(value, indent=4)
                 response_dict = {
                     'status': 'success',
                     'value': value,
-                    'type': type(settings.get(key)).__name__,
+                    'type': type_name(settings.get(key)),
                 }
             else:
                 response_dict = {
@@ -153,3 +248,25 @@ def dynamicsettings_reset(request):
                 }
         return http.HttpResponse(simplejson.dumps(response_dict, indent=4), mimetype="text/plain")
     return http.HttpResponseNotAllowed(['GET', 'PUT', 'DELETE', 'HEAD', 'TRACE', 'OPTIONS', 'CONNECT', 'PATCH'])
+
+@staff_member_required
+def dynamicsettings_stats(request):
+    """A view returning the statistics of the settings of this
+    process (see ``DynamicSettings.stats``) as JSON.
+    
+    Params:
+        - ``request``: a django http request object
+        
+    Returns:
+        - a response as JSON including the fields ``version``,
+          ``counters`` and ``timings``
+    """
+    if request.method=='GET':
+        return http.HttpResponse(simplejson.dumps(settings.stats(), indent=4), mimetype="text/plain")
+    return http.HttpResponseNotAllowed(['GET'])
+
+def _flag_rules(value):
+    #flags are shown (and serialized) as their rules
+    if isinstance(value, Flag):
+        return value.rules
+    return value